@@ -0,0 +1,266 @@
+# analytics.py
+# Sales and payment rollups for the admin reports:
+#
+#   sales_daily            orders placed and revenue per day
+#   product_sales          units sold and revenue per product
+#   payment_method_totals  payment count and amount per method and status
+#
+# refresh() folds the orders and payments written since its last run into the
+# rollups with INSERT ... SELECT ... ON DUPLICATE KEY UPDATE, in batches keyed
+# on the last processed order_id / payment_id (analytics_watermarks). A run
+# costs only the new rows, and the report functions read a handful of rollup
+# rows however long the order history is.
+#
+# In the app a background thread refreshes every ANALYTICS_REFRESH_INTERVAL
+# seconds (0 turns it off); it can also run from cron:
+#
+#   python analytics.py refresh
+#   python analytics.py rebuild     # recompute every rollup from scratch
+#
+# Rows are rolled up as first written: a later update_payment_status or
+# update_order_status is not re-applied until the next rebuild.
+import os
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from db import get_db, get_pool
+from metrics import timed
+
+ANALYTICS_REFRESH_INTERVAL = float(os.getenv('ANALYTICS_REFRESH_INTERVAL', 60))
+ANALYTICS_BATCH_SIZE = int(os.getenv('ANALYTICS_BATCH_SIZE', 5000))
+# Rows younger than this are left for the next run. Ids are assigned at insert
+# but become visible at commit, so a slow transaction can commit a lower id
+# after a higher one; waiting keeps it from landing behind the watermark.
+ANALYTICS_SETTLE_SECONDS = int(os.getenv('ANALYTICS_SETTLE_SECONDS', 60))
+MAX_REPORT_DAYS = 366
+MAX_BEST_SELLERS = 100
+
+SALES_DAILY_ROLLUP = """
+    INSERT INTO sales_daily (day, order_count, revenue)
+    SELECT DATE(order_date), COUNT(*), SUM(total_amount) FROM orders
+    WHERE order_id > %s AND order_id <= %s
+    GROUP BY DATE(order_date)
+    ON DUPLICATE KEY UPDATE order_count = order_count + VALUES(order_count), revenue = revenue + VALUES(revenue)
+"""
+
+PRODUCT_SALES_ROLLUP = """
+    INSERT INTO product_sales (product_id, units, revenue)
+    SELECT product_id, SUM(quantity), SUM(quantity * price) FROM order_items
+    WHERE order_id > %s AND order_id <= %s
+    GROUP BY product_id
+    ON DUPLICATE KEY UPDATE units = units + VALUES(units), revenue = revenue + VALUES(revenue)
+"""
+
+PAYMENT_TOTALS_ROLLUP = """
+    INSERT INTO payment_method_totals (payment_method, status, payment_count, amount_total)
+    SELECT COALESCE(payment_method, 'unknown'), status, COUNT(*), SUM(amount) FROM payments
+    WHERE payment_id > %s AND payment_id <= %s
+    GROUP BY COALESCE(payment_method, 'unknown'), status
+    ON DUPLICATE KEY UPDATE payment_count = payment_count + VALUES(payment_count),
+                            amount_total = amount_total + VALUES(amount_total)
+"""
+
+SELECT_DAILY_REVENUE = """
+    SELECT day, order_count, revenue FROM sales_daily
+    WHERE day >= %s
+    ORDER BY day
+"""
+
+SELECT_BEST_SELLERS = """
+    SELECT s.product_id, p.name, s.units, s.revenue
+    FROM product_sales s
+    LEFT JOIN products p ON s.product_id = p.product_id
+    ORDER BY s.units DESC, s.product_id DESC
+    LIMIT %s
+"""
+
+SELECT_PAYMENT_METHOD_TOTALS = """
+    SELECT payment_method, status, payment_count, amount_total FROM payment_method_totals
+    ORDER BY payment_method, status
+"""
+
+# watermark source -> (table, id column, timestamp column, rollup statements)
+SOURCES = {
+    'orders': ('orders', 'order_id', 'order_date', (SALES_DAILY_ROLLUP, PRODUCT_SALES_ROLLUP)),
+    'payments': ('payments', 'payment_id', 'payment_date', (PAYMENT_TOTALS_ROLLUP,)),
+}
+
+def _next_batch(cursor, source, last_id, cutoff, batch_size):
+    """(row count, highest id) of the next batch of settled rows after last_id."""
+    table, key, stamp, _ = SOURCES[source]
+    cursor.execute(f"""
+        SELECT COUNT(*), MAX({key}) FROM (
+            SELECT {key} FROM {table} WHERE {key} > %s AND {stamp} < %s ORDER BY {key} LIMIT %s
+        ) batch
+    """, (last_id, cutoff, batch_size))
+    return cursor.fetchall()[0]
+
+def _fold_batch(db, source, cutoff, batch_size):
+    """Roll up one batch of source in one transaction; returns the rows folded in."""
+    cursor = db.cursor()
+    try:
+        cursor.execute("SELECT last_id FROM analytics_watermarks WHERE source = %s", (source,))
+        last_id = cursor.fetchall()[0][0]
+        count, upto = _next_batch(cursor, source, last_id, cutoff, batch_size)
+        if not count:
+            return 0
+        # Compare-and-set before touching the rollups: it takes the write lock,
+        # and if another worker already moved the watermark this batch is theirs.
+        cursor.execute("UPDATE analytics_watermarks SET last_id = %s WHERE source = %s AND last_id = %s",
+                       (upto, source, last_id))
+        if cursor.rowcount != 1:
+            db.rollback()
+            return 0
+        for statement in SOURCES[source][3]:
+            cursor.execute(statement, (last_id, upto))
+        db.commit()
+        return count
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def refresh(db, batch_size=ANALYTICS_BATCH_SIZE):
+    """Fold every settled new order and payment into the rollups; returns {source: rows}."""
+    cutoff = datetime.now() - timedelta(seconds=ANALYTICS_SETTLE_SECONDS)
+    folded = {}
+    for source in SOURCES:
+        folded[source] = 0
+        while True:
+            count = _fold_batch(db, source, cutoff, batch_size)
+            folded[source] += count
+            if count < batch_size:
+                break
+    return folded
+
+def rebuild(db, batch_size=ANALYTICS_BATCH_SIZE):
+    """Empty the rollups and refold the whole history."""
+    cursor = db.cursor()
+    try:
+        # One transaction, so a concurrent refresh sees either the old state or a reset one.
+        for table in ('sales_daily', 'product_sales', 'payment_method_totals'):
+            cursor.execute(f"DELETE FROM {table}")
+        cursor.execute("UPDATE analytics_watermarks SET last_id = 0")
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+    return refresh(db, batch_size)
+
+def _refresh_from_pool():
+    pool = get_pool()
+    db = pool.acquire()
+    try:
+        return refresh(db)
+    finally:
+        pool.release(db)
+
+# ---------------- Reports (read only the rollup tables) ----------------
+
+@timed
+def get_watermarks():
+    """{source: last id folded into the rollups}."""
+    db = get_db()
+    cursor = db.cursor()
+    try:
+        cursor.execute("SELECT source, last_id FROM analytics_watermarks")
+        return dict(cursor.fetchall())
+    except Exception as e:
+        print(f"Error getting analytics watermarks: {e}")
+        return {}
+    finally:
+        cursor.close()
+
+@timed
+def get_daily_revenue(days=30):
+    """Orders and revenue per day over the last `days` days, oldest first; days without orders are absent."""
+    days = max(1, min(int(days), MAX_REPORT_DAYS))
+    db = get_db()
+    cursor = db.cursor(dictionary=True)
+    try:
+        cursor.execute(SELECT_DAILY_REVENUE, ((date.today() - timedelta(days=days - 1)).isoformat(),))
+        rows = cursor.fetchall()
+        for row in rows:
+            row['day'] = str(row['day'])[:10]  # a date from MySQL, text from SQLite
+        return rows
+    except Exception as e:
+        print(f"Error getting daily revenue: {e}")
+        return []
+    finally:
+        cursor.close()
+
+@timed
+def get_best_sellers(limit=10):
+    """Products by units sold, most first."""
+    limit = max(1, min(int(limit), MAX_BEST_SELLERS))
+    db = get_db()
+    cursor = db.cursor(dictionary=True)
+    try:
+        cursor.execute(SELECT_BEST_SELLERS, (limit,))
+        return cursor.fetchall()
+    except Exception as e:
+        print(f"Error getting best sellers: {e}")
+        return []
+    finally:
+        cursor.close()
+
+@timed
+def get_payment_method_totals():
+    """Payment count and amount per payment method and status."""
+    db = get_db()
+    cursor = db.cursor(dictionary=True)
+    try:
+        cursor.execute(SELECT_PAYMENT_METHOD_TOTALS)
+        return cursor.fetchall()
+    except Exception as e:
+        print(f"Error getting payment method totals: {e}")
+        return []
+    finally:
+        cursor.close()
+
+# ---------------- Background refresh ----------------
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+def _run_refresher():
+    while True:
+        time.sleep(ANALYTICS_REFRESH_INTERVAL)
+        try:
+            _refresh_from_pool()
+        except Exception as e:
+            print(f"Error refreshing analytics: {e}")
+
+def _start_refresher():
+    # Started lazily on the first request so each forked worker gets its own thread.
+    global _refresher
+    if _refresher is not None:
+        return
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = threading.Thread(target=_run_refresher, name='analytics-refresh', daemon=True)
+            _refresher.start()
+
+def init_app(app):
+    """Refresh the rollups in the background if ANALYTICS_REFRESH_INTERVAL is above zero."""
+    if ANALYTICS_REFRESH_INTERVAL > 0:
+        app.before_request(_start_refresher)
+
+def main(argv):
+    if argv[:1] not in (['refresh'], ['rebuild']):
+        sys.exit("usage: python analytics.py refresh|rebuild")
+    pool = get_pool()
+    db = pool.acquire()
+    try:
+        folded = (rebuild if argv[0] == 'rebuild' else refresh)(db)
+    finally:
+        pool.release(db)
+    print("Folded " + ", ".join(f"{rows} {source}" for source, rows in folded.items()))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
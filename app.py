@@ -1,26 +1,89 @@
-from flask import Flask, render_template, request, session, redirect, url_for, flash, jsonify, g
-from werkzeug.security import generate_password_hash, check_password_hash
-import mysql.connector
-from mysql.connector import pooling
+from flask import Flask, render_template, request, session, redirect, url_for, flash, jsonify, g, stream_with_context
 
 # DAO (Data Access Object) imports
-from user_dao import register_user, login_user
-from product_dao import (get_all_products, search_products, get_product_by_id, 
-                         add_new_product, update_product_details, delete_product_by_id)
-from cart_dao import add_to_cart, get_cart, remove_from_cart, clear_cart
-from order_dao import place_order
-from payment_dao import make_payment
+from user_dao import register_user, login_user, get_user_by_id, user_cache
+from product_dao import (get_products_page, search_products, get_product_by_id, get_related_products,
+                         add_new_product, update_product_details, delete_product_by_id,
+                         catalog_cache_stats, catalog_state, import_product_images, stream_products)
+from cart_dao import (add_to_cart, add_many_to_cart, parse_cart_item, parse_cart_items, get_cart, price_cart,
+                      remove_from_cart)
+from order_dao import checkout, get_user_orders, get_order_details, stream_orders, EmptyCart
+from payment_dao import stream_payments
+from catalog_feed import import_feed, export_feed, FORMATS as FEED_FORMATS
+from inventory_dao import hold_stock, OutOfStock
+from password_hasher import HashQueueFull, HashTimeout
+from session_store import create_session_interface
+from cache import FragmentCache
+import assets
+import profiling
+import analytics
+import inventory_dao
+from datetime import datetime, timezone
+import hashlib
+import io
+import os
+from db import close_db, pool_stats, PoolTimeout
+from streaming import stream_response, STREAM_MIMETYPES
+import metrics
 
 # Create and configure the Flask app
 app = Flask(__name__)
 app.secret_key = "mysecret123"
-
-# app.py
-@app.teardown_appcontext
-def close_connection(exception):
-    db = getattr(g, '_database', None)
-    if db and hasattr(db, 'is_connected') and db.is_connected():
-        db.close()
+assets.init_app(app)
+# Registered first so sampled requests are timed from their first hook to their last.
+profiling.init_app(app)
+analytics.init_app(app)
+inventory_dao.init_app(app)
+
+# Rendered product grids shared by every visitor; keys include the catalog version.
+fragment_cache = FragmentCache(maxsize=int(os.getenv('FRAGMENT_CACHE_SIZE', 512)),
+                               ttl=int(os.getenv('FRAGMENT_CACHE_TTL', 300)))
+
+# SESSION_BACKEND=memory|redis keeps sessions server-side; the default is Flask's signed cookie.
+_session_interface = create_session_interface(os.getenv('SESSION_BACKEND', 'cookie'), os.getenv('REDIS_URL'))
+if _session_interface is not None:
+    app.session_interface = _session_interface
+
+def render_fragment(key, template, **context):
+    """Render a partial template through the fragment cache."""
+    return fragment_cache.render(key, lambda: render_template(template, **context).strip())
+
+def catalog_validators(*parts):
+    """ETag and Last-Modified for a response derived from the catalog and parts."""
+    version, changed_at = catalog_state()
+    etag = hashlib.md5(repr((version,) + parts).encode()).hexdigest()
+    return etag, datetime.fromtimestamp(int(changed_at), timezone.utc)
+
+def not_modified(etag, last_modified):
+    """A 304 response if the client's cached copy is current, else None."""
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    else:
+        fresh = request.if_modified_since is not None and request.if_modified_since >= last_modified
+    if not fresh:
+        return None
+    response = app.response_class(status=304)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    return response
+
+@app.before_request
+def load_logged_in_user():
+    """Resolve the session's user through the user cache so role and account
+    changes apply on the next request without a query per request."""
+    g.user = None
+    user_id = session.get('user_id')
+    if user_id is None:
+        return
+    user = get_user_by_id(user_id)
+    version = session.get('auth_version')
+    if not user or not user['is_active'] or (version and version != user['auth_version']):
+        session.clear()
+        return
+    g.user = user
+
+# Every request hands its connection back to the pool, even when it errors.
+app.teardown_appcontext(close_db)
 
 # ---------------- API ENDPOINTS (for JavaScript) ----------------
 
@@ -39,16 +102,53 @@ def api_login():
     user = login_user(data.get('email'), data.get('password'))
     if user:
         user_id, user_name, user_role = user
+        account = get_user_by_id(user_id)
+        if account is None:
+            return jsonify({"error": "Login failed, please try again"}), 503
+        session.clear()
+        if hasattr(session, 'regenerate'):
+            session.regenerate()
         session['user_id'] = user_id
-        session['user_name'] = user_name
-        session['user_role'] = user_role
+        # Name and role are read from the user cache on each request, not trusted from here.
+        session['auth_version'] = account['auth_version']
         return jsonify({"message": "Login successful", "user": {"id": user_id, "name": user_name, "role": user_role}})
     return jsonify({"error": "Invalid credentials"}), 401
 
 @app.route('/api/products', methods=['GET'])
 def api_products():
-    products = get_all_products()
-    return jsonify({"products": products})
+    # ?stream=json|ndjson sends the whole catalog, read and encoded in chunks.
+    stream = request.args.get('stream')
+    if stream is not None and stream not in STREAM_MIMETYPES:
+        return jsonify({"error": "stream must be json or ndjson"}), 400
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit', 24, type=int)
+    sort = request.args.get('sort', 'id')
+    etag, last_modified = catalog_validators(cursor, limit, sort, stream)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+    try:
+        if stream:
+            response = stream_response(stream_products(sort), stream, 'products')
+        else:
+            products, next_cursor = get_products_page(cursor, limit, sort)
+            response = jsonify({"products": products, "next_cursor": next_cursor})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    return response
+
+@app.route('/api/search', methods=['GET'])
+def api_search():
+    # Type-ahead friendly: partial words match as prefixes.
+    query = request.args.get('q', '').strip()
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    offset = request.args.get('offset', 0, type=int)
+    if offset < 0:
+        return jsonify({"error": "offset must not be negative"}), 400
+    results, total = search_products(query, limit, offset)
+    return jsonify({"products": results, "total": total})
 
 @app.route('/api/products/add', methods=['POST'])
 def api_add_product():
@@ -73,22 +173,70 @@ def api_delete_product(product_id):
         return jsonify({"message": "Product deleted successfully!"})
     return jsonify({"error": "Failed to delete product"}), 500
 
+def _feed_format(default='csv'):
+    fmt = request.args.get('format')
+    if fmt is None:
+        fmt = 'jsonl' if 'json' in (request.mimetype or '') else default
+    return fmt if fmt in FEED_FORMATS else None
+
+@app.route('/api/products/bulk', methods=['POST'])
+def api_bulk_import_products():
+    if not g.user or g.user['role'] != 'admin':
+        return jsonify({"error": "Unauthorized"}), 401
+    fmt = _feed_format()
+    if fmt is None:
+        return jsonify({"error": "format must be csv or jsonl"}), 400
+    # Parse the body as it arrives instead of buffering the whole feed.
+    body = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    try:
+        summary = import_feed(body, fmt)
+    except ValueError as e:  # includes a body that is not UTF-8
+        return jsonify({"error": str(e)}), 400
+    return jsonify(summary)
+
+@app.route('/api/products/export', methods=['GET'])
+def api_export_products():
+    if not g.user or g.user['role'] != 'admin':
+        return jsonify({"error": "Unauthorized"}), 401
+    fmt = _feed_format()
+    if fmt is None:
+        return jsonify({"error": "format must be csv or jsonl"}), 400
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = app.response_class(stream_with_context(export_feed(fmt)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="products.{fmt}"'
+    return response
+
 @app.route('/api/cart/add', methods=['POST'])
 def api_add_to_cart():
     if 'user_id' not in session:
         return jsonify({"error": "Unauthorized"}), 401
 
-    data = request.get_json()
-    product_id = data.get('product_id')
-    quantity = data.get('quantity', 1)
-    
-    if not product_id:
+    data = request.get_json() or {}
+    if not data.get('product_id'):
         return jsonify({"error": "Product ID is required"}), 400
+    try:
+        product_id, quantity = parse_cart_item(data.get('product_id'), data.get('quantity', 1))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     if add_to_cart(session['user_id'], product_id, quantity):
         return jsonify({"message": "Product added to cart"}), 201
     return jsonify({"error": "Failed to add item"}), 400
 
+@app.route('/api/cart/add-batch', methods=['POST'])
+def api_add_batch_to_cart():
+    if 'user_id' not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    data = request.get_json() or {}
+    try:
+        items = parse_cart_items(data.get('items'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if add_many_to_cart(session['user_id'], items):
+        return jsonify({"message": "Products added to cart", "count": len(items)}), 201
+    return jsonify({"error": "Failed to add items"}), 400
 
 @app.route('/api/cart', methods=['GET'])
 def api_get_cart():
@@ -116,6 +264,23 @@ def api_remove_from_cart():
     
     return jsonify({"error": "Failed to remove item"}), 400
 
+@app.route('/api/cart/reserve', methods=['POST'])
+def api_reserve_cart():
+    """Hold stock for the cart while the customer fills in payment details."""
+    if 'user_id' not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    try:
+        lines, _ = price_cart(session['user_id'])
+        if not lines:
+            return jsonify({"error": "Your cart is empty"}), 400
+        held = hold_stock(session['user_id'], [(product_id, quantity) for product_id, quantity, _ in lines])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if held:
+        return jsonify({"message": "Stock reserved"}), 200
+    return jsonify({"error": "Failed to reserve stock"}), 500
+
 @app.route('/api/checkout', methods=['POST'])
 def api_checkout():
     if 'user_id' not in session:
@@ -128,22 +293,107 @@ def api_checkout():
     if not delivery_address or not payment_method:
         return jsonify({"error": "Missing delivery address or payment method"}), 400
 
-    # Step 1: Place the order from the cart
-    order_id, total_amount = place_order(session['user_id'], delivery_address)
-    
+    # Order, items, payment and cart clear are written in one transaction.
+    try:
+        order_id, total_amount, timings = checkout(session['user_id'], delivery_address, payment_method)
+    except EmptyCart:
+        return jsonify({"error": "Your cart is empty"}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    server_timing = ", ".join(f"{stage};dur={ms:.1f}" for stage, ms in timings.items())
+
     if not order_id:
-        return jsonify({"error": "Failed to create order, cart might be empty"}), 400
+        # The transaction failed and was rolled back; the cart is untouched.
+        response = jsonify({"error": "Failed to create order"})
+        response.headers['Server-Timing'] = server_timing
+        return response, 500
 
-    # Step 2: Simulate payment and record it
-    payment_success = make_payment(order_id, total_amount, 'Completed', payment_method)
+    response = jsonify({"message": "Order placed and payment successful!", "order_id": order_id})
+    response.headers['Server-Timing'] = server_timing
+    return response, 200
 
-    if payment_success:
-        # Also clear the cart after a successful order
-        clear_cart(session['user_id'])
-        return jsonify({"message": "Order placed and payment successful!", "order_id": order_id}), 200
-    else:
-        # In a real application, you would handle this with better error logging and user feedback
-        return jsonify({"error": "Order placed but payment failed. Please contact support.", "order_id": order_id}), 500
+@app.route('/api/orders', methods=['GET'])
+def api_orders():
+    if 'user_id' not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit', 20, type=int)
+    try:
+        orders, next_cursor = get_user_orders(session['user_id'], cursor, limit)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"orders": orders, "next_cursor": next_cursor})
+
+@app.route('/api/orders/<int:order_id>', methods=['GET'])
+def api_order_details(order_id):
+    if 'user_id' not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    order = get_order_details(order_id, session['user_id'])
+    if not order:
+        return jsonify({"error": "Order not found"}), 404
+    return jsonify(order)
+
+@app.route('/api/admin/stats', methods=['GET'])
+def api_admin_stats():
+    if not g.user or g.user['role'] != 'admin':
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify({"db_pool": pool_stats(), "catalog_cache": catalog_cache_stats(),
+                    "user_cache": user_cache.stats(), "fragment_cache": fragment_cache.stats()})
+
+def _admin_report(stream_rows, key):
+    if not g.user or g.user['role'] != 'admin':
+        return jsonify({"error": "Unauthorized"}), 401
+    fmt = request.args.get('format', 'json')
+    if fmt not in STREAM_MIMETYPES:
+        return jsonify({"error": "format must be json or ndjson"}), 400
+    return stream_response(stream_rows(request.args.get('user_id', type=int)), fmt, key)
+
+@app.route('/api/admin/orders', methods=['GET'])
+def api_admin_orders():
+    return _admin_report(stream_orders, 'orders')
+
+@app.route('/api/admin/payments', methods=['GET'])
+def api_admin_payments():
+    return _admin_report(stream_payments, 'payments')
+
+@app.route('/api/admin/analytics/revenue', methods=['GET'])
+def api_analytics_revenue():
+    if not g.user or g.user['role'] != 'admin':
+        return jsonify({"error": "Unauthorized"}), 401
+    days = request.args.get('days', 30, type=int)
+    return jsonify({"days": analytics.get_daily_revenue(days), "as_of": analytics.get_watermarks()})
+
+@app.route('/api/admin/analytics/best-sellers', methods=['GET'])
+def api_analytics_best_sellers():
+    if not g.user or g.user['role'] != 'admin':
+        return jsonify({"error": "Unauthorized"}), 401
+    limit = request.args.get('limit', 10, type=int)
+    return jsonify({"products": analytics.get_best_sellers(limit), "as_of": analytics.get_watermarks()})
+
+@app.route('/api/admin/analytics/payment-methods', methods=['GET'])
+def api_analytics_payment_methods():
+    if not g.user or g.user['role'] != 'admin':
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify({"payment_methods": analytics.get_payment_method_totals(), "as_of": analytics.get_watermarks()})
+
+@app.route('/api/admin/media/import', methods=['POST'])
+def api_import_product_images():
+    if not g.user or g.user['role'] != 'admin':
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify({"message": "Product images imported", "count": import_product_images()})
+
+# Prometheus scrape target. Set METRICS_TOKEN to require "Authorization: Bearer <token>".
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+@app.route('/metrics')
+def prometheus_metrics():
+    if METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {METRICS_TOKEN}":
+        return jsonify({"error": "Unauthorized"}), 401
+    body = metrics.render({"db_pool": pool_stats(), "catalog_cache": catalog_cache_stats(),
+                           "user_cache": user_cache.stats(), "fragment_cache": fragment_cache.stats()})
+    return app.response_class(body, mimetype='text/plain; version=0.0.4')
 
 # ---------------- SERVER-SIDE RENDERED PAGES ----------------
 
@@ -153,8 +403,24 @@ def index():
 
 @app.route('/home')
 def home():
-    products = get_all_products()
-    return render_template('index.html', user_name=session.get('user_name'), products=products)
+    cursor = request.args.get('cursor')
+    user_name = g.user['name'] if g.user else None
+    etag, last_modified = catalog_validators(cursor, session.get('user_id'), user_name)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+    try:
+        products, next_cursor = get_products_page(cursor)
+    except ValueError:
+        return redirect(url_for('home'))
+    version, _ = catalog_state()
+    product_grid = render_fragment(('grid', version, cursor), 'partials/product_grid.html', products=products)
+    response = app.make_response(render_template('index.html', user_name=user_name, product_grid=product_grid,
+                                                 next_cursor=next_cursor))
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.vary.add('Cookie')
+    return response
 
 # This route renders the cart page. The data is loaded via JavaScript.
 @app.route('/cart')
@@ -170,11 +436,11 @@ def show_cart():
 
 @app.route('/admin')
 def admin_panel():
-    if 'user_role' not in session or session['user_role'] != 'admin':
+    if not g.user or g.user['role'] != 'admin':
         flash("You do not have permission to access this page.", "error")
         return redirect(url_for('home'))
-    products = get_all_products()
-    return render_template('admin.html', products=products)
+    # The product table is filled page by page from /api/products by api.js.
+    return render_template('admin.html')
 
 @app.route("/logout")
 def logout():
@@ -182,13 +448,20 @@ def logout():
     flash("Logged out successfully!")
     return redirect(url_for("home"))
 
+SEARCH_PAGE_SIZE = 20
+
 @app.route("/search")
 def search():
     query = request.args.get("query", "").strip()
     if not query:
         return redirect(url_for("home"))
-    results = search_products(query)
-    return render_template("search.html", results=results, query=query)
+    page = max(request.args.get("page", 1, type=int), 1)
+    results, total = search_products(query, SEARCH_PAGE_SIZE, (page - 1) * SEARCH_PAGE_SIZE)
+    version, _ = catalog_state()
+    results_html = render_fragment(('search', version, query.lower(), page),
+                                   'partials/search_results.html', results=results)
+    return render_template("search.html", results=results, results_html=results_html, query=query, page=page,
+                           has_next=page * SEARCH_PAGE_SIZE < total, total=total)
 
 @app.route("/product/<int:product_id>")
 def product_detail(product_id):
@@ -196,9 +469,11 @@ def product_detail(product_id):
     if not product:
         flash("Product not found", "error")
         return redirect(url_for("home"))
-    all_products = get_all_products()
-    related_products = [p for p in all_products if p['id'] != product_id]
-    return render_template("product_detail.html", product=product, related_products=related_products)
+    version, _ = catalog_state()
+    # The lookup runs only when the fragment is not cached.
+    related_html = fragment_cache.render(('related', version, product_id), lambda: render_template(
+        'partials/related_products.html', related_products=get_related_products(product_id)).strip())
+    return render_template("product_detail.html", product=product, related_html=related_html)
 
 # ---------------- ERROR HANDLERS ----------------
 
@@ -206,5 +481,21 @@ def product_detail(product_id):
 def not_found(error):
     return render_template('404.html'), 404
 
+@app.errorhandler(OutOfStock)
+def out_of_stock(error):
+    return jsonify({"error": str(error), "product_id": error.product_id}), 409
+
+@app.errorhandler(HashQueueFull)
+def hash_queue_full(error):
+    return jsonify({"error": str(error)}), 429, {"Retry-After": "1"}
+
+@app.errorhandler(HashTimeout)
+def hash_timeout(error):
+    return jsonify({"error": str(error)}), 503, {"Retry-After": "1"}
+
+@app.errorhandler(PoolTimeout)
+def db_busy(error):
+    return jsonify({"error": "Server is busy, please try again"}), 503
+
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
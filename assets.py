@@ -0,0 +1,156 @@
+# assets.py
+# Static asset pipeline. `python assets.py` builds static/dist/: every file is
+# copied under a content-hashed name, text assets get .gz/.br siblings and
+# product card images get resized WebP variants. The app serves static/dist at
+# /assets with far-future immutable caching; without a build, templates fall
+# back to the plain /static files.
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+
+from flask import request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # .br files are skipped without it
+    brotli = None
+try:
+    from PIL import Image
+except ImportError:  # WebP thumbnails are skipped without Pillow
+    Image = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.html', '.txt'}
+PRODUCT_CARD_RE = re.compile(r'^images/product-\d+\.(png|jpe?g)$')
+THUMB_WIDTHS = (200, 400)
+CSS_URL_RE = re.compile(r'url\((["\']?)(\.\./[^)"\']+)\1\)')
+
+_manifest = None
+
+def _fingerprint(rel_path, content):
+    stem, ext = os.path.splitext(rel_path)
+    return f"{stem}.{hashlib.sha256(content).hexdigest()[:10]}{ext}"
+
+def _write(rel_path, content):
+    out = os.path.join(DIST_DIR, rel_path)
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, 'wb') as f:
+        f.write(content)
+    if os.path.splitext(rel_path)[1] in COMPRESSIBLE:
+        with open(out + '.gz', 'wb') as f:
+            f.write(gzip.compress(content, compresslevel=9))
+        if brotli is not None:
+            with open(out + '.br', 'wb') as f:
+                f.write(brotli.compress(content, quality=11))
+
+def _rewrite_css(rel_path, content, manifest):
+    """Point url(../x) references in a stylesheet at the fingerprinted files."""
+    base = os.path.dirname(rel_path)
+
+    def replace(match):
+        target = os.path.normpath(os.path.join(base, match.group(2))).replace(os.sep, '/')
+        if target not in manifest:
+            return match.group(0)
+        return f"url({os.path.relpath(manifest[target], base).replace(os.sep, '/')})"
+
+    return CSS_URL_RE.sub(replace, content.decode('utf-8')).encode('utf-8')
+
+def _thumbnails(rel_path, source, manifest):
+    with Image.open(source) as image:
+        for width in THUMB_WIDTHS:
+            if image.width <= width:
+                continue
+            thumb = image.copy()
+            thumb.thumbnail((width, image.height))
+            out_name = f"{os.path.splitext(rel_path)[0]}-{width}w.webp"
+            tmp = os.path.join(DIST_DIR, out_name)
+            os.makedirs(os.path.dirname(tmp), exist_ok=True)
+            thumb.save(tmp, 'WEBP', quality=80, method=6)
+            with open(tmp, 'rb') as f:
+                content = f.read()
+            os.remove(tmp)
+            hashed = _fingerprint(out_name, content)
+            _write(hashed, content)
+            manifest[f"{rel_path}@{width}w"] = hashed
+
+def build():
+    """Rebuild static/dist and its manifest from static/."""
+    shutil.rmtree(DIST_DIR, ignore_errors=True)
+    manifest = {}
+    files = []
+    for root, dirs, names in os.walk(STATIC_DIR):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != DIST_DIR]
+        for name in names:
+            files.append(os.path.relpath(os.path.join(root, name), STATIC_DIR).replace(os.sep, '/'))
+
+    # Stylesheets last, so the files they reference already have hashed names.
+    for rel_path in sorted(files, key=lambda p: p.endswith('.css')):
+        source = os.path.join(STATIC_DIR, rel_path)
+        with open(source, 'rb') as f:
+            content = f.read()
+        if rel_path.endswith('.css'):
+            content = _rewrite_css(rel_path, content, manifest)
+        hashed = _fingerprint(rel_path, content)
+        _write(hashed, content)
+        manifest[rel_path] = hashed
+        if Image is not None and PRODUCT_CARD_RE.match(rel_path):
+            _thumbnails(rel_path, source, manifest)
+
+    with open(MANIFEST_PATH, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return manifest
+
+def _get_manifest():
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(MANIFEST_PATH) as f:
+                _manifest = json.load(f)
+        except (OSError, ValueError):
+            _manifest = {}
+    return _manifest
+
+def asset_url(filename):
+    """URL of a static file: its fingerprinted copy if built, else the plain file."""
+    hashed = _get_manifest().get(filename)
+    if hashed:
+        return url_for('serve_asset', filename=hashed)
+    return url_for('static', filename=filename)
+
+def thumb_url(filename, width=400):
+    """URL of a WebP thumbnail of an image, falling back to the full image."""
+    hashed = _get_manifest().get(f"{filename}@{width}w")
+    if hashed:
+        return url_for('serve_asset', filename=hashed)
+    return asset_url(filename)
+
+def serve_asset(filename):
+    """Serve a fingerprinted file, preferring a precompressed copy the client accepts."""
+    path = os.path.join(DIST_DIR, filename)
+    mimetype = mimetypes.guess_type(filename)[0]
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if encoding in request.accept_encodings and os.path.exists(path + suffix):
+            response = send_from_directory(DIST_DIR, filename + suffix, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(DIST_DIR, filename)
+    # The name changes whenever the content does, so the copy can be kept forever.
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.vary.add('Accept-Encoding')
+    return response
+
+def init_app(app):
+    app.add_url_rule('/assets/<path:filename>', 'serve_asset', serve_asset)
+    app.jinja_env.globals.update(asset_url=asset_url, thumb_url=thumb_url)
+
+if __name__ == '__main__':
+    manifest = build()
+    print(f"Built {len(manifest)} assets into {DIST_DIR}")
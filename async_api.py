@@ -0,0 +1,344 @@
+# async_api.py
+# asyncio serving mode for the JSON API. Handlers mirror the ones in app.py but
+# run on an aiomysql connection pool, so a waiting query does not pin a worker
+# thread. Sessions use the same secret key and cookie format, so with the default
+# SESSION_BACKEND=cookie a client can switch between the two servers.
+#
+#   hypercorn async_api:app --bind 0.0.0.0:5001
+import asyncio
+import os
+import time
+from datetime import datetime
+
+import aiomysql
+from quart import Quart, jsonify, request, session
+
+from db import MYSQL_CONFIG, POOL_CONFIG
+from cache import TTLCache
+from cart_dao import (UPSERT_CART_ITEM, SELECT_CART_LINES, SELECT_CART_ITEMS, DELETE_CART_ITEM, CLEAR_CART,
+                      parse_cart_item, parse_cart_items, to_minor, from_minor, write_behind)
+from inventory_dao import (merge_items, check_quantity, OutOfStock, SELECT_HOLDS, TAKE_STOCK, TAKE_LAST_STOCK,
+                           RETURN_STOCK, RESTOCK, DELETE_HOLDS)
+from password_hasher import verify_password, HashQueueFull, HashTimeout
+from order_dao import INSERT_ORDER, INSERT_ORDER_ITEM, EmptyCart
+from payment_dao import INSERT_PAYMENT, CONFIRM_ORDER
+from product_dao import (page_query, page_result, related_index, attach_images, media_index, DEFAULT_PAGE_SIZE,
+                         MAX_PAGE_SIZE, CATALOG_VERSION_POLL, SELECT_CATALOG_VERSION, BUMP_CATALOG_VERSION,
+                         SELECT_MEDIA)
+from user_dao import SELECT_LOGIN_USER, SELECT_USER
+
+if write_behind is not None:
+    # Carts here are read and written in MySQL directly; a hot store in the sync
+    # app would hold changes this server never sees.
+    raise RuntimeError("async_api does not support CART_BACKEND write-behind; set CART_BACKEND=mysql")
+
+app = Quart(__name__)
+app.secret_key = "mysecret123"
+
+# Product pages are cached per process, keyed on the shared catalog version as in the sync app.
+page_cache = TTLCache(maxsize=1024, ttl=int(os.getenv('CATALOG_CACHE_TTL', 300)))
+# Session users, checked on every request like user_dao.user_cache in the sync app.
+user_cache = TTLCache(maxsize=int(os.getenv('USER_CACHE_SIZE', 10000)), ttl=int(os.getenv('USER_CACHE_TTL', 60)))
+catalog_version = None
+_version_checked_at = 0.0
+
+@app.before_serving
+async def create_pool():
+    app.db_pool = await aiomysql.create_pool(
+        host=MYSQL_CONFIG['host'], user=MYSQL_CONFIG['user'],
+        password=MYSQL_CONFIG['password'], db=MYSQL_CONFIG['database'],
+        minsize=1, maxsize=POOL_CONFIG['size'], pool_recycle=POOL_CONFIG['recycle'],
+        autocommit=False,
+    )
+
+@app.after_serving
+async def close_pool():
+    app.db_pool.close()
+    await app.db_pool.wait_closed()
+
+async def fetch_all(query, params=()):
+    async with app.db_pool.acquire() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute(query, params)
+            rows = await cursor.fetchall()
+        await conn.rollback()  # end the read transaction before the connection is reused
+        return rows
+
+# ---------------- DAO ----------------
+
+async def login_user(email, password):
+    """(user_id, name, role, auth_version) for an active account with this password, else None."""
+    rows = await fetch_all(SELECT_LOGIN_USER, (email,))
+    if not rows:
+        return None
+    user = rows[0]
+    # Hash checks run in the hashing process pool; wait for them off the event loop.
+    if await asyncio.to_thread(verify_password, user['password'], password):
+        return user['user_id'], user['name'], user['role'], user['auth_version']
+    return None
+
+async def get_user_by_id(user_id):
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+    rows = await fetch_all(SELECT_USER, (user_id,))
+    if not rows:
+        return None
+    user = rows[0]
+    user_cache.set(user_id, user)
+    return user
+
+async def get_catalog_version():
+    """The shared catalog version, re-read at most every CATALOG_VERSION_POLL seconds."""
+    global catalog_version, _version_checked_at
+    now = time.monotonic()
+    if now - _version_checked_at >= CATALOG_VERSION_POLL:
+        _version_checked_at = now
+        rows = await fetch_all(SELECT_CATALOG_VERSION)
+        if rows:
+            catalog_version = rows[0]['version']
+    return catalog_version
+
+async def get_media_index():
+    """Async twin of product_dao.get_media_index, cached per catalog version in page_cache."""
+    key = ('media', await get_catalog_version())
+    index = page_cache.get(key)
+    if index is None:
+        index = media_index(await fetch_all(SELECT_MEDIA))
+        page_cache.set(key, index)
+    return index
+
+async def get_products_page(cursor=None, limit=DEFAULT_PAGE_SIZE, sort='id'):
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    key = (await get_catalog_version(), sort, cursor, limit)
+    page = page_cache.get(key)
+    if page is None:
+        query, params = page_query(cursor, limit, sort)
+        products = attach_images(await fetch_all(query, params), media=await get_media_index())
+        page = page_result(products, limit, sort)
+        page_cache.set(key, page)
+    return page
+
+async def get_cart(user_id):
+    try:
+        items = attach_images(await fetch_all(SELECT_CART_ITEMS, (user_id,)), id_key='product_id',
+                              media=await get_media_index())
+    except Exception as e:
+        print(f"Error getting cart: {e}")
+        return {'items': [], 'total': 0.0, 'total_minor': 0}
+    grand_total = 0
+    for item in items:
+        unit = to_minor(item['price'])
+        item['price'] = unit / 100
+        item['subtotal'] = unit * item['quantity'] / 100
+        grand_total += unit * item['quantity']
+    return {'items': items, 'total': grand_total / 100, 'total_minor': grand_total}
+
+async def execute_write(query, params, many=False):
+    """Run one write statement in its own transaction; returns rowcount, or None on error."""
+    async with app.db_pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            try:
+                if many:
+                    await cursor.executemany(query, params)
+                else:
+                    await cursor.execute(query, params)
+                await conn.commit()
+                return cursor.rowcount
+            except Exception as e:
+                await conn.rollback()
+                print(f"Error writing: {e}")
+                return None
+
+async def reserve_stock(cursor, user_id, items):
+    """Async twin of inventory_dao.reserve_stock: same statements, same lock order.
+
+    Returns True if a product sold out or came back in stock.
+    """
+    wanted = dict(merge_items(items))
+    await cursor.execute(SELECT_HOLDS, (user_id,))
+    held = dict(await cursor.fetchall())
+    flipped = False
+    for product_id in sorted(set(held) | set(wanted)):
+        need = wanted.get(product_id, 0) - held.get(product_id, 0)
+        if need > 0:
+            await cursor.execute(TAKE_STOCK, (need, product_id, need))
+            if cursor.rowcount == 0:
+                await cursor.execute(TAKE_LAST_STOCK, (need, product_id, need))
+                if cursor.rowcount == 0:
+                    raise OutOfStock(product_id)
+                flipped = True
+        elif need < 0:
+            await cursor.execute(RETURN_STOCK, (-need, product_id))
+            if cursor.rowcount == 0:
+                await cursor.execute(RESTOCK, (-need, product_id))
+                flipped = flipped or cursor.rowcount > 0
+    if held:
+        await cursor.execute(DELETE_HOLDS, (user_id,))
+    return flipped
+
+async def price_cart(user_id):
+    """Async twin of cart_dao.price_cart: (product_id, quantity, unit) lines and the total, in paise."""
+    lines, total = [], 0
+    for row in await fetch_all(SELECT_CART_LINES, (user_id,)):
+        check_quantity(row['product_id'], row['quantity'])
+        unit = to_minor(row['price'])
+        lines.append((row['product_id'], row['quantity'], unit))
+        total += row['quantity'] * unit
+    return lines, total
+
+async def checkout(user_id, delivery_address, payment_method):
+    """Async twin of order_dao.checkout: order, items, stock, payment and cart clear in one commit."""
+    lines, total = await price_cart(user_id)
+    if not lines or total <= 0:
+        raise EmptyCart()
+    total_amount = from_minor(total)
+    async with app.db_pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            try:
+                await cursor.execute(INSERT_ORDER, (user_id, total_amount, delivery_address, datetime.now()))
+                order_id = cursor.lastrowid
+                flipped = await reserve_stock(cursor, user_id,
+                                              [(product_id, quantity) for product_id, quantity, _ in lines])
+                await cursor.executemany(INSERT_ORDER_ITEM, [
+                    (order_id, product_id, quantity, from_minor(unit)) for product_id, quantity, unit in lines
+                ])
+                await cursor.execute(INSERT_PAYMENT, (order_id, total_amount, 'Completed', payment_method,
+                                                      datetime.now()))
+                await cursor.execute(CONFIRM_ORDER, (order_id,))
+                await cursor.execute(CLEAR_CART, (user_id,))
+                await conn.commit()
+            except (OutOfStock, ValueError):
+                await conn.rollback()
+                raise
+            except Exception as e:
+                await conn.rollback()
+                print(f"Error during checkout: {e}")
+                return None
+    if flipped:
+        # A product sold out or came back: move every worker's catalog version on, as product_dao.stock_changed does.
+        await execute_write(BUMP_CATALOG_VERSION, (datetime.now(),))
+    related_index.record_order([line[0] for line in lines])
+    return order_id
+
+# ---------------- API ENDPOINTS ----------------
+
+@app.before_request
+async def check_session_user():
+    """End sessions of disabled accounts and of passwords changed since login, as app.py does."""
+    user_id = session.get('user_id')
+    if user_id is None:
+        return
+    user = await get_user_by_id(user_id)
+    version = session.get('auth_version')
+    if not user or not user['is_active'] or (version and version != user['auth_version']):
+        session.clear()
+
+@app.errorhandler(OutOfStock)
+async def out_of_stock(error):
+    return jsonify({"error": str(error), "product_id": error.product_id}), 409
+
+@app.errorhandler(HashQueueFull)
+async def hash_queue_full(error):
+    return jsonify({"error": str(error)}), 429, {"Retry-After": "1"}
+
+@app.errorhandler(HashTimeout)
+async def hash_timeout(error):
+    return jsonify({"error": str(error)}), 503, {"Retry-After": "1"}
+
+@app.route('/api/login', methods=['POST'])
+async def api_login():
+    data = await request.get_json()
+    user = await login_user(data.get('email'), data.get('password'))
+    if user:
+        user_id, user_name, user_role, version = user
+        session.clear()
+        session['user_id'] = user_id
+        session['user_name'] = user_name
+        session['user_role'] = user_role
+        session['auth_version'] = version
+        return jsonify({"message": "Login successful", "user": {"id": user_id, "name": user_name, "role": user_role}})
+    return jsonify({"error": "Invalid credentials"}), 401
+
+@app.route('/api/products', methods=['GET'])
+async def api_products():
+    try:
+        products, next_cursor = await get_products_page(
+            request.args.get('cursor'),
+            request.args.get('limit', 24, type=int),
+            request.args.get('sort', 'id'),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"products": products, "next_cursor": next_cursor})
+
+@app.route('/api/cart', methods=['GET'])
+async def api_get_cart():
+    if 'user_id' not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify(await get_cart(session['user_id'])), 200
+
+@app.route('/api/cart/add', methods=['POST'])
+async def api_add_to_cart():
+    if 'user_id' not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+    data = await request.get_json() or {}
+    if not data.get('product_id'):
+        return jsonify({"error": "Product ID is required"}), 400
+    try:
+        product_id, quantity = parse_cart_item(data.get('product_id'), data.get('quantity', 1))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if await execute_write(UPSERT_CART_ITEM, (session['user_id'], product_id, quantity)) is not None:
+        return jsonify({"message": "Product added to cart"}), 201
+    return jsonify({"error": "Failed to add item"}), 400
+
+@app.route('/api/cart/add-batch', methods=['POST'])
+async def api_add_batch_to_cart():
+    if 'user_id' not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+    data = await request.get_json() or {}
+    try:
+        items = parse_cart_items(data.get('items'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    user_id = session['user_id']
+    rows = [(user_id, product_id, quantity) for product_id, quantity in items]
+    if await execute_write(UPSERT_CART_ITEM, rows, many=True) is not None:
+        return jsonify({"message": "Products added to cart", "count": len(items)}), 201
+    return jsonify({"error": "Failed to add items"}), 400
+
+@app.route('/api/cart/remove', methods=['POST'])
+async def api_remove_from_cart():
+    if 'user_id' not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+    data = await request.get_json()
+    product_id = data.get('product_id')
+    if not product_id:
+        return jsonify({"error": "Product ID is required"}), 400
+    removed = await execute_write(DELETE_CART_ITEM, (session['user_id'], product_id))
+    if removed:
+        return jsonify({"message": "Product removed from cart"}), 200
+    return jsonify({"error": "Failed to remove item"}), 400
+
+@app.route('/api/checkout', methods=['POST'])
+async def api_checkout():
+    if 'user_id' not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+    data = await request.get_json()
+    delivery_address = data.get('delivery_address')
+    payment_method = data.get('payment_method')
+    if not delivery_address or not payment_method:
+        return jsonify({"error": "Missing delivery address or payment method"}), 400
+    try:
+        order_id = await checkout(session['user_id'], delivery_address, payment_method)
+    except EmptyCart:
+        return jsonify({"error": "Your cart is empty"}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not order_id:
+        return jsonify({"error": "Failed to create order"}), 500
+    return jsonify({"message": "Order placed and payment successful!", "order_id": order_id}), 200
+
+if __name__ == "__main__":
+    app.run(port=5001)
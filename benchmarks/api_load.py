@@ -0,0 +1,103 @@
+# benchmarks/api_load.py
+# Load test for the JSON API: drives keep-alive GETs from many concurrent clients
+# and reports requests/sec, latency percentiles and server memory per concurrent
+# request. Run it once against each serving mode with the same settings:
+#
+#   gunicorn -w 4 --threads 8 -b :5000 app:app
+#   hypercorn -w 4 -b :5001 async_api:app
+#
+#   python benchmarks/api_load.py --url http://127.0.0.1:5000 --server-pid <pid> \
+#       --email bench@example.com --password secret --concurrency 200
+import argparse
+import asyncio
+import json
+import time
+import urllib.request
+from urllib.parse import urlsplit
+
+def login_cookie(base_url, email, password):
+    req = urllib.request.Request(
+        f"{base_url}/api/login", data=json.dumps({'email': email, 'password': password}).encode(),
+        headers={'Content-Type': 'application/json'}, method='POST')
+    with urllib.request.urlopen(req) as resp:
+        return resp.headers['Set-Cookie'].split(';', 1)[0]
+
+def rss_kb(pids):
+    """Resident memory of the server processes, in kB."""
+    total = 0
+    for pid in pids:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    total += int(line.split()[1])
+    return total
+
+async def client(host, port, paths, cookie, deadline, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    i = 0
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nCookie: {cookie}\r\n\r\n".encode())
+        await writer.drain()
+        status = await reader.readline()
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode().partition(':')
+            if name.lower() == 'content-length':
+                length = int(value)
+        await reader.readexactly(length)
+        if b' 200 ' not in status:
+            errors.append(status)
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+
+async def sample_memory(pids, deadline, peak):
+    while time.perf_counter() < deadline:
+        peak[0] = max(peak[0], rss_kb(pids))
+        await asyncio.sleep(0.2)
+
+async def run(args):
+    parts = urlsplit(args.url)
+    cookie = login_cookie(args.url, args.email, args.password) if args.email else ''
+    paths = args.paths.split(',')
+    pids = [int(p) for p in args.server_pid.split(',')] if args.server_pid else []
+    idle = rss_kb(pids) if pids else 0
+    peak = [idle]
+
+    latencies, errors = [], []
+    deadline = time.perf_counter() + args.duration
+    tasks = [client(parts.hostname, parts.port or 80, paths, cookie, deadline, latencies, errors)
+             for _ in range(args.concurrency)]
+    if pids:
+        tasks.append(sample_memory(pids, deadline, peak))
+    start = time.perf_counter()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    pct = lambda p: latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000
+    print(f"{args.url} concurrency={args.concurrency} requests={len(latencies)} errors={len(errors)}")
+    print(f"throughput={len(latencies) / elapsed:.0f} req/s "
+          f"p50={pct(0.50):.1f}ms p95={pct(0.95):.1f}ms p99={pct(0.99):.1f}ms")
+    if pids:
+        print(f"rss idle={idle / 1024:.1f}MB peak={peak[0] / 1024:.1f}MB "
+              f"per concurrent request={(peak[0] - idle) / args.concurrency:.1f}kB")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--paths', default='/api/products,/api/cart')
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--email')
+    parser.add_argument('--password')
+    parser.add_argument('--server-pid', help='comma-separated server process ids for memory sampling')
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+# benchmarks/backend_bench.py
+# Runs the same DAO workloads on each storage backend and prints them side by
+# side. Each backend runs in its own process because DB_BACKEND is read at
+# import. Caches are disabled so every call reaches the database.
+#
+#   python benchmarks/backend_bench.py --backends mysql,sqlite --products 5000 --ops 2000 --threads 4
+#
+# mysql uses DB_HOST/DB_USER/DB_PASSWORD/DB_NAME (a scratch database: rows are
+# added); sqlite uses a fresh temporary file unless SQLITE_PATH is set.
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+WORKLOADS = ('product_by_id', 'catalog_page', 'cart_add', 'cart_read', 'checkout')
+
+def run_worker(args):
+    """Seed, run every workload and print one JSON line of results."""
+    from flask import Flask
+    from db import get_db, close_db
+    from migrations import migrate
+    from search_bench import make_catalog
+    from product_dao import get_product_by_id, get_products_page
+    from cart_dao import add_to_cart, get_cart
+    from order_dao import checkout
+
+    app = Flask(__name__)
+    app.teardown_appcontext(close_db)
+    with app.app_context():
+        db = get_db()
+        migrate(db)
+        cursor = db.cursor()
+        rows = [(p['name'], p['description'], p['price'], 10 ** 6) for p in make_catalog(args.products, args.seed)]
+        cursor.executemany("INSERT INTO products (name, description, price, stock) VALUES (%s, %s, %s, %s)", rows)
+        cursor.execute("SELECT product_id FROM products")
+        ids = [product_id for (product_id,) in cursor.fetchall()]
+        user_ids = []
+        for i in range(args.threads):
+            cursor.execute("INSERT INTO users (name, email, password, role) VALUES (%s, %s, 'x', 'customer')",
+                           (f"backend-bench{i}", f"backend-bench-{time.time_ns()}-{i}@example.com"))
+            user_ids.append(cursor.lastrowid)
+        db.commit()
+        cursor.close()
+
+    operations = {
+        'product_by_id': lambda rng, user_id: get_product_by_id(rng.choice(ids)),
+        'catalog_page': lambda rng, user_id: get_products_page(None, 24, rng.choice(('price', 'name', 'newest'))),
+        'cart_add': lambda rng, user_id: add_to_cart(user_id, rng.choice(ids), 1),
+        'cart_read': lambda rng, user_id: get_cart(user_id),
+        'checkout': lambda rng, user_id: (add_to_cart(user_id, rng.choice(ids), 1),
+                                          checkout(user_id, '1 Bench Street', 'card')),
+    }
+
+    def worker(name, index, latencies):
+        rng = random.Random(args.seed + index)
+        user_id = user_ids[index]
+        for _ in range(args.ops // args.threads):
+            start = time.perf_counter()
+            with app.app_context():
+                operations[name](rng, user_id)
+            latencies.append(time.perf_counter() - start)
+
+    results = {}
+    for name in WORKLOADS:
+        latencies = []
+        threads = [threading.Thread(target=worker, args=(name, i, latencies)) for i in range(args.threads)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        latencies.sort()
+        pct = lambda p: latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000
+        results[name] = {'ops_per_sec': len(latencies) / elapsed, 'p50_ms': pct(0.50), 'p95_ms': pct(0.95)}
+    print(json.dumps(results))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backends', default='mysql,sqlite')
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--ops', type=int, default=2000, help='calls per workload, split across threads')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backends.split(','):
+            env = dict(os.environ, DB_BACKEND=backend, CATALOG_CACHE_TTL='0', USER_CACHE_TTL='0',
+                       CART_BACKEND='mysql', DB_POOL_SIZE=str(args.threads))
+            if backend == 'sqlite':
+                env.setdefault('SQLITE_PATH', os.path.join(tmp, 'bench.sqlite3'))
+            out = subprocess.run([sys.executable, __file__, '--worker'] + sys.argv[1:],
+                                 env=env, capture_output=True, text=True)
+            if out.returncode != 0:
+                print(f"{backend} failed:\n{out.stderr}")
+                continue
+            report[backend] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    backends = list(report)
+    print(f"products={args.products} ops={args.ops} threads={args.threads}")
+    print(f"{'workload':<15}" + "".join(f"{b + ' ops/s':>16}{'p50 ms':>9}{'p95 ms':>9}" for b in backends))
+    for name in WORKLOADS:
+        row = f"{name:<15}"
+        for backend in backends:
+            r = report[backend][name]
+            row += f"{r['ops_per_sec']:>16.0f}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}"
+        print(row)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# benchmarks/cart_bench.py
+# Cart pricing micro-benchmark: the dict-row, float pricing loop get_cart used
+# for checkout against cart_dao.price_cart's tuple rows summed in paise. Rows
+# are built in memory the way mysql.connector returns them (Decimal prices;
+# dict rows for the dictionary cursor), so only the pricing is measured.
+#
+#   python benchmarks/cart_bench.py --lines 1,10,50,100,500
+#
+# Also counts random carts whose float total, as JSON would print it, is not
+# the exact amount.
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from cart_dao import to_minor, from_minor
+
+COLUMNS = ('product_id', 'quantity', 'name', 'price', 'description')
+
+def make_cart(lines, rng):
+    """Driver rows (product_id, quantity, name, price, description) for one cart."""
+    return [(i, rng.randint(1, 5), f"product {i}", Decimal(rng.randrange(100, 100000)).scaleb(-2),
+             "synthetic cart line") for i in range(1, lines + 1)]
+
+def float_pricing(rows):
+    items = [dict(zip(COLUMNS, row)) for row in rows]  # what dictionary=True builds per row
+    grand_total = 0.0
+    for item in items:
+        item['subtotal'] = float(item['price']) * item['quantity']
+        item['price'] = float(item['price'])
+        grand_total += item['subtotal']
+    return {'items': items, 'total': grand_total}
+
+def minor_pricing(rows):
+    lines, total = [], 0
+    for product_id, quantity, price in ((row[0], row[1], row[3]) for row in rows):
+        unit = to_minor(price)
+        lines.append((product_id, quantity, unit))
+        total += quantity * unit
+    return lines, total
+
+def per_call(fn, rows, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(rows)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+def peak_bytes(fn, rows):
+    tracemalloc.start()
+    fn(rows)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', default='1,10,50,100,500')
+    parser.add_argument('--repeat', type=int, default=2000)
+    parser.add_argument('--carts', type=int, default=1000, help='random carts checked for float drift')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    print(f"{'lines':>6} {'float us':>10} {'paise us':>10} {'float KiB':>10} {'paise KiB':>10}")
+    for lines in (int(n) for n in args.lines.split(',')):
+        rows = make_cart(lines, rng)
+        repeat = max(args.repeat // lines, 20)
+        print(f"{lines:>6} {per_call(float_pricing, rows, repeat):>10.1f} {per_call(minor_pricing, rows, repeat):>10.1f}"
+              f" {peak_bytes(float_pricing, rows) / 1024:>10.1f} {peak_bytes(minor_pricing, rows) / 1024:>10.1f}")
+
+    drift = 0
+    for _ in range(args.carts):
+        rows = make_cart(rng.randint(1, 50), rng)
+        exact = sum(row[3] * row[1] for row in rows)
+        assert from_minor(minor_pricing(rows)[1]) == exact
+        drift += Decimal(repr(float_pricing(rows)['total'])) != exact
+    print(f"float totals that print inexactly: {drift} of {args.carts} carts; paise totals: 0")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+# benchmarks/flow_bench.py
+# End-to-end benchmark of the shopper flows: runs app.py in-process through
+# Flask test clients (one per simulated shopper thread) against the database
+# configured through DB_HOST/DB_USER/DB_PASSWORD/DB_NAME (or an SQLite file
+# with DB_BACKEND=sqlite SQLITE_PATH=...), and reports throughput, latency
+# percentiles and DB statements per request for each flow.
+#
+#   python benchmarks/flow_bench.py --seed --products 20000 --users 200
+#   python benchmarks/flow_bench.py --threads 16 --duration 60 --save-baseline baseline.json
+#   ... change something ...
+#   python benchmarks/flow_bench.py --threads 16 --duration 60 --baseline baseline.json
+#
+# Flows:  browse    GET /home
+#         search    GET /search?query=...
+#         cart      POST /api/cart/add, GET /api/cart
+#         checkout  POST /api/cart/add, POST /api/checkout
+# --mix sets their relative weights; --random-seed makes a run reproducible.
+# Use a scratch database: --seed adds bench products and users, checkout
+# writes orders and takes stock.
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from werkzeug.security import generate_password_hash
+from db import get_pool
+from migrations import migrate
+from password_hasher import HASH_METHOD
+import metrics
+from search_bench import make_catalog, QUERIES
+
+BENCH_PASSWORD = 'bench-password'
+DEFAULT_MIX = 'browse=55,search=25,cart=15,checkout=5'
+
+def seed(products, users, rng_seed):
+    """Add a synthetic catalog and bench users; returns nothing, prints counts."""
+    pool = get_pool()
+    db = pool.acquire()
+    cursor = db.cursor()
+    try:
+        migrate(db)
+        rows = [(p['name'], p['description'], p['price'], 10 ** 6) for p in make_catalog(products, rng_seed)]
+        for i in range(0, len(rows), 1000):
+            cursor.executemany("INSERT INTO products (name, description, price, stock) VALUES (%s, %s, %s, %s)",
+                               rows[i:i + 1000])
+        # Every bench user shares one hash, so seeding costs a single hash.
+        password = generate_password_hash(BENCH_PASSWORD, HASH_METHOD)
+        cursor.executemany(
+            "INSERT IGNORE INTO users (name, email, password, role) VALUES (%s, %s, %s, 'customer')",
+            [(f"bench{i}", f"bench{i}@example.com", password) for i in range(users)])
+        db.commit()
+    finally:
+        cursor.close()
+        pool.release(db)
+    print(f"Seeded {products} products and {users} users")
+
+def product_ids():
+    pool = get_pool()
+    db = pool.acquire()
+    cursor = db.cursor()
+    try:
+        cursor.execute("SELECT product_id FROM products")
+        return [product_id for (product_id,) in cursor.fetchall()]
+    finally:
+        cursor.close()
+        pool.release(db)
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        mix[name.strip()] = float(weight)
+    unknown = set(mix) - set(FLOWS)
+    if unknown:
+        raise SystemExit(f"Unknown flows in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+def _browse(client, rng, ids):
+    return [client.get('/home')]
+
+def _search(client, rng, ids):
+    return [client.get('/search', query_string={'query': rng.choice(QUERIES)})]
+
+def _cart(client, rng, ids):
+    return [client.post('/api/cart/add', json={'product_id': rng.choice(ids), 'quantity': rng.randint(1, 3)}),
+            client.get('/api/cart')]
+
+def _checkout(client, rng, ids):
+    return [client.post('/api/cart/add', json={'product_id': rng.choice(ids), 'quantity': 1}),
+            client.post('/api/checkout', json={'delivery_address': '1 Bench Street', 'payment_method': 'card'})]
+
+FLOWS = {'browse': _browse, 'search': _search, 'cart': _cart, 'checkout': _checkout}
+
+_local = threading.local()
+
+def _count_query(seconds):
+    _local.queries = getattr(_local, 'queries', 0) + 1
+
+def logged_in_client(app, user_index):
+    client = app.test_client()
+    login = client.post('/api/login', json={'email': f"bench{user_index}@example.com", 'password': BENCH_PASSWORD})
+    if login.status_code != 200:
+        raise SystemExit(f"bench{user_index}@example.com could not log in; run with --seed first")
+    return client
+
+def shopper(client, rng, mix, ids, deadline, results, lock):
+    names, weights = list(mix), list(mix.values())
+    samples = {name: [] for name in names}
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        _local.queries = 0
+        start = time.perf_counter()
+        responses = FLOWS[name](client, rng, ids)
+        elapsed = time.perf_counter() - start
+        ok = all(r.status_code < 400 or r.status_code == 409 for r in responses)  # 409: sold out
+        samples[name].append((elapsed, _local.queries, len(responses), ok))
+    with lock:
+        for name, flow_samples in samples.items():
+            results.setdefault(name, []).extend(flow_samples)
+
+def summarize(results, elapsed):
+    report = {}
+    for name, samples in sorted(results.items()):
+        if not samples:
+            continue
+        latencies = sorted(s[0] for s in samples)
+        pct = lambda p: latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000
+        requests = sum(s[2] for s in samples)
+        report[name] = {
+            'flows': len(samples),
+            'flows_per_sec': len(samples) / elapsed,
+            'p50_ms': pct(0.50), 'p95_ms': pct(0.95), 'p99_ms': pct(0.99),
+            'queries_per_request': sum(s[1] for s in samples) / requests,
+            'errors': sum(1 for s in samples if not s[3]),
+        }
+    return report
+
+def print_report(report, baseline=None):
+    print(f"{'flow':<10}{'flows':>8}{'flows/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'q/req':>8}{'errors':>8}")
+    for name, r in report.items():
+        print(f"{name:<10}{r['flows']:>8}{r['flows_per_sec']:>10.1f}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}"
+              f"{r['p99_ms']:>9.1f}{r['queries_per_request']:>8.1f}{r['errors']:>8}")
+        base = (baseline or {}).get(name)
+        if base:
+            change = lambda key: (r[key] - base[key]) / base[key] * 100 if base[key] else 0.0
+            print(f"{'  vs base':<10}{'':>8}{change('flows_per_sec'):>+9.0f}%{change('p50_ms'):>+8.0f}%"
+                  f"{change('p95_ms'):>+8.0f}%{change('p99_ms'):>+8.0f}%{change('queries_per_request'):>+7.0f}%")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seed', action='store_true', help='add the synthetic catalog and bench users, then exit')
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--threads', type=int, default=8, help='concurrent shoppers, each a distinct bench user')
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--mix', default=DEFAULT_MIX)
+    parser.add_argument('--random-seed', type=int, default=42)
+    parser.add_argument('--baseline', help='JSON report from an earlier --save-baseline run to compare against')
+    parser.add_argument('--save-baseline', help='write this run\'s report as JSON')
+    args = parser.parse_args()
+
+    if args.seed:
+        seed(args.products, args.users, args.random_seed)
+        return
+    if args.threads > args.users:
+        raise SystemExit("--threads cannot exceed the number of seeded --users")
+
+    from app import app  # imported late so --seed works without the app's settings
+    mix = parse_mix(args.mix)
+    ids = product_ids()
+    if not metrics.DB_INSTRUMENT:
+        print("DB_INSTRUMENT=0: statement counts will read 0")
+    metrics.query_listeners.append(_count_query)
+    clients = [logged_in_client(app, i) for i in range(args.threads)]
+
+    results, lock = {}, threading.Lock()
+    deadline = time.perf_counter() + args.duration
+    threads = [threading.Thread(target=shopper, args=(client, random.Random(args.random_seed + i), mix, ids,
+                                                      deadline, results, lock))
+               for i, client in enumerate(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    report = summarize(results, time.perf_counter() - start)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print(f"threads={args.threads} duration={args.duration}s mix={args.mix}")
+    print_report(report, baseline)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
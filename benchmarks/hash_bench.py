@@ -0,0 +1,43 @@
+# benchmarks/hash_bench.py
+# Logins per second per core for a password hash method, verified through the
+# password_hasher process pool from many request threads at once.
+#
+#   python benchmarks/hash_bench.py --method pbkdf2:sha256:600000 --workers 4 --logins 400
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--method', default='pbkdf2:sha256:600000')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=32, help='concurrent request threads')
+    args = parser.parse_args()
+
+    # password_hasher reads its settings at import time.
+    os.environ['PASSWORD_HASH_METHOD'] = args.method
+    os.environ['PASSWORD_HASH_WORKERS'] = str(args.workers)
+    os.environ['PASSWORD_HASH_QUEUE'] = str(args.threads)
+    import password_hasher
+
+    stored = password_hasher.hash_password('correct horse battery staple')
+    password_hasher.verify_password(stored, 'warm up the pool')
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        results = list(pool.map(lambda _: password_hasher.verify_password(stored, 'correct horse battery staple'),
+                                range(args.logins)))
+    elapsed = time.perf_counter() - start
+
+    assert all(results)
+    rate = args.logins / elapsed
+    print(f"method={args.method} workers={args.workers} logins={args.logins} elapsed={elapsed:.2f}s")
+    print(f"logins/sec={rate:.1f} logins/sec/core={rate / args.workers:.1f}")
+
+if __name__ == '__main__':
+    main()
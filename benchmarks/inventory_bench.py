@@ -0,0 +1,82 @@
+# benchmarks/inventory_bench.py
+# Many concurrent checkouts contending for the same SKU, each taking stock with
+# inventory_dao.reserve_stock in its own transaction. Needs the MySQL database
+# configured through DB_HOST/DB_USER/DB_PASSWORD/DB_NAME with db.init_db applied.
+#
+#   python benchmarks/inventory_bench.py --threads 32 --stock 5000 --orders 10000
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import mysql.connector
+from db import MYSQL_CONFIG
+from inventory_dao import reserve_stock, OutOfStock
+
+def worker(product_id, user_id, orders, results, lock):
+    conn = mysql.connector.connect(**MYSQL_CONFIG)
+    cursor = conn.cursor()
+    sold = rejected = 0
+    latencies = []
+    for _ in range(orders):
+        start = time.perf_counter()
+        try:
+            reserve_stock(cursor, user_id, [(product_id, 1)])
+            conn.commit()
+            sold += 1
+        except OutOfStock:
+            conn.rollback()
+            rejected += 1
+        latencies.append(time.perf_counter() - start)
+    cursor.close()
+    conn.close()
+    with lock:
+        results['sold'] += sold
+        results['rejected'] += rejected
+        results['latencies'].extend(latencies)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--stock', type=int, default=5000)
+    parser.add_argument('--orders', type=int, default=10000, help='total checkout attempts')
+    parser.add_argument('--user-id', type=int, default=0, help='user with no stock holds')
+    args = parser.parse_args()
+
+    conn = mysql.connector.connect(**MYSQL_CONFIG)
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO products (name, description, price, stock) VALUES ('bench onion', 'contended SKU', 10, %s)",
+                   (args.stock,))
+    product_id = cursor.lastrowid
+    conn.commit()
+
+    results = {'sold': 0, 'rejected': 0, 'latencies': []}
+    lock = threading.Lock()
+    per_thread = args.orders // args.threads
+    threads = [threading.Thread(target=worker, args=(product_id, args.user_id, per_thread, results, lock))
+               for _ in range(args.threads)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    cursor.execute("SELECT stock FROM products WHERE product_id = %s", (product_id,))
+    remaining = cursor.fetchone()[0]
+    cursor.execute("DELETE FROM products WHERE product_id = %s", (product_id,))
+    conn.commit()
+    conn.close()
+
+    latencies = sorted(results['latencies'])
+    pct = lambda p: latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000
+    print(f"threads={args.threads} attempts={len(latencies)} elapsed={elapsed:.2f}s "
+          f"throughput={len(latencies) / elapsed:.0f}/s")
+    print(f"sold={results['sold']} rejected={results['rejected']} remaining_stock={remaining} "
+          f"oversold={'yes' if remaining < 0 or results['sold'] > args.stock else 'no'}")
+    print(f"latency p50={pct(0.50):.2f}ms p95={pct(0.95):.2f}ms p99={pct(0.99):.2f}ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# benchmarks/search_bench.py
+# Compares the in-process inverted index against a LIKE '%term%' style linear scan
+# on synthetic catalogs.
+#
+#   python benchmarks/search_bench.py --sizes 10000,100000,1000000
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from search_index import InvertedIndex
+
+WORDS = ["onion", "potato", "tomato", "apple", "banana", "kiwi", "milk", "bread", "carrot",
+         "lettuce", "chicken", "rice", "flour", "sugar", "butter", "paneer", "mango", "orange",
+         "spinach", "garlic", "ginger", "fresh", "organic", "red", "green", "sweet", "farm", "local"]
+QUERIES = ["onion", "fresh tom", "org", "sweet mango", "farm chicken", "pan", "brand12", "kiwi brand7"]
+
+def make_catalog(size, seed=42):
+    rng = random.Random(seed)
+    return [{
+        'id': i,
+        'name': f"brand{rng.randrange(max(size // 20, 1))} {rng.choice(WORDS)} {rng.choice(WORDS)}",
+        'description': " ".join(rng.choice(WORDS) for _ in range(8)),
+        'price': round(rng.uniform(5, 500), 2),
+    } for i in range(1, size + 1)]
+
+def like_scan(products, query, limit):
+    term = query.lower()
+    hits = [p for p in products if term in p['name'].lower() or term in p['description'].lower()]
+    return hits[:limit], len(hits)
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'products':>10} {'build s':>9} {'index ms/q':>11} {'scan ms/q':>10}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        products = make_catalog(size)
+
+        start = time.perf_counter()
+        index = InvertedIndex()
+        for product in products:
+            index.add(product)
+        build = time.perf_counter() - start
+
+        index_ms = sum(timed(lambda q=q: index.search(q, 20), args.repeat) for q in QUERIES) / len(QUERIES)
+        scan_ms = sum(timed(lambda q=q: like_scan(products, q, 20), args.repeat) for q in QUERIES) / len(QUERIES)
+        print(f"{size:>10} {build:>9.2f} {index_ms:>11.2f} {scan_ms:>10.2f}")
+
+if __name__ == '__main__':
+    main()
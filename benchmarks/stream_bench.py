@@ -0,0 +1,92 @@
+# benchmarks/stream_bench.py
+# Peak memory of serving the whole catalog buffered (fetchall + jsonify, the
+# way the paged endpoints build a response) against GET /api/products?stream=
+# json|ndjson, at growing row counts. Streamed peaks should stay flat while
+# the buffered peak grows with the table.
+#
+#   DB_BACKEND=sqlite SQLITE_PATH=/tmp/stream.sqlite3 python benchmarks/stream_bench.py --sizes 1000,10000,100000
+#
+# Memory is Python allocations traced by tracemalloc, net of what was live
+# before the request. Rows are added to the configured database up to each
+# size, so use a scratch one.
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('CATALOG_CACHE_TTL', '0')  # every request reads the database
+from db import get_db
+from migrations import migrate
+from search_bench import make_catalog
+
+def grow_catalog(app, size, seed):
+    """Insert synthetic products until the table holds at least size rows."""
+    with app.app_context():
+        db = get_db()
+        migrate(db)
+        cursor = db.cursor()
+        try:
+            cursor.execute("SELECT COUNT(*) FROM products")
+            (count,) = cursor.fetchone()
+            rows = [(p['name'], p['description'], p['price'], 100) for p in make_catalog(size - count, seed + count)]
+            for i in range(0, len(rows), 1000):
+                cursor.executemany("INSERT INTO products (name, description, price, stock) VALUES (%s, %s, %s, %s)",
+                                   rows[i:i + 1000])
+            db.commit()
+        finally:
+            cursor.close()
+
+def measure(fn):
+    """(seconds, peak bytes above the starting level, response bytes) for one call."""
+    base = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    size = fn()
+    elapsed = time.perf_counter() - start
+    return elapsed, tracemalloc.get_traced_memory()[1] - base, size
+
+def buffered(app):
+    from flask import jsonify
+    from product_dao import attach_images, catalog_query
+
+    with app.test_request_context('/api/products'):
+        cursor = get_db().cursor(dictionary=True)
+        try:
+            cursor.execute(catalog_query('id'))
+            products = attach_images(cursor.fetchall())
+        finally:
+            cursor.close()
+        return len(jsonify({"products": products}).get_data())
+
+def streamed(client, fmt):
+    response = client.get('/api/products', query_string={'stream': fmt}, buffered=False)
+    try:
+        return sum(len(chunk) for chunk in response.response)
+    finally:
+        response.close()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    from app import app  # imported after CATALOG_CACHE_TTL is set
+    client = app.test_client()
+    tracemalloc.start()
+    print(f"{'rows':>8} {'response MB':>12}" + "".join(f"{m + ' ms':>14}{m + ' peak MB':>17}"
+                                                       for m in ('buffered', 'json', 'ndjson')))
+    for size in (int(s) for s in args.sizes.split(',')):
+        grow_catalog(app, size, args.seed)
+        results = [measure(lambda: buffered(app)),
+                   measure(lambda: streamed(client, 'json')),
+                   measure(lambda: streamed(client, 'ndjson'))]
+        row = f"{size:>8} {results[0][2] / 2 ** 20:>12.1f}"
+        for elapsed, peak, _ in results:
+            row += f"{elapsed * 1000:>14.0f}{peak / 2 ** 20:>17.2f}"
+        print(row)
+
+if __name__ == '__main__':
+    main()
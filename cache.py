@@ -0,0 +1,81 @@
+# cache.py
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a fixed time-to-live.
+
+    The cache is per process, so other workers only see a write once their own
+    copy is invalidated or its entry expires.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value), oldest first
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0}
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return default
+            self._data.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[1] if entry else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, size=len(self._data), maxsize=self.maxsize)
+
+class FragmentCache:
+    """Cache for rendered template fragments that records how much render time it saved."""
+
+    def __init__(self, maxsize=512, ttl=300):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._saved = 0.0
+
+    def render(self, key, render):
+        """Return the fragment for key, calling render() only on a miss."""
+        entry = self._cache.get(key)
+        if entry is not None:
+            html, cost = entry
+            with self._lock:
+                self._saved += cost
+            return html
+        start = time.perf_counter()
+        html = render()
+        self._cache.set(key, (html, time.perf_counter() - start))
+        return html
+
+    def stats(self):
+        with self._lock:
+            saved = self._saved
+        return dict(self._cache.stats(), render_ms_saved=round(saved * 1000, 1))
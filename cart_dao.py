@@ -1,28 +1,129 @@
 # cart_dao.py
-from db import get_db
+import os
+from decimal import Decimal
+from db import get_db, get_pool
+from metrics import timed
+from cart_store import WriteBehindCart, create_cart_store
+from inventory_dao import check_quantity
+from product_dao import get_products_by_ids, attach_images
 
+# A single atomic statement: the unique_user_product key turns a repeat add into
+# a quantity increment, so concurrent adds cannot lose updates.
+UPSERT_CART_ITEM = """
+    INSERT INTO cart (user_id, product_id, quantity) VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity)
+"""
+
+# Cart lines with their prices, as price_cart and checkout read them.
+SELECT_CART_LINES = """
+    SELECT c.product_id, c.quantity, p.price
+    FROM cart c
+    JOIN products p ON c.product_id = p.product_id
+    WHERE c.user_id = %s
+"""
+SELECT_CART_ITEMS = """
+    SELECT c.product_id, c.quantity, p.name, p.price, p.description
+    FROM cart c
+    JOIN products p ON c.product_id = p.product_id
+    WHERE c.user_id = %s
+"""
+SELECT_CART_QUANTITIES = "SELECT product_id, quantity FROM cart WHERE user_id = %s"
+DELETE_CARTS = "DELETE FROM cart WHERE user_id IN ({placeholders})"
+DELETE_CART_ITEM = "DELETE FROM cart WHERE user_id = %s AND product_id = %s"
+CLEAR_CART = "DELETE FROM cart WHERE user_id = %s"
+
+@timed
+def _load_cart(user_id):
+    """{product_id: quantity} for a user's cart as stored in MySQL."""
+    db = get_db()
+    cursor = db.cursor()
+    try:
+        cursor.execute(SELECT_CART_QUANTITIES, (user_id,))
+        return dict(cursor.fetchall())
+    finally:
+        cursor.close()
+
+@timed
+def _persist_carts(carts):
+    """Replace the MySQL rows of a batch of carts in one transaction.
+
+    Runs on the flusher thread, outside any request, so it checks its own
+    connection out of the pool.
+    """
+    pool = get_pool()
+    db = pool.acquire()
+    cursor = db.cursor()
+    try:
+        placeholders = ", ".join(["%s"] * len(carts))
+        cursor.execute(DELETE_CARTS.format(placeholders=placeholders), list(carts))
+        rows = [(user_id, product_id, quantity)
+                for user_id, items in carts.items()
+                for product_id, quantity in items.items() if quantity > 0]
+        if rows:
+            # IGNORE skips products deleted since they were added, instead of failing the batch.
+            cursor.executemany("INSERT IGNORE INTO cart (user_id, product_id, quantity) VALUES (%s, %s, %s)", rows)
+        db.commit()
+    finally:
+        cursor.close()
+        pool.release(db)
+
+# CART_BACKEND=memory|redis serves carts from a hot store and writes them to the
+# cart table in batches; the default keeps every change a direct MySQL commit.
+# memory is for a single worker process; several workers need redis.
+_store = create_cart_store(os.getenv('CART_BACKEND', 'mysql'), os.getenv('REDIS_URL'))
+write_behind = WriteBehindCart(
+    _store, _load_cart, _persist_carts,
+    flush_interval=float(os.getenv('CART_FLUSH_INTERVAL', 2)),
+    batch_size=int(os.getenv('CART_FLUSH_BATCH', 200)),
+) if _store is not None else None
+
+MAX_BATCH_ITEMS = 200
+
+# Cart money is handled in integer minor units (paise). A DECIMAL(10,2) price
+# converts exactly whether the driver returns a Decimal (mysql.connector) or a
+# float (sqlite3), and totals are integer sums with no rounding drift.
+def to_minor(price):
+    """Integer paise for a DECIMAL(10,2) price."""
+    return round(price * 100)
+
+def from_minor(amount):
+    """Exact Decimal rupees for an amount in paise, for DECIMAL columns."""
+    return Decimal(amount).scaleb(-2)
+
+def parse_cart_item(product_id, quantity):
+    """Validate one product_id and JSON quantity; the quantity must be a positive integer.
+
+    Raises ValueError with a message fit for the API response.
+    """
+    if not product_id or isinstance(quantity, bool) or not isinstance(quantity, int) or quantity < 1:
+        raise ValueError("Each item needs a product_id and a positive quantity")
+    return product_id, quantity
+
+def parse_cart_items(raw_items):
+    """Validate a JSON list of {product_id, quantity} objects into (product_id, quantity) pairs.
+
+    Raises ValueError with a message fit for the API response.
+    """
+    if not isinstance(raw_items, list) or not raw_items:
+        raise ValueError("A non-empty list of items is required")
+    if len(raw_items) > MAX_BATCH_ITEMS:
+        raise ValueError(f"At most {MAX_BATCH_ITEMS} items per request")
+    items = []
+    for item in raw_items:
+        if not isinstance(item, dict):
+            raise ValueError("Each item needs a product_id and a positive quantity")
+        items.append(parse_cart_item(item.get('product_id'), item.get('quantity', 1)))
+    return items
+
+@timed
 def add_to_cart(user_id, product_id, quantity=1):
     """Adds a product to the user's cart or updates the quantity if it already exists."""
+    if write_behind is not None:
+        return add_many_to_cart(user_id, [(product_id, quantity)])
     db = get_db()
     cursor = db.cursor()
     try:
-        cursor.execute(
-            "SELECT quantity FROM cart WHERE user_id = %s AND product_id = %s",
-            (user_id, product_id)
-        )
-        existing_quantity = cursor.fetchone()
-
-        if existing_quantity:
-            new_quantity = existing_quantity[0] + quantity
-            cursor.execute(
-                "UPDATE cart SET quantity = %s WHERE user_id = %s AND product_id = %s",
-                (new_quantity, user_id, product_id)
-            )
-        else:
-            cursor.execute(
-                "INSERT INTO cart (user_id, product_id, quantity) VALUES (%s, %s, %s)",
-                (user_id, product_id, quantity)
-            )
+        cursor.execute(UPSERT_CART_ITEM, (user_id, product_id, quantity))
         db.commit()
         return True
     except Exception as e:
@@ -32,42 +133,136 @@ def add_to_cart(user_id, product_id, quantity=1):
     finally:
         cursor.close()
 
+@timed
+def add_many_to_cart(user_id, items):
+    """Adds several (product_id, quantity) pairs to the cart in one transaction."""
+    if write_behind is not None:
+        try:
+            write_behind.add(user_id, items)
+            return True
+        except Exception as e:
+            print(f"Error adding items to cart: {e}")
+            return False
+    db = get_db()
+    cursor = db.cursor()
+    try:
+        cursor.executemany(UPSERT_CART_ITEM, [(user_id, product_id, quantity) for product_id, quantity in items])
+        db.commit()
+        return True
+    except Exception as e:
+        db.rollback()
+        print(f"Error adding items to cart: {e}")
+        return False
+    finally:
+        cursor.close()
+
+@timed
+def price_cart(user_id):
+    """(lines, total) for a user's cart, in paise: what checkout needs and nothing more.
+
+    lines are (product_id, quantity, unit_price) tuples read from a tuple
+    cursor, without the per-row dicts, descriptions and images of get_cart.
+    Raises ValueError if a line's quantity is below 1, so it cannot lower the total.
+    """
+    if write_behind is not None:
+        return _price_cached_cart(user_id)
+    db = get_db()
+    cursor = db.cursor()
+    try:
+        cursor.execute(SELECT_CART_LINES, (user_id,))
+        lines, total = [], 0
+        for product_id, quantity, price in cursor.fetchall():
+            check_quantity(product_id, quantity)
+            unit = to_minor(price)
+            lines.append((product_id, quantity, unit))
+            total += quantity * unit
+        return lines, total
+    except ValueError:
+        raise
+    except Exception as e:
+        print(f"Error pricing cart: {e}")
+        return [], 0
+    finally:
+        cursor.close()
+
+def _price_cached_cart(user_id):
+    """price_cart for the hot store: quantities from the store, prices from the catalog cache."""
+    try:
+        quantities = write_behind.items(user_id)
+        lines, total = [], 0
+        for product in get_products_by_ids(list(quantities)):
+            quantity, unit = quantities[product['id']], to_minor(product['price'])
+            check_quantity(product['id'], quantity)
+            lines.append((product['id'], quantity, unit))
+            total += quantity * unit
+        return lines, total
+    except ValueError:
+        raise
+    except Exception as e:
+        print(f"Error pricing cart: {e}")
+        return [], 0
+
+@timed
 def get_cart(user_id):
-    """Retrieves all products in a user's cart, joining with product details."""
+    """Retrieves all products in a user's cart, joining with product details.
+
+    Prices and subtotals are summed in paise; the float rupee fields are for
+    display and total_minor is the exact total.
+    """
+    if write_behind is not None:
+        return _get_cached_cart(user_id)
     db = get_db()
     cursor = db.cursor(dictionary=True)
     try:
-        query = """
-            SELECT c.product_id, c.quantity, p.name, p.price, p.description, p.image_url
-            FROM cart c
-            JOIN products p ON c.product_id = p.product_id
-            WHERE c.user_id = %s
-        """
-        cursor.execute(query, (user_id,))
-        items = cursor.fetchall()
+        cursor.execute(SELECT_CART_ITEMS, (user_id,))
+        items = attach_images(cursor.fetchall(), id_key='product_id')
         
-        grand_total = 0.0
+        grand_total = 0
         for item in items:
-            item['subtotal'] = float(item['price']) * item['quantity']
-            item['price'] = float(item['price'])
-            grand_total += item['subtotal']
+            unit = to_minor(item['price'])
+            item['price'] = unit / 100
+            item['subtotal'] = unit * item['quantity'] / 100
+            grand_total += unit * item['quantity']
         
-        return {'items': items, 'total': grand_total}
+        return {'items': items, 'total': grand_total / 100, 'total_minor': grand_total}
     except Exception as e:
         print(f"Error getting cart: {e}")
-        return {'items': [], 'total': 0.0}
+        return {'items': [], 'total': 0.0, 'total_minor': 0}
     finally:
         cursor.close()
 
+def _get_cached_cart(user_id):
+    """get_cart for the hot store: quantities from the store, details from the catalog cache."""
+    try:
+        quantities = write_behind.items(user_id)
+        items = []
+        grand_total = 0
+        for product in get_products_by_ids(list(quantities)):
+            quantity, unit = quantities[product['id']], to_minor(product['price'])
+            items.append({
+                'product_id': product['id'], 'quantity': quantity, 'name': product['name'],
+                'price': unit / 100, 'subtotal': unit * quantity / 100, 'description': product['description'],
+                'image_url': product['image_url'], 'image_srcset': product['image_srcset'],
+            })
+            grand_total += unit * quantity
+        return {'items': items, 'total': grand_total / 100, 'total_minor': grand_total}
+    except Exception as e:
+        print(f"Error getting cart: {e}")
+        return {'items': [], 'total': 0.0, 'total_minor': 0}
+
+@timed
 def remove_from_cart(user_id, product_id):
     """Removes a single product from the user's cart."""
+    if write_behind is not None:
+        try:
+            return write_behind.remove(user_id, product_id)
+        except Exception as e:
+            print(f"Error removing from cart: {e}")
+            return False
     db = get_db()
     cursor = db.cursor()
     try:
-        cursor.execute(
-            "DELETE FROM cart WHERE user_id = %s AND product_id = %s",
-            (user_id, product_id)
-        )
+        cursor.execute(DELETE_CART_ITEM, (user_id, product_id))
         db.commit()
         return cursor.rowcount > 0
     except Exception as e:
@@ -77,12 +272,20 @@ def remove_from_cart(user_id, product_id):
     finally:
         cursor.close()
 
+@timed
 def clear_cart(user_id):
     """Deletes all items from the user's cart."""
+    if write_behind is not None:
+        try:
+            write_behind.clear(user_id)
+            return True
+        except Exception as e:
+            print(f"Error clearing cart: {e}")
+            return False
     db = get_db()
     cursor = db.cursor()
     try:
-        cursor.execute("DELETE FROM cart WHERE user_id = %s", (user_id,))
+        cursor.execute(CLEAR_CART, (user_id,))
         db.commit()
         return True
     except Exception as e:
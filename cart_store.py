@@ -0,0 +1,245 @@
+# cart_store.py
+import atexit
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # only needed for CART_BACKEND=redis
+    redis = None
+
+class MemoryCartStore:
+    """Carts kept in process memory, for a single worker process only.
+
+    Each worker would hold its own copy of a cart and overwrite the others'
+    changes when it flushes; run several workers with CART_BACKEND=redis.
+    Changes not yet flushed are lost if the process dies, so the flush
+    interval bounds how many clicks a crash can drop.
+    """
+
+    def __init__(self, max_carts=100000):
+        self.max_carts = max_carts
+        self._carts = OrderedDict()   # user_id -> {product_id: quantity}, least recently used first
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def load(self, user_id):
+        with self._lock:
+            cart = self._carts.get(user_id)
+            if cart is None:
+                return None
+            self._carts.move_to_end(user_id)
+            return dict(cart)
+
+    def put(self, user_id, items):
+        """Cache a cart read from MySQL; it is clean, so nothing is flushed."""
+        with self._lock:
+            self._carts[user_id] = dict(items)
+            self._evict()
+
+    def incr(self, user_id, items):
+        with self._lock:
+            cart = self._carts.setdefault(user_id, {})
+            for product_id, quantity in items:
+                cart[product_id] = cart.get(product_id, 0) + quantity
+            self._carts.move_to_end(user_id)
+            self._dirty.add(user_id)
+
+    def delete_item(self, user_id, product_id):
+        with self._lock:
+            removed = self._carts.get(user_id, {}).pop(product_id, None) is not None
+            if removed:
+                self._dirty.add(user_id)
+            return removed
+
+    def clear(self, user_id):
+        with self._lock:
+            self._carts[user_id] = {}
+            self._dirty.add(user_id)
+            self._evict()
+
+    def take_dirty(self, limit):
+        """Pop up to limit dirty carts with a snapshot of their contents."""
+        with self._lock:
+            batch = {}
+            while self._dirty and len(batch) < limit:
+                user_id = self._dirty.pop()
+                batch[user_id] = dict(self._carts.get(user_id, {}))
+            return batch
+
+    def mark_dirty(self, user_ids):
+        with self._lock:
+            self._dirty.update(user_id for user_id in user_ids if user_id in self._carts)
+
+    def dirty_count(self):
+        return len(self._dirty)
+
+    def _evict(self):
+        # Only clean carts may be dropped; dirty ones still owe MySQL a write.
+        for user_id in list(self._carts):
+            if len(self._carts) <= self.max_carts:
+                break
+            if user_id not in self._dirty:
+                del self._carts[user_id]
+
+class RedisCartStore:
+    """Carts kept in Redis hashes, shared by all workers.
+
+    The dirty set lives in Redis too, so after a restart the flusher still
+    writes carts changed before the crash.
+    """
+
+    LOADED = '__loaded__'   # marks a hash as holding the full cart, even when empty
+    DIRTY_KEY = 'cart:dirty'
+
+    def __init__(self, url, ttl=7 * 24 * 3600):
+        if redis is None:
+            raise RuntimeError("CART_BACKEND=redis requires the redis package")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def _key(self, user_id):
+        return f"cart:{user_id}"
+
+    def load(self, user_id):
+        raw = self.client.hgetall(self._key(user_id))
+        if not raw:
+            return None
+        return {int(k): int(v) for k, v in raw.items() if k.decode() != self.LOADED}
+
+    def put(self, user_id, items):
+        key = self._key(user_id)
+        pipe = self.client.pipeline()
+        pipe.delete(key)
+        pipe.hset(key, mapping={self.LOADED: 1, **items})
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def incr(self, user_id, items):
+        key = self._key(user_id)
+        pipe = self.client.pipeline()
+        for product_id, quantity in items:
+            pipe.hincrby(key, product_id, quantity)
+        pipe.hset(key, self.LOADED, 1)
+        pipe.expire(key, self.ttl)
+        pipe.sadd(self.DIRTY_KEY, user_id)
+        pipe.execute()
+
+    def delete_item(self, user_id, product_id):
+        removed = self.client.hdel(self._key(user_id), product_id)
+        if removed:
+            self.client.sadd(self.DIRTY_KEY, user_id)
+        return removed > 0
+
+    def clear(self, user_id):
+        self.put(user_id, {})
+        self.client.sadd(self.DIRTY_KEY, user_id)
+
+    def take_dirty(self, limit):
+        batch = {}
+        # Popping before reading means a write that lands mid-flush re-marks the cart.
+        for raw_id in self.client.spop(self.DIRTY_KEY, limit) or []:
+            user_id = int(raw_id)
+            batch[user_id] = self.load(user_id) or {}
+        return batch
+
+    def mark_dirty(self, user_ids):
+        if user_ids:
+            self.client.sadd(self.DIRTY_KEY, *user_ids)
+
+    def dirty_count(self):
+        return self.client.scard(self.DIRTY_KEY)
+
+class WriteBehindCart:
+    """Serves cart reads and writes from a hot store and persists them to MySQL in batches.
+
+    loader(user_id) reads a cart from MySQL on a store miss; persister(carts)
+    replaces the MySQL rows of every cart in a {user_id: {product_id: quantity}}
+    batch in one transaction.
+    """
+
+    def __init__(self, store, loader, persister, flush_interval=2.0, batch_size=200):
+        self.store = store
+        self.loader = loader
+        self.persister = persister
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._flusher = None
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()  # set when enough carts are dirty to flush early
+
+    def items(self, user_id):
+        cart = self.store.load(user_id)
+        if cart is None:
+            cart = {product_id: quantity for product_id, quantity in self.loader(user_id).items() if quantity > 0}
+            self.store.put(user_id, cart)
+        return cart
+
+    def add(self, user_id, items):
+        """Increment quantities; raises ValueError for a quantity below 1, before any change."""
+        items = [(int(product_id), quantity) for product_id, quantity in items]
+        for product_id, quantity in items:
+            if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity < 1:
+                raise ValueError(f"Invalid quantity {quantity!r} for product {product_id}")
+        self.items(user_id)  # make sure existing rows are counted before incrementing
+        self.store.incr(user_id, items)
+        self._after_write()
+
+    def remove(self, user_id, product_id):
+        self.items(user_id)
+        removed = self.store.delete_item(user_id, int(product_id))
+        self._after_write()
+        return removed
+
+    def clear(self, user_id):
+        self.store.clear(user_id)
+        self._after_write()
+
+    def flush(self):
+        """Write all dirty carts to MySQL. Returns the number of carts written."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                batch = self.store.take_dirty(self.batch_size)
+                if not batch:
+                    return written
+                try:
+                    self.persister(batch)
+                except Exception as e:
+                    self.store.mark_dirty(list(batch))
+                    print(f"Error flushing carts: {e}")
+                    return written
+                written += len(batch)
+
+    def _after_write(self):
+        if self._flusher is None:
+            self._start_flusher()
+        if self.store.dirty_count() >= self.batch_size:
+            self._wake.set()  # the one flusher thread picks it up; no thread per write
+
+    def _start_flusher(self):
+        # Started lazily so each forked worker gets its own thread.
+        with self._flush_lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._run, daemon=True)
+            self._flusher.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+def create_cart_store(kind, redis_url=None):
+    """Hot store for CART_BACKEND; None means carts are read and written in MySQL directly."""
+    if kind == 'memory':
+        # WEB_CONCURRENCY is the worker count gunicorn and most process managers read.
+        if int(os.getenv('WEB_CONCURRENCY', 1)) > 1:
+            raise RuntimeError("CART_BACKEND=memory supports a single worker; use CART_BACKEND=redis")
+        return MemoryCartStore()
+    if kind == 'redis':
+        return RedisCartStore(redis_url or 'redis://localhost:6379/0')
+    return None
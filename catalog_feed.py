@@ -0,0 +1,186 @@
+# catalog_feed.py
+# Bulk product import and export in CSV or JSON Lines. Both directions stream:
+# an import reads the feed row by row and upserts it in batches of
+# BULK_BATCH_SIZE rows per transaction; an export reads the table in keyset
+# batches. Neither holds the whole feed or table in memory.
+#
+# Columns: product_id (empty for a new product), name, description, price, stock.
+#
+#   python catalog_feed.py import supplier.csv
+#   python catalog_feed.py import stock.jsonl --batch-size 2000
+#   python catalog_feed.py export --format jsonl > products.jsonl
+#
+# The web app exposes the same pipeline at POST /api/products/bulk and
+# GET /api/products/export.
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from decimal import Decimal
+
+from product_dao import upsert_products, iter_products
+
+FEED_FIELDS = ('product_id', 'name', 'description', 'price', 'stock')
+FORMATS = ('csv', 'jsonl')
+BULK_BATCH_SIZE = int(os.getenv('BULK_BATCH_SIZE', 500))
+MAX_REPORTED_ERRORS = 1000  # later errors are counted but not listed
+
+def read_feed(stream, fmt):
+    """Yield (line number, row dict or None, parse error or None) from a text stream."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        missing = {'name', 'price'} - set(reader.fieldnames or ())
+        if missing:
+            raise ValueError(f"CSV header is missing {', '.join(sorted(missing))}")
+        for row in reader:
+            yield reader.line_num, row, None
+    elif fmt == 'jsonl':
+        for line_no, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_no, None, f"invalid JSON: {e}"
+                continue
+            if isinstance(row, dict):
+                yield line_no, row, None
+            else:
+                yield line_no, None, "expected a JSON object"
+    else:
+        raise ValueError(f"Unknown feed format '{fmt}'")
+
+def _whole_number(row, field, default):
+    """An integer column of a feed row; JSON 1.5 or true is rejected, not truncated."""
+    value = row.get(field)
+    if value in (None, ''):
+        return default
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f"invalid {field} {value!r}")
+    try:
+        return int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f"invalid {field} {value!r}")
+
+def parse_product(row):
+    """(product_id, name, description, price, stock) from a feed row; raises ValueError."""
+    name = str(row.get('name') or '').strip()
+    if not name:
+        raise ValueError("name is required")
+    try:
+        price = Decimal(str(row.get('price')))
+        if not price.is_finite():
+            raise ValueError
+        price = price.quantize(Decimal('0.01'))
+    except (ArithmeticError, ValueError):
+        raise ValueError(f"invalid price {row.get('price')!r}")
+    if price < 0:
+        raise ValueError("price must not be negative")
+    stock = _whole_number(row, 'stock', 0)
+    if stock < 0:
+        raise ValueError("stock must not be negative")
+    product_id = _whole_number(row, 'product_id', None)
+    description = str(row['description']).strip() if row.get('description') not in (None, '') else None
+    return product_id, name, description, price, stock
+
+def import_feed(stream, fmt, batch_size=BULK_BATCH_SIZE, on_progress=None):
+    """Upsert every valid row of a feed; bad rows are reported, not fatal.
+
+    on_progress, if given, is called with the running summary after each batch.
+    Returns {'imported', 'failed', 'errors': [{'line', 'error'}, ...]}.
+    """
+    summary = {'imported': 0, 'failed': 0, 'errors': []}
+
+    def fail(line_no, message):
+        summary['failed'] += 1
+        if len(summary['errors']) < MAX_REPORTED_ERRORS:
+            summary['errors'].append({'line': line_no, 'error': message})
+
+    def flush(batch):
+        written, errors = upsert_products([row for _, row in batch])
+        summary['imported'] += written
+        for index, message in errors:
+            fail(batch[index][0], message)
+        if on_progress is not None:
+            on_progress(summary)
+
+    batch = []
+    for line_no, row, error in read_feed(stream, fmt):
+        if error is None:
+            try:
+                batch.append((line_no, parse_product(row)))
+            except ValueError as e:
+                error = str(e)
+        if error is not None:
+            fail(line_no, error)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    return summary
+
+def _export_value(value):
+    return float(value) if isinstance(value, Decimal) else value
+
+def export_feed(fmt, batch_size=1000):
+    """Yield the whole catalog as CSV or JSON Lines text, one chunk per read batch."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown feed format '{fmt}'")
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(FEED_FIELDS)
+    for count, product in enumerate(iter_products(batch_size), 1):
+        values = [_export_value(product[field]) for field in FEED_FIELDS]
+        if writer:
+            writer.writerow(values)
+        else:
+            buffer.write(json.dumps(dict(zip(FEED_FIELDS, values))) + "\n")
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def feed_format(filename, explicit=None):
+    if explicit:
+        return explicit
+    return 'jsonl' if filename.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+def main():
+    from flask import Flask
+    from db import close_db
+
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest='command', required=True)
+    imp = sub.add_parser('import', help='upsert products from a feed file')
+    imp.add_argument('path')
+    imp.add_argument('--format', choices=FORMATS, help='default: from the file extension')
+    imp.add_argument('--batch-size', type=int, default=BULK_BATCH_SIZE)
+    exp = sub.add_parser('export', help='write the catalog to stdout')
+    exp.add_argument('--format', choices=FORMATS, default='csv')
+    args = parser.parse_args()
+
+    # get_db keeps its connection on the Flask app context.
+    app = Flask(__name__)
+    app.teardown_appcontext(close_db)
+    with app.app_context():
+        if args.command == 'export':
+            for chunk in export_feed(args.format):
+                sys.stdout.write(chunk)
+            return
+        progress = lambda s: print(f"imported {s['imported']}, failed {s['failed']}", file=sys.stderr)
+        with open(args.path, newline='', encoding='utf-8') as f:
+            summary = import_feed(f, feed_format(args.path, args.format), args.batch_size, progress)
+    for error in summary['errors']:
+        print(f"line {error['line']}: {error['error']}", file=sys.stderr)
+    print(f"Imported {summary['imported']} products, {summary['failed']} rows failed")
+    if summary['failed']:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,12 @@
 # db.py
-import mysql.connector
-# Removed 'pooling' as it wasn't used
+import threading
+import time
+from collections import deque
 from flask import g
 import os  # <-- Import the os library
 from dotenv import load_dotenv
+from metrics import instrument, unwrap
+from storage import DB_BACKEND, create_connector
 
 # --- MySQL Configuration ---
 MYSQL_CONFIG = {
@@ -13,63 +16,151 @@ MYSQL_CONFIG = {
     'database': os.getenv('DB_NAME'),
 }
 
+# --- Connection Pool Configuration ---
+POOL_CONFIG = {
+    'size': int(os.getenv('DB_POOL_SIZE', 10)),
+    'timeout': float(os.getenv('DB_POOL_TIMEOUT', 5)),      # seconds to wait for a free connection
+    'recycle': int(os.getenv('DB_POOL_RECYCLE', 3600)),     # max connection age in seconds
+}
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes free within the acquire timeout."""
+
+class ConnectionPool:
+    """A bounded pool of database connections with health checks on checkout.
+
+    connect is a zero-argument callable opening a new connection (see storage.py).
+    """
+
+    def __init__(self, connect, size, timeout, recycle):
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self._idle = deque()      # (connection, created_at) pairs ready for checkout
+        self._born = {}           # id(connection) -> created_at for checked-out connections
+        self._total = 0           # connections currently open (idle + in use)
+        self._cond = threading.Condition()
+        self._stats = {'in_use': 0, 'waiting': 0, 'created': 0, 'recycled': 0, 'timeouts': 0}
+
+    def acquire(self):
+        """Check a connection out of the pool, opening a new one if there is room."""
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, born = self._idle.pop()
+                    break
+                if self._total < self.size:
+                    self._total += 1
+                    conn, born = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f"No database connection available after {self.timeout}s")
+                self._stats['waiting'] += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._stats['waiting'] -= 1
+            self._stats['in_use'] += 1
+
+        # Health check and connect outside the lock so other requests are not blocked.
+        try:
+            if conn is not None and not self._is_healthy(conn, born):
+                self._discard(conn)
+                with self._cond:
+                    self._stats['recycled'] += 1
+                conn = None
+            if conn is None:
+                conn = self.connect()
+                born = time.monotonic()
+                with self._cond:
+                    self._stats['created'] += 1
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._stats['in_use'] -= 1
+                self._cond.notify()
+            raise
+
+        self._born[id(conn)] = born
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool, discarding it if it is broken."""
+        born = self._born.pop(id(conn), time.monotonic())
+        healthy = True
+        try:
+            if conn.is_connected():
+                conn.rollback()  # never hand uncommitted work to the next request
+            else:
+                healthy = False
+        except Exception:
+            healthy = False
+
+        with self._cond:
+            self._stats['in_use'] -= 1
+            if healthy:
+                self._idle.append((conn, born))
+            else:
+                self._total -= 1
+                self._stats['recycled'] += 1
+            self._cond.notify()
+        if not healthy:
+            self._discard(conn)
+
+    def stats(self):
+        """Snapshot of pool counters."""
+        with self._cond:
+            return dict(self._stats, idle=len(self._idle), size=self.size)
+
+    def _is_healthy(self, conn, born):
+        if time.monotonic() - born > self.recycle:
+            return False
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(create_connector(DB_BACKEND, MYSQL_CONFIG), **POOL_CONFIG)
+    return _pool
+
+def pool_stats():
+    """Pool statistics: connections in use, waiting requests, created and recycled counts."""
+    return get_pool().stats()
+
 def get_db():
-    """Get database connection, storing it in Flask's application context (g)."""
-    if 'db' not in g or g.db.is_connected() is False:
-        # FIX: Corrected DB_CONFIG to MYSQL_CONFIG
-        g.db = mysql.connector.connect(**MYSQL_CONFIG) 
+    """Get a pooled database connection, storing it in Flask's application context (g)."""
+    if 'db' not in g:
+        g.db = instrument(get_pool().acquire())
     return g.db
 
 def close_db(e=None):
-    """Close database connection after each request."""
+    """Return the request's database connection to the pool."""
     db = g.pop('db', None)
-    if db is not None and db.is_connected():
-        db.close()
+    if db is not None:
+        get_pool().release(unwrap(db))
 
 def init_db():
-    """Initialize database with required tables."""
-    db = get_db()
-    cursor = db.cursor()
-    
-    # NOTE: Using 'name' here to match your screenshot and fix the schema mismatch.
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INT AUTO_INCREMENT PRIMARY KEY,
-            name VARCHAR(255) NOT NULL, 
-            email VARCHAR(255) UNIQUE NOT NULL,
-            password VARCHAR(255) NOT NULL,
-            role ENUM('customer', 'admin', 'user') DEFAULT 'user',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS products (
-            product_id INT AUTO_INCREMENT PRIMARY KEY,
-            name VARCHAR(255) NOT NULL,
-            description TEXT,
-            price DECIMAL(10, 2) NOT NULL,
-            stock INT DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS cart (
-            cart_id INT AUTO_INCREMENT PRIMARY KEY,
-            user_id INT NOT NULL,
-            product_id INT NOT NULL,
-            quantity INT DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
-            FOREIGN KEY (product_id) REFERENCES products(product_id) ON DELETE CASCADE,
-            UNIQUE KEY unique_user_product (user_id, product_id)
-        )
-    ''')
-    
-    # Orders, order_items, payments tables are assumed correct from your earlier post.
-    # ... (SQL for orders, order_items, payments here) ...
-    
-    db.commit()
-    cursor.close()
-    print("Database tables initialized successfully!")
\ No newline at end of file
+    """Bring the database schema up to date by applying pending migrations."""
+    from migrations import migrate  # migrations imports db for the pool
+    applied = migrate(get_db())
+    print(f"Database tables initialized successfully! Applied migrations: {applied}")
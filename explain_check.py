@@ -0,0 +1,166 @@
+# explain_check.py
+# Runs EXPLAIN over the queries the DAOs issue and fails if any of them reads
+# a whole table. Run it after `python migrations.py`, against a database with
+# realistic row counts: on near-empty tables MySQL prefers a scan to an index
+# and the check reports queries that would be fine in production.
+#
+#   python explain_check.py [--verbose]
+#
+# MySQL only: DB_BACKEND=sqlite plans are not checked.
+#
+# Every statement is imported from the DAO that runs it (module constants and
+# query helpers), so the plans checked are the plans the app gets.
+import argparse
+import sys
+
+from db import get_pool
+from storage import DB_BACKEND
+from pagination import encode_cursor
+from user_dao import SELECT_USER_ID_BY_EMAIL, SELECT_LOGIN_USER, SELECT_USER, UPDATE_USER_ROLE
+from product_dao import (PAGE_SORTS, page_query, catalog_query, SELECT_ALL_PRODUCTS, SELECT_MEDIA, SELECT_PRODUCT,
+                         SELECT_PRODUCTS_BY_IDS, UPDATE_PRODUCT, DELETE_PRODUCT, SELECT_COPURCHASE_COUNTS,
+                         SELECT_CATALOG_VERSION)
+from search_index import FULLTEXT_SEARCH, FULLTEXT_COUNT
+from cart_dao import (SELECT_CART_QUANTITIES, SELECT_CART_ITEMS, SELECT_CART_LINES, DELETE_CART_ITEM, CLEAR_CART,
+                      DELETE_CARTS)
+from inventory_dao import (TAKE_STOCK, TAKE_LAST_STOCK, RETURN_STOCK, RESTOCK, SELECT_HOLDS, DELETE_HOLDS,
+                           SELECT_EXPIRED_HOLDS, DELETE_RESERVATIONS)
+from order_dao import (SELECT_ORDER_ITEMS, UPDATE_ORDER_STATUS, order_details_query, order_history_query,
+                       order_report_query)
+from payment_dao import CONFIRM_ORDER, SELECT_PAYMENT_HISTORY, UPDATE_PAYMENT_STATUS, payment_report_query
+from analytics import (SALES_DAILY_ROLLUP, PRODUCT_SALES_ROLLUP, PAYMENT_TOTALS_ROLLUP, SELECT_DAILY_REVENUE,
+                       SELECT_BEST_SELLERS, SELECT_PAYMENT_METHOD_TOTALS)
+
+# Queries that read a whole table on purpose, with the reason.
+ALLOWED_SCANS = {
+    'product_dao.get_all_products': 'loads the catalog once into catalog_cache and the search index',
+    'product_dao.get_media_index': 'loads every image once into catalog_cache',
+    'product_dao._load_copurchase_counts': 'aggregates all order items when the related-products index rebuilds',
+    'order_dao.stream_orders': 'the admin report streams every order',
+    'payment_dao.stream_payments': 'the admin report streams every payment',
+    'analytics.get_payment_method_totals': 'one row per payment method and status',
+}
+ALLOWED_SCANS.update({f"product_dao.stream_products sort={sort}": 'streams the whole catalog' for sort in PAGE_SORTS})
+
+def _in(values):
+    return ", ".join(["%s"] * len(values))
+
+def dao_queries():
+    """(name, sql, params) for every query the DAOs run, with sample parameters."""
+    queries = [
+        ('user_dao.register_user', SELECT_USER_ID_BY_EMAIL, ('a@example.com',)),
+        ('user_dao.login_user', SELECT_LOGIN_USER, ('a@example.com',)),
+        ('user_dao.get_user_by_id', SELECT_USER, (1,)),
+        ('user_dao.update_user_role', UPDATE_USER_ROLE, ('customer', 1)),
+
+        ('product_dao.get_all_products', SELECT_ALL_PRODUCTS, ()),
+        ('product_dao.get_media_index', SELECT_MEDIA, ()),
+        ('product_dao.get_product_by_id', SELECT_PRODUCT, (1,)),
+        ('product_dao.get_products_by_ids', SELECT_PRODUCTS_BY_IDS.format(placeholders=_in((1, 2, 3))), (1, 2, 3)),
+        ('product_dao.update_product_details', UPDATE_PRODUCT, ('x', 'x', 1, 1, 1)),
+        ('product_dao.delete_product_by_id', DELETE_PRODUCT, (1,)),
+        ('product_dao._load_copurchase_counts', SELECT_COPURCHASE_COUNTS, ()),
+        ('product_dao._sync_catalog_version', SELECT_CATALOG_VERSION, ()),
+        ('search_index.MySQLFulltextBackend.search', FULLTEXT_SEARCH, ('+milk*', '+milk*', 20, 0)),
+        ('search_index.MySQLFulltextBackend.search (count)', FULLTEXT_COUNT, ('+milk*',)),
+
+        ('cart_dao._load_cart', SELECT_CART_QUANTITIES, (1,)),
+        ('cart_dao.get_cart', SELECT_CART_ITEMS, (1,)),
+        ('cart_dao.price_cart', SELECT_CART_LINES, (1,)),
+        ('cart_dao.remove_from_cart', DELETE_CART_ITEM, (1, 1)),
+        ('cart_dao.clear_cart', CLEAR_CART, (1,)),
+        ('cart_dao._persist_carts', DELETE_CARTS.format(placeholders=_in((1, 2))), (1, 2)),
+
+        ('inventory_dao._take_stock', TAKE_STOCK, (1, 1, 1)),
+        ('inventory_dao._take_stock (last units)', TAKE_LAST_STOCK, (1, 1, 1)),
+        ('inventory_dao._return_stock', RETURN_STOCK, (1, 1)),
+        ('inventory_dao._return_stock (restock)', RESTOCK, (1, 1)),
+        ('inventory_dao._load_holds', SELECT_HOLDS, (1,)),
+        ('inventory_dao.hold_stock', DELETE_HOLDS, (1,)),
+        ('inventory_dao.release_expired_reservations', SELECT_EXPIRED_HOLDS, ('2000-01-01 00:00:00', 100)),
+        ('inventory_dao.release_expired_reservations (delete)',
+         DELETE_RESERVATIONS.format(placeholders=_in((1, 2))), (1, 2)),
+
+        ('order_dao.get_order_details',) + order_details_query(1, 1),
+        ('order_dao._attach_items', SELECT_ORDER_ITEMS.format(placeholders=_in((1, 2))), (1, 2)),
+        ('order_dao.update_order_status', UPDATE_ORDER_STATUS, ('shipped', 1)),
+
+        ('payment_dao.record_payment', CONFIRM_ORDER, (1,)),
+        ('payment_dao.get_payment_history', SELECT_PAYMENT_HISTORY, (1,)),
+        ('payment_dao.update_payment_status', UPDATE_PAYMENT_STATUS, ('Completed', 1)),
+
+        ('analytics.get_daily_revenue', SELECT_DAILY_REVENUE, ('2000-01-01',)),
+        ('analytics.get_best_sellers', SELECT_BEST_SELLERS, (10,)),
+        ('analytics.get_payment_method_totals', SELECT_PAYMENT_METHOD_TOTALS, ()),
+        ('analytics.SALES_DAILY_ROLLUP', SALES_DAILY_ROLLUP, (0, 5000)),
+        ('analytics.PRODUCT_SALES_ROLLUP', PRODUCT_SALES_ROLLUP, (0, 5000)),
+        ('analytics.PAYMENT_TOTALS_ROLLUP', PAYMENT_TOTALS_ROLLUP, (0, 5000)),
+    ]
+
+    samples = {'product_id': 1, 'name': 'm', 'price': 1}
+    for sort, (columns, _) in PAGE_SORTS.items():
+        for cursor in (None, encode_cursor(sort, [samples[c] for c in columns])):
+            sql, params = page_query(cursor, 24, sort)
+            queries.append((f"product_dao.get_products_page sort={sort}{' +cursor' if cursor else ''}", sql, params))
+
+    history_cursor = encode_cursor('orders', ['2000-01-01 00:00:00', 1])
+    for cursor in (None, history_cursor):
+        sql, params = order_history_query(1, cursor, 20)
+        queries.append((f"order_dao.get_user_orders{' +cursor' if cursor else ''}", sql, params))
+
+    for sort in PAGE_SORTS:
+        queries.append((f"product_dao.stream_products sort={sort}", catalog_query(sort), ()))
+    for name, build in (('order_dao.stream_orders', order_report_query),
+                        ('payment_dao.stream_payments', payment_report_query)):
+        queries.append((name,) + build())
+        queries.append((f"{name} user_id",) + build(1))
+    return queries
+
+def full_scans(plan):
+    """Tables the plan reads in full (EXPLAIN access type ALL)."""
+    return [row['table'] for row in plan if (row.get('type') or '').upper() == 'ALL']
+
+def check(db, verbose=False):
+    """EXPLAIN every DAO query; returns the (name, tables) that scan unexpectedly."""
+    failures = []
+    cursor = db.cursor(dictionary=True)
+    try:
+        for name, sql, params in dao_queries():
+            cursor.execute("EXPLAIN " + sql, params)
+            plan = cursor.fetchall()
+            scanned = full_scans(plan)
+            if scanned and name not in ALLOWED_SCANS:
+                failures.append((name, scanned))
+            if verbose:
+                note = f"full scan of {', '.join(scanned)}" if scanned else 'ok'
+                if scanned and name in ALLOWED_SCANS:
+                    note += f" (allowed: {ALLOWED_SCANS[name]})"
+                print(f"{name}: {note}")
+                for row in plan:
+                    print(f"    {row['table']:<20} type={row.get('type')} key={row.get('key')} rows={row.get('rows')}")
+    finally:
+        cursor.close()
+        db.rollback()
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--verbose', action='store_true', help='print every plan, not just failures')
+    args = parser.parse_args()
+    if DB_BACKEND != 'mysql':
+        sys.exit("explain_check.py checks MySQL plans; unset DB_BACKEND")
+
+    pool = get_pool()
+    db = pool.acquire()
+    try:
+        failures = check(db, args.verbose)
+    finally:
+        pool.release(db)
+    for name, tables in failures:
+        print(f"FULL TABLE SCAN in {name}: {', '.join(tables)}")
+    if failures:
+        sys.exit(1)
+    print("No unexpected full table scans")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+# inventory_dao.py
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from db import get_db, get_pool
+from metrics import timed
+from product_dao import stock_changed
+
+# How long stock held for a cart stays reserved while the customer pays.
+RESERVATION_TTL = int(os.getenv('STOCK_RESERVATION_TTL', 600))
+# Seconds between background releases of expired holds; 0 releases them from hold_stock instead.
+RESERVATION_RELEASE_INTERVAL = float(os.getenv('STOCK_RESERVATION_RELEASE_INTERVAL', 30))
+RESERVATION_RELEASE_BATCH = 500
+
+# Statements shared with async_api, which runs the same reservation on aiomysql.
+SELECT_HOLDS = "SELECT product_id, quantity FROM stock_reservations WHERE user_id = %s FOR UPDATE"
+# TAKE_STOCK leaves some stock behind and RETURN_STOCK adds to stock that is left; the
+# fallbacks only run when a product sells out or comes back, which moves the catalog version.
+TAKE_STOCK = "UPDATE products SET stock = stock - %s WHERE product_id = %s AND stock > %s"
+TAKE_LAST_STOCK = "UPDATE products SET stock = stock - %s WHERE product_id = %s AND stock = %s"
+RETURN_STOCK = "UPDATE products SET stock = stock + %s WHERE product_id = %s AND stock > 0"
+RESTOCK = "UPDATE products SET stock = stock + %s WHERE product_id = %s"
+DELETE_HOLDS = "DELETE FROM stock_reservations WHERE user_id = %s"
+SELECT_EXPIRED_HOLDS = """
+    SELECT reservation_id, product_id, quantity FROM stock_reservations
+    WHERE expires_at < %s
+    ORDER BY product_id
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+"""
+DELETE_RESERVATIONS = "DELETE FROM stock_reservations WHERE reservation_id IN ({placeholders})"
+
+class OutOfStock(Exception):
+    """Raised when a product does not have enough stock left for a reservation."""
+
+    def __init__(self, product_id):
+        super().__init__(f"Product {product_id} is out of stock")
+        self.product_id = product_id
+
+def _take_stock(cursor, product_id, quantity):
+    """Conditionally decrement stock; the row lock is held until the caller commits.
+
+    Returns True if this took the last units, so the product is now sold out.
+    """
+    cursor.execute(TAKE_STOCK, (quantity, product_id, quantity))
+    if cursor.rowcount:
+        return False
+    cursor.execute(TAKE_LAST_STOCK, (quantity, product_id, quantity))
+    if cursor.rowcount == 0:
+        raise OutOfStock(product_id)
+    return True
+
+def _return_stock(cursor, product_id, quantity):
+    """Give stock back. Returns True if the product was sold out until now."""
+    cursor.execute(RETURN_STOCK, (quantity, product_id))
+    if cursor.rowcount:
+        return False
+    cursor.execute(RESTOCK, (quantity, product_id))
+    return cursor.rowcount > 0
+
+def check_quantity(product_id, quantity):
+    """Raise ValueError unless quantity is a whole number of at least 1.
+
+    A negative line would otherwise run _return_stock and add stock.
+    """
+    if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity < 1:
+        raise ValueError(f"Invalid quantity {quantity!r} for product {product_id}")
+
+def merge_items(items):
+    """Sum quantities per product and sort by product_id.
+
+    Every writer locks product rows in ascending id order, so two checkouts
+    sharing products can never wait on each other in a cycle. Raises
+    ValueError for a quantity below 1.
+    """
+    totals = {}
+    for product_id, quantity in items:
+        check_quantity(product_id, quantity)
+        totals[product_id] = totals.get(product_id, 0) + quantity
+    return sorted(totals.items())
+
+def _load_holds(cursor, user_id):
+    cursor.execute(SELECT_HOLDS, (user_id,))
+    return dict(cursor.fetchall())
+
+def _adjust_stock(cursor, held, wanted):
+    """Move products from the held quantities to the wanted ones in a single sorted pass.
+
+    Returns the ids of products that sold out or came back in stock.
+    """
+    flipped = set()
+    for product_id in sorted(set(held) | set(wanted)):
+        need = wanted.get(product_id, 0) - held.get(product_id, 0)
+        if need > 0 and _take_stock(cursor, product_id, need):
+            flipped.add(product_id)
+        elif need < 0 and _return_stock(cursor, product_id, -need):
+            flipped.add(product_id)
+    return flipped
+
+def reserve_stock(cursor, user_id, items):
+    """Take stock for an order on the caller's cursor, without committing.
+
+    Stock the user already holds through hold_stock is used first; only the
+    difference is taken from (or given back to) products. Raises OutOfStock,
+    leaving the caller to roll back; ValueError for a quantity below 1, before
+    any row is touched. Returns the products that sold out or came back, for
+    stock_changed once the caller commits.
+    """
+    wanted = dict(merge_items(items))
+    held = _load_holds(cursor, user_id)
+    flipped = _adjust_stock(cursor, held, wanted)
+    if held:
+        cursor.execute(DELETE_HOLDS, (user_id,))
+    return flipped
+
+@timed
+def hold_stock(user_id, items, ttl=RESERVATION_TTL):
+    """Reserve stock for a cart while the customer pays.
+
+    Replaces any earlier hold by the same user. Returns True on success and
+    raises OutOfStock if any product cannot be covered, or ValueError for a
+    quantity below 1.
+    """
+    wanted = merge_items(items)
+    if RESERVATION_RELEASE_INTERVAL <= 0:
+        release_expired_reservations()
+    db = get_db()
+    cursor = db.cursor()
+    try:
+        held = _load_holds(cursor, user_id)
+        flipped = _adjust_stock(cursor, held, dict(wanted))
+        if held:
+            cursor.execute(DELETE_HOLDS, (user_id,))
+        expires_at = datetime.now() + timedelta(seconds=ttl)
+        cursor.executemany("""
+            INSERT INTO stock_reservations (user_id, product_id, quantity, expires_at)
+            VALUES (%s, %s, %s, %s)
+        """, [(user_id, product_id, quantity, expires_at) for product_id, quantity in wanted])
+        db.commit()
+        stock_changed(set(held) | {product_id for product_id, _ in wanted}, flipped)
+        return True
+    except OutOfStock:
+        db.rollback()
+        raise
+    except Exception as e:
+        db.rollback()
+        print(f"Error holding stock: {e}")
+        return False
+    finally:
+        cursor.close()
+
+@timed
+def release_expired_reservations(limit=RESERVATION_RELEASE_BATCH, db=None):
+    """Give the stock of expired holds back to products. Returns the number released."""
+    db = db or get_db()
+    cursor = db.cursor()
+    try:
+        cursor.execute(SELECT_EXPIRED_HOLDS, (datetime.now(), limit))
+        expired = cursor.fetchall()
+        if not expired:
+            db.rollback()
+            return 0
+        flipped = {product_id
+                   for product_id, quantity in merge_items((product_id, quantity) for _, product_id, quantity in expired)
+                   if _return_stock(cursor, product_id, quantity)}
+        placeholders = ", ".join(["%s"] * len(expired))
+        cursor.execute(DELETE_RESERVATIONS.format(placeholders=placeholders),
+                       [reservation_id for reservation_id, _, _ in expired])
+        db.commit()
+        stock_changed({product_id for _, product_id, _ in expired}, flipped, db)
+        return len(expired)
+    except Exception as e:
+        db.rollback()
+        print(f"Error releasing reservations: {e}")
+        return 0
+    finally:
+        cursor.close()
+
+# ---------------- Background release ----------------
+
+_releaser = None
+_releaser_lock = threading.Lock()
+
+def _release_from_pool():
+    pool = get_pool()
+    db = pool.acquire()
+    try:
+        # Batches until a short one, so a backlog of expired holds clears in one run.
+        while release_expired_reservations(db=db) == RESERVATION_RELEASE_BATCH:
+            pass
+    finally:
+        pool.release(db)
+
+def _run_releaser():
+    while True:
+        time.sleep(RESERVATION_RELEASE_INTERVAL)
+        try:
+            _release_from_pool()
+        except Exception as e:
+            print(f"Error releasing reservations: {e}")
+
+def _start_releaser():
+    # Started lazily on the first request so each forked worker gets its own thread.
+    global _releaser
+    if _releaser is not None:
+        return
+    with _releaser_lock:
+        if _releaser is None:
+            _releaser = threading.Thread(target=_run_releaser, name='reservation-release', daemon=True)
+            _releaser.start()
+
+def init_app(app):
+    """Release expired holds in the background if STOCK_RESERVATION_RELEASE_INTERVAL is above zero."""
+    if RESERVATION_RELEASE_INTERVAL > 0:
+        app.before_request(_start_releaser)
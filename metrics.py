@@ -0,0 +1,248 @@
+# metrics.py
+# Query and DAO instrumentation exported in Prometheus text format at /metrics.
+#
+# db.get_db wraps each pooled connection so every cursor records per-statement
+# latency, rows fetched and failures; DAO functions decorated with @timed record
+# their own latency and label the statements they run. Statements slower than
+# SLOW_QUERY_MS are logged to the 'slow_query' logger with parameter values
+# replaced by their types, so no user data ends up in the log.
+import contextvars
+import functools
+import logging
+import os
+import re
+import threading
+import time
+
+DB_INSTRUMENT = os.getenv('DB_INSTRUMENT', '1') == '1'
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 200))  # 0 disables the slow-query log
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+ROW_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 1000, 10000)
+
+slow_query_log = logging.getLogger('slow_query')
+
+# Callables given each statement's duration in seconds, e.g. profiling's DB timer.
+query_listeners = []
+
+# The innermost @timed DAO function running in this thread or task.
+_current_dao = contextvars.ContextVar('current_dao', default='-')
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_label_value(value)}"' for name, value in pairs) + '}'
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+class Histogram:
+    """Cumulative-bucket histogram with a fixed label set, as Prometheus expects it."""
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    le = (('le', bound),)
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {count}")
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, (('le', '+Inf'),))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-2]:.6f}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+query_seconds = Histogram('db_query_duration_seconds', 'Time spent executing a statement.', ('dao', 'statement'))
+query_rows = Histogram('db_query_rows', 'Rows fetched per statement.', ('dao', 'statement'), ROW_BUCKETS)
+query_errors = Counter('db_query_errors_total', 'Statements that raised an error.', ('dao', 'statement'))
+slow_queries = Counter('db_slow_queries_total', 'Statements slower than SLOW_QUERY_MS.', ('dao', 'statement'))
+dao_seconds = Histogram('dao_call_duration_seconds', 'Time spent in a DAO function, cache hits included.', ('dao',))
+dao_errors = Counter('dao_call_errors_total', 'DAO calls that raised instead of returning.', ('dao',))
+
+_STATEMENT_RE = re.compile(r'^\s*(\w+)\b.*?\b(?:FROM|INTO|UPDATE|TABLE)\s+`?(\w+)', re.IGNORECASE | re.DOTALL)
+_UPDATE_RE = re.compile(r'^\s*UPDATE\s+`?(\w+)', re.IGNORECASE)
+
+def statement_label(sql):
+    """Low-cardinality label for a statement: its verb and main table, e.g. 'SELECT products'."""
+    match = _UPDATE_RE.match(sql)
+    if match:
+        return f"UPDATE {match.group(1)}"
+    match = _STATEMENT_RE.match(sql)
+    if match:
+        return f"{match.group(1).upper()} {match.group(2)}"
+    return sql.split(None, 1)[0].upper() if sql.strip() else '-'
+
+def redact(params):
+    """Parameter types in place of values, e.g. [int, str]."""
+    if params is None:
+        return '[]'
+    values = params.values() if isinstance(params, dict) else params
+    return '[' + ', '.join(type(value).__name__ for value in values) + ']'
+
+def timed(fn):
+    """Record a DAO function's duration and label the statements it runs."""
+    name = f"{fn.__module__}.{fn.__name__}"
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = _current_dao.set(name)
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            dao_errors.inc((name,))
+            raise
+        finally:
+            dao_seconds.observe((name,), time.perf_counter() - start)
+            _current_dao.reset(token)
+    return wrapper
+
+class InstrumentedCursor:
+    """Cursor proxy that times execute() and counts the rows fetched afterwards."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._labels = None
+        self._rows = 0
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._rows += 1
+            yield row
+
+    def _flush(self):
+        if self._labels is not None:
+            query_rows.observe(self._labels, self._rows)
+            self._labels = None
+
+    def _run(self, method, sql, params, sample):
+        self._flush()
+        labels = (_current_dao.get(), statement_label(sql))
+        start = time.perf_counter()
+        try:
+            result = method(sql, params)
+        except Exception:
+            query_errors.inc(labels)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            query_seconds.observe(labels, elapsed)
+            for listener in query_listeners:
+                listener(elapsed)
+            if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+                slow_queries.inc(labels)
+                slow_query_log.warning("%.1fms in %s: %s params=%s", elapsed * 1000, labels[0],
+                                       ' '.join(sql.split()), redact(sample))
+        # Only statements that return a result set get a row count.
+        self._labels, self._rows = (labels if self._cursor.description is not None else None), 0
+        return result
+
+    def execute(self, sql, params=None):
+        return self._run(self._cursor.execute, sql, params, params)
+
+    def executemany(self, sql, seq_params):
+        seq_params = list(seq_params)
+        return self._run(self._cursor.executemany, sql, seq_params, seq_params[0] if seq_params else None)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany() if size is None else self._cursor.fetchmany(size)
+        self._rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._rows += len(rows)
+        self._flush()
+        return rows
+
+    def close(self):
+        self._flush()
+        return self._cursor.close()
+
+class InstrumentedConnection:
+    """Connection proxy whose cursors are InstrumentedCursors; everything else passes through."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self.connection.cursor(*args, **kwargs))
+
+def instrument(connection):
+    """Wrap a connection for metrics unless DB_INSTRUMENT=0."""
+    return InstrumentedConnection(connection) if DB_INSTRUMENT else connection
+
+def unwrap(connection):
+    """The driver connection behind an instrumented one."""
+    return connection.connection if isinstance(connection, InstrumentedConnection) else connection
+
+def _metric_name(text):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', text)
+
+def render(gauges=None):
+    """All metrics in Prometheus text format.
+
+    gauges maps a prefix to a dict of numeric stats, e.g. {'db_pool': pool_stats()},
+    and is rendered as one gauge per key (db_pool_in_use, ...).
+    """
+    lines = []
+    for metric in (query_seconds, query_rows, query_errors, slow_queries, dao_seconds, dao_errors):
+        lines.extend(metric.render())
+    for prefix, stats in (gauges or {}).items():
+        for key, value in sorted(stats.items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = _metric_name(f"{prefix}_{key}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,422 @@
+# migrations.py
+# Versioned schema migrations. Each migration runs once, in order, and is
+# recorded in schema_migrations. `python migrations.py` applies pending
+# migrations; `python migrations.py status` lists them. db.init_db runs the
+# same migrations, so existing setups keep working. Migrations run on both
+# storage backends (see storage.py); a migration gets the dialect and picks
+# its SQL accordingly.
+#
+# Never edit a migration that has shipped; append a new one instead.
+import sys
+from datetime import datetime
+
+from db import get_pool
+from storage import dialect
+
+CREATE_USERS = """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INT AUTO_INCREMENT PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        email VARCHAR(255) UNIQUE NOT NULL,
+        password VARCHAR(255) NOT NULL,
+        role ENUM('customer', 'admin', 'user') DEFAULT 'user',
+        is_active BOOLEAN NOT NULL DEFAULT TRUE,
+        auth_version INT NOT NULL DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+CREATE_PRODUCTS = """
+    CREATE TABLE IF NOT EXISTS products (
+        product_id INT AUTO_INCREMENT PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        description TEXT,
+        price DECIMAL(10, 2) NOT NULL,
+        stock INT DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FULLTEXT KEY ft_products_name_description (name, description)
+    )
+"""
+
+CREATE_CART = """
+    CREATE TABLE IF NOT EXISTS cart (
+        cart_id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id INT NOT NULL,
+        product_id INT NOT NULL,
+        quantity INT DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+        FOREIGN KEY (product_id) REFERENCES products(product_id) ON DELETE CASCADE,
+        UNIQUE KEY unique_user_product (user_id, product_id)
+    )
+"""
+
+# One image per product: a path under static/ plus its pixel size.
+CREATE_PRODUCT_MEDIA = """
+    CREATE TABLE IF NOT EXISTS product_media (
+        product_id INT PRIMARY KEY,
+        image_path VARCHAR(255) NOT NULL,
+        width INT,
+        height INT,
+        FOREIGN KEY (product_id) REFERENCES products(product_id) ON DELETE CASCADE
+    )
+"""
+
+# Stock held for a cart while the customer pays; released by
+# inventory_dao.release_expired_reservations once expires_at passes.
+CREATE_STOCK_RESERVATIONS = """
+    CREATE TABLE IF NOT EXISTS stock_reservations (
+        reservation_id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id INT NOT NULL,
+        product_id INT NOT NULL,
+        quantity INT NOT NULL,
+        expires_at DATETIME NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+        FOREIGN KEY (product_id) REFERENCES products(product_id) ON DELETE CASCADE,
+        UNIQUE KEY unique_user_product (user_id, product_id),
+        KEY idx_expires_at (expires_at)
+    )
+"""
+
+CREATE_ORDERS = """
+    CREATE TABLE IF NOT EXISTS orders (
+        order_id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id INT NOT NULL,
+        total_amount DECIMAL(10, 2) NOT NULL,
+        delivery_address TEXT NOT NULL,
+        status VARCHAR(32) NOT NULL DEFAULT 'pending',
+        order_date DATETIME NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+        KEY idx_orders_user_date (user_id, order_date, order_id)
+    )
+"""
+
+CREATE_ORDER_ITEMS = """
+    CREATE TABLE IF NOT EXISTS order_items (
+        order_item_id INT AUTO_INCREMENT PRIMARY KEY,
+        order_id INT NOT NULL,
+        product_id INT NOT NULL,
+        quantity INT NOT NULL,
+        price DECIMAL(10, 2) NOT NULL,
+        FOREIGN KEY (order_id) REFERENCES orders(order_id) ON DELETE CASCADE,
+        FOREIGN KEY (product_id) REFERENCES products(product_id),
+        KEY idx_order_items_order (order_id, product_id)
+    )
+"""
+
+CREATE_PAYMENTS = """
+    CREATE TABLE IF NOT EXISTS payments (
+        payment_id INT AUTO_INCREMENT PRIMARY KEY,
+        order_id INT NOT NULL,
+        amount DECIMAL(10, 2) NOT NULL,
+        status VARCHAR(32) NOT NULL,
+        payment_method VARCHAR(64),
+        payment_date DATETIME NOT NULL,
+        FOREIGN KEY (order_id) REFERENCES orders(order_id) ON DELETE CASCADE,
+        KEY idx_payments_order (order_id)
+    )
+"""
+
+# The same tables for DB_BACKEND=sqlite. Secondary indexes come from migration 2.
+SQLITE_TABLES = [
+    """CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        role TEXT DEFAULT 'user' CHECK (role IN ('customer', 'admin', 'user')),
+        is_active BOOLEAN NOT NULL DEFAULT 1,
+        auth_version INTEGER NOT NULL DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE IF NOT EXISTS products (
+        product_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        description TEXT,
+        price DECIMAL(10, 2) NOT NULL,
+        stock INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE IF NOT EXISTS cart (
+        cart_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+        product_id INTEGER NOT NULL REFERENCES products(product_id) ON DELETE CASCADE,
+        quantity INTEGER DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (user_id, product_id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS product_media (
+        product_id INTEGER PRIMARY KEY REFERENCES products(product_id) ON DELETE CASCADE,
+        image_path TEXT NOT NULL,
+        width INTEGER,
+        height INTEGER
+    )""",
+    """CREATE TABLE IF NOT EXISTS stock_reservations (
+        reservation_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+        product_id INTEGER NOT NULL REFERENCES products(product_id) ON DELETE CASCADE,
+        quantity INTEGER NOT NULL,
+        expires_at DATETIME NOT NULL,
+        UNIQUE (user_id, product_id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS orders (
+        order_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+        total_amount DECIMAL(10, 2) NOT NULL,
+        delivery_address TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        order_date DATETIME NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS order_items (
+        order_item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER NOT NULL REFERENCES orders(order_id) ON DELETE CASCADE,
+        product_id INTEGER NOT NULL REFERENCES products(product_id),
+        quantity INTEGER NOT NULL,
+        price DECIMAL(10, 2) NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS payments (
+        payment_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER NOT NULL REFERENCES orders(order_id) ON DELETE CASCADE,
+        amount DECIMAL(10, 2) NOT NULL,
+        status TEXT NOT NULL,
+        payment_method TEXT,
+        payment_date DATETIME NOT NULL
+    )""",
+]
+
+def _create_tables(cursor, dialect):
+    if dialect == 'sqlite':
+        statements = SQLITE_TABLES
+    else:
+        statements = (CREATE_USERS, CREATE_PRODUCTS, CREATE_CART, CREATE_PRODUCT_MEDIA,
+                      CREATE_STOCK_RESERVATIONS, CREATE_ORDERS, CREATE_ORDER_ITEMS, CREATE_PAYMENTS)
+    for statement in statements:
+        cursor.execute(statement)
+
+def _index_columns(cursor, table, dialect):
+    """{index name: [column, ...]} for every index on table."""
+    indexes = {}
+    if dialect == 'sqlite':
+        cursor.execute(f"PRAGMA index_list({table})")
+        for name in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f"PRAGMA index_info({name})")
+            indexes[name] = [column.lower() for _, _, column in sorted(cursor.fetchall())]
+        return indexes
+    cursor.execute("""
+        SELECT index_name, column_name FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s
+        ORDER BY index_name, seq_in_index
+    """, (table,))
+    for index_name, column_name in cursor.fetchall():
+        indexes.setdefault(index_name, []).append(column_name.lower())
+    return indexes
+
+def _columns(cursor, table, dialect):
+    """Lower-cased names of the columns of table."""
+    if dialect == 'sqlite':
+        cursor.execute(f"PRAGMA table_info({table})")
+        return {row[1].lower() for row in cursor.fetchall()}
+    cursor.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s
+    """, (table,))
+    return {column_name.lower() for (column_name,) in cursor.fetchall()}
+
+def _ensure_column(cursor, table, column, definition, dialect):
+    """Add column to a table created before it was part of its CREATE TABLE."""
+    if column not in _columns(cursor, table, dialect):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def _has_index(cursor, table, columns, dialect):
+    """True if some index on table already starts with columns, in order."""
+    indexes = _index_columns(cursor, table, dialect)
+    return any(tuple(existing[:len(columns)]) == tuple(columns) for existing in indexes.values())
+
+def _ensure_index(cursor, table, name, columns, dialect):
+    if _has_index(cursor, table, columns, dialect):
+        return
+    if dialect == 'sqlite':
+        cursor.execute(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})")
+    else:
+        cursor.execute(f"ALTER TABLE {table} ADD INDEX {name} ({', '.join(columns)})")
+
+# Indexes for the lookups the DAOs run; explain_check.py verifies they are used.
+# Tables created before migration 1 existed may lack them, so each is added
+# only where no index already covers the same leading columns.
+DAO_INDEXES = [
+    ('users', 'idx_users_email', ('email',)),                          # login_user, register_user
+    ('products', 'idx_products_name', ('name', 'product_id')),         # get_products_page sort=name
+    ('products', 'idx_products_price', ('price', 'product_id')),       # get_products_page sort=price/-price
+    ('cart', 'idx_cart_user', ('user_id', 'product_id')),              # get_cart, clear_cart
+    ('orders', 'idx_orders_user_date', ('user_id', 'order_date')),     # get_user_orders
+    ('order_items', 'idx_order_items_order', ('order_id', 'product_id')),  # order details, co-purchases
+    ('payments', 'idx_payments_order', ('order_id',)),                 # get_payment_history
+    ('stock_reservations', 'idx_expires_at', ('expires_at',)),        # release_expired_reservations
+]
+
+def _add_dao_indexes(cursor, dialect):
+    for table, name, columns in DAO_INDEXES:
+        _ensure_index(cursor, table, name, columns, dialect)
+
+# Rollups maintained incrementally by analytics.refresh; analytics_watermarks
+# holds the last order_id / payment_id already folded in.
+CREATE_ANALYTICS = [
+    """CREATE TABLE IF NOT EXISTS sales_daily (
+        day DATE PRIMARY KEY,
+        order_count INT NOT NULL,
+        revenue DECIMAL(14, 2) NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS product_sales (
+        product_id INT PRIMARY KEY,
+        units INT NOT NULL,
+        revenue DECIMAL(14, 2) NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS payment_method_totals (
+        payment_method VARCHAR(64) NOT NULL,
+        status VARCHAR(32) NOT NULL,
+        payment_count INT NOT NULL,
+        amount_total DECIMAL(14, 2) NOT NULL,
+        PRIMARY KEY (payment_method, status)
+    )""",
+    """CREATE TABLE IF NOT EXISTS analytics_watermarks (
+        source VARCHAR(32) PRIMARY KEY,
+        last_id INT NOT NULL
+    )""",
+]
+
+def _create_analytics(cursor, dialect):
+    # The statements above are plain enough for both dialects.
+    for statement in CREATE_ANALYTICS:
+        cursor.execute(statement)
+    _ensure_index(cursor, 'product_sales', 'idx_product_sales_units', ('units', 'product_id'), dialect)
+    cursor.executemany("INSERT IGNORE INTO analytics_watermarks (source, last_id) VALUES (%s, 0)",
+                       [('orders',), ('payments',)])
+
+# One row holding the catalog version every worker's caches and ETags follow;
+# product_dao bumps it after each catalog write and whenever a product sells out or comes back.
+CREATE_CATALOG_STATE = """
+    CREATE TABLE IF NOT EXISTS catalog_state (
+        id INT PRIMARY KEY,
+        version BIGINT NOT NULL,
+        changed_at DATETIME NOT NULL
+    )
+"""
+
+def _create_catalog_state(cursor, dialect):
+    cursor.execute(CREATE_CATALOG_STATE)
+    cursor.execute("INSERT IGNORE INTO catalog_state (id, version, changed_at) VALUES (1, 1, %s)",
+                   (datetime.now(),))
+
+def _add_users_is_active(cursor, dialect):
+    # Migration 1 only creates missing tables, so users tables from before
+    # accounts could be disabled never got the column.
+    _ensure_column(cursor, 'users', 'is_active', 'BOOLEAN NOT NULL DEFAULT 1', dialect)
+
+def _add_users_auth_version(cursor, dialect):
+    # Counts password changes; sessions record it at login. A rehash on login
+    # rewrites the password without touching it, so no session is ended.
+    _ensure_column(cursor, 'users', 'auth_version', 'INT NOT NULL DEFAULT 1', dialect)
+
+def _add_products_fulltext(cursor, dialect):
+    # CREATE_PRODUCTS only carries the FULLTEXT key for new tables; products
+    # tables from before SEARCH_BACKEND=mysql get it here. SQLite searches in
+    # memory and has no FULLTEXT indexes.
+    if dialect == 'sqlite':
+        return
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = 'products' AND index_type = 'FULLTEXT'
+          AND index_name = 'ft_products_name_description'
+    """)
+    if not cursor.fetchall()[0][0]:
+        cursor.execute("ALTER TABLE products ADD FULLTEXT KEY ft_products_name_description (name, description)")
+
+# (version, description, function taking a cursor and the storage dialect)
+MIGRATIONS = [
+    (1, 'Create tables', _create_tables),
+    (2, 'Indexes for DAO queries', _add_dao_indexes),
+    (3, 'Analytics rollup tables', _create_analytics),
+    (4, 'Shared catalog version', _create_catalog_state),
+    (5, 'users.is_active on existing tables', _add_users_is_active),
+    (6, 'FULLTEXT search index on existing products tables', _add_products_fulltext),
+    (7, 'users.auth_version for ending sessions on password change', _add_users_auth_version),
+]
+
+def _applied_versions(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at DATETIME NOT NULL
+        )
+    """)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {version for (version,) in cursor.fetchall()}
+
+def migrate(db):
+    """Apply pending migrations on connection db; returns the versions applied.
+
+    On MySQL a named lock keeps several workers starting at once from running
+    the same migration twice. DDL commits implicitly there, so a migration that
+    fails halfway is not rolled back; migrations are written to be re-runnable.
+    On SQLite DDL is transactional: every pending migration runs in one
+    BEGIN IMMEDIATE transaction, which also serves as the lock.
+    """
+    kind = dialect(db)
+    cursor = db.cursor()
+    applied = []
+    try:
+        if kind == 'sqlite':
+            cursor.execute("BEGIN IMMEDIATE")
+        else:
+            cursor.execute("SELECT GET_LOCK('schema_migrations', 60)")
+            if cursor.fetchone()[0] != 1:
+                raise RuntimeError("Timed out waiting for another process to finish migrating")
+        try:
+            done = _applied_versions(cursor)
+            for version, description, apply in MIGRATIONS:
+                if version in done:
+                    continue
+                apply(cursor, kind)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, description, applied_at) VALUES (%s, %s, %s)",
+                    (version, description, datetime.now()))
+                if kind == 'mysql':
+                    db.commit()
+                applied.append(version)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            if kind == 'mysql':
+                cursor.execute("SELECT RELEASE_LOCK('schema_migrations')")
+                cursor.fetchall()
+    finally:
+        cursor.close()
+    return applied
+
+def status(db):
+    """(version, description, applied) for every known migration."""
+    cursor = db.cursor()
+    try:
+        done = _applied_versions(cursor)
+    finally:
+        cursor.close()
+    return [(version, description, version in done) for version, description, _ in MIGRATIONS]
+
+def main(argv):
+    pool = get_pool()
+    db = pool.acquire()
+    try:
+        if argv[:1] == ['status']:
+            for version, description, applied in status(db):
+                print(f"{version:>4}  {'applied' if applied else 'pending':<8} {description}")
+        else:
+            applied = migrate(db)
+            print(f"Applied migrations: {applied}" if applied else "Schema is up to date")
+    finally:
+        pool.release(db)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,94 +1,234 @@
+import time
 from db import get_db
-from cart_dao import get_cart, clear_cart
+from metrics import timed
+from cart_dao import price_cart, from_minor, write_behind, CLEAR_CART
+from payment_dao import record_payment
+from inventory_dao import reserve_stock, OutOfStock
+from product_dao import related_index, stock_changed
+from pagination import encode_cursor, decode_cursor, keyset_condition
+from streaming import fetch_chunks
 from datetime import datetime
 
-def place_order(user_id, delivery_address):
-    """Place an order from the user's cart."""
+class EmptyCart(Exception):
+    """Raised by checkout when the user's cart has nothing to order."""
+
+DEFAULT_ORDER_PAGE_SIZE = 20
+MAX_ORDER_PAGE_SIZE = 100
+
+INSERT_ORDER = """
+    INSERT INTO orders (user_id, total_amount, delivery_address, status, order_date) 
+    VALUES (%s, %s, %s, 'pending', %s)
+"""
+
+INSERT_ORDER_ITEM = """
+    INSERT INTO order_items (order_id, product_id, quantity, price) 
+    VALUES (%s, %s, %s, %s)
+"""
+
+def _restore_cart(user_id, lines):
+    """Put the items of a failed checkout back into the write-behind cart."""
+    if write_behind is not None:
+        write_behind.add(user_id, [(product_id, quantity) for product_id, quantity, _ in lines])
+
+@timed
+def checkout(user_id, delivery_address, payment_method):
+    """Place an order, record its payment and clear the cart in a single transaction.
+
+    Returns (order_id, total_amount, timings) where timings maps each stage to
+    its duration in milliseconds. On failure nothing is written and order_id is None;
+    EmptyCart is raised for an empty cart, ValueError for a line with a
+    quantity below 1, and OutOfStock is re-raised so the caller can name the product.
+    """
+    timings = {}
+    stage_start = time.perf_counter()
+
+    def lap(stage):
+        nonlocal stage_start
+        now = time.perf_counter()
+        timings[stage] = (now - stage_start) * 1000
+        stage_start = now
+
     db = get_db()
+    lines, total = price_cart(user_id)
+    lap('cart')
+    if not lines or total <= 0:
+        raise EmptyCart()
+    total_amount = from_minor(total)
+    if write_behind is not None:
+        # Emptied before the transaction, so a flush during checkout cannot write
+        # the ordered items back to the cart table after the DELETE below.
+        write_behind.clear(user_id)
+
     cursor = db.cursor()
     try:
-        # Get cart items
-        cart_data = get_cart(user_id)
-        if not cart_data['items'] or cart_data['total'] <= 0:
-            return None, 0
-        
-        # Create order
-        cursor.execute("""
-            INSERT INTO orders (user_id, total_amount, delivery_address, status, order_date) 
-            VALUES (%s, %s, %s, 'pending', %s)
-        """, (user_id, cart_data['total'], delivery_address, datetime.now()))
-        
+        cursor.execute(INSERT_ORDER, (user_id, total_amount, delivery_address, datetime.now()))
         order_id = cursor.lastrowid
-        
-        # Add order items
-        for item in cart_data['items']:
-            cursor.execute("""
-                INSERT INTO order_items (order_id, product_id, quantity, price) 
-                VALUES (%s, %s, %s, %s)
-            """, (order_id, item['product_id'], item['quantity'], item['price']))
-        
-        # Clear the cart
-        # cursor.execute("DELETE FROM cart WHERE user_id = %s", (user_id,))
-        
+        lap('order')
+
+        flipped = reserve_stock(cursor, user_id, [(product_id, quantity) for product_id, quantity, _ in lines])
+        lap('stock')
+
+        cursor.executemany(INSERT_ORDER_ITEM, [
+            (order_id, product_id, quantity, from_minor(unit))
+            for product_id, quantity, unit in lines
+        ])
+        lap('items')
+
+        record_payment(cursor, order_id, total_amount, 'Completed', payment_method)
+        lap('payment')
+
+        cursor.execute(CLEAR_CART, (user_id,))
+        lap('clear_cart')
+
         db.commit()
-        return order_id, cart_data['total']
-        
+        lap('commit')
+    except (OutOfStock, ValueError):
+        db.rollback()
+        _restore_cart(user_id, lines)
+        raise
     except Exception as e:
         db.rollback()
-        print(f"Error placing order: {e}")
-        return None, 0
+        _restore_cart(user_id, lines)
+        print(f"Error during checkout: {e}")
+        return None, 0, timings
     finally:
         cursor.close()
 
-def get_user_orders(user_id):
-    """Get all orders for a specific user."""
+    stock_changed([line[0] for line in lines], flipped)
+    related_index.record_order([line[0] for line in lines])
+    return order_id, total_amount, timings
+
+ORDER_HISTORY_COLUMNS = ('o.order_date', 'o.order_id')
+
+SELECT_ORDER_ITEMS = """
+    SELECT oi.order_id, oi.product_id, oi.quantity, oi.price,
+           p.name as product_name, p.description
+    FROM order_items oi
+    JOIN products p ON oi.product_id = p.product_id
+    WHERE oi.order_id IN ({placeholders})
+    ORDER BY oi.order_id, oi.order_item_id
+"""
+
+def _attach_items(cursor, orders):
+    """Load the items of every order in one IN (...) query and set order['items']."""
+    if not orders:
+        return orders
+    by_id = {order['order_id']: order for order in orders}
+    for order in orders:
+        order['items'] = []
+    placeholders = ", ".join(["%s"] * len(by_id))
+    cursor.execute(SELECT_ORDER_ITEMS.format(placeholders=placeholders), list(by_id))
+    for item in cursor.fetchall():
+        by_id[item.pop('order_id')]['items'].append(item)
+    return orders
+
+def order_history_query(user_id, cursor, limit):
+    """SQL and parameters for one page of a user's orders; fetches one row more than limit.
+
+    Keyset pagination on (order_date, order_id), served by idx_orders_user_date.
+    """
+    query = """
+        SELECT o.order_id, o.total_amount, o.delivery_address, o.status, o.order_date
+        FROM orders o
+        WHERE o.user_id = %s
+    """
+    params = [user_id]
+    if cursor:
+        values = decode_cursor(cursor, 'orders', len(ORDER_HISTORY_COLUMNS))
+        condition, condition_params = keyset_condition(ORDER_HISTORY_COLUMNS, 'DESC', values)
+        query += f" AND ({condition})"
+        params.extend(condition_params)
+    query += " ORDER BY o.order_date DESC, o.order_id DESC LIMIT %s"
+    params.append(limit + 1)  # one extra row tells us whether another page exists
+    return query, params
+
+@timed
+def get_user_orders(user_id, cursor=None, limit=DEFAULT_ORDER_PAGE_SIZE):
+    """One page of a user's orders, newest first, each with its items.
+
+    Returns (orders, next_cursor); next_cursor is None on the last page.
+    Raises ValueError for a malformed cursor.
+    """
+    limit = max(1, min(int(limit), MAX_ORDER_PAGE_SIZE))
+    query, params = order_history_query(user_id, cursor, limit)
+
     db = get_db()
-    cursor = db.cursor(dictionary=True)
+    db_cursor = db.cursor(dictionary=True)
     try:
-        cursor.execute("""
-            SELECT order_id, total_amount, delivery_address, status, order_date 
-            FROM orders 
-            WHERE user_id = %s 
-            ORDER BY order_date DESC
-        """, (user_id,))
-        return cursor.fetchall()
-        
+        db_cursor.execute(query, params)
+        orders = db_cursor.fetchall()
+        next_cursor = None
+        if len(orders) > limit:
+            orders = orders[:limit]
+            last = orders[-1]
+            next_cursor = encode_cursor('orders', [last['order_date'], last['order_id']])
+        return _attach_items(db_cursor, orders), next_cursor
+
     except Exception as e:
         print(f"Error getting user orders: {e}")
-        return []
+        return [], None
     finally:
+        db_cursor.close()
+
+def order_report_query(user_id=None):
+    """SQL and parameters for every order (or every order of user_id), newest first."""
+    query = """
+        SELECT o.order_id, o.user_id, u.name AS username, o.total_amount,
+               o.delivery_address, o.status, o.order_date
+        FROM orders o
+        JOIN users u ON o.user_id = u.user_id
+    """
+    if user_id is None:
+        return query + " ORDER BY o.order_id DESC", []
+    return query + " WHERE o.user_id = %s ORDER BY o.order_date DESC, o.order_id DESC", [user_id]
+
+@timed
+def stream_orders(user_id=None):
+    """Orders for the admin report as chunks of rows, without items (see streaming.py)."""
+    query, params = order_report_query(user_id)
+    db = get_db()
+    cursor = db.cursor(dictionary=True)
+    try:
+        cursor.execute(query, params)
+    except Exception:
         cursor.close()
+        raise
+    return fetch_chunks(cursor)
+
+UPDATE_ORDER_STATUS = "UPDATE orders SET status = %s WHERE order_id = %s"
+
+def order_details_query(order_id, user_id=None):
+    """SQL and parameters for one order with its customer, optionally only if user_id owns it."""
+    query = """
+        SELECT o.order_id, o.user_id, o.total_amount, o.delivery_address, 
+               o.status, o.order_date, u.name AS username, u.email
+        FROM orders o
+        JOIN users u ON o.user_id = u.user_id
+        WHERE o.order_id = %s
+    """
+    params = [order_id]
+    if user_id is not None:
+        query += " AND o.user_id = %s"
+        params.append(user_id)
+    return query, params
 
-def get_order_details(order_id):
-    """Get detailed information about a specific order."""
+@timed
+def get_order_details(order_id, user_id=None):
+    """Get detailed information about a specific order.
+
+    With user_id, orders belonging to anyone else are treated as not found.
+    """
     db = get_db()
     cursor = db.cursor(dictionary=True)
     try:
-        # Get order info
-        cursor.execute("""
-            SELECT o.order_id, o.user_id, o.total_amount, o.delivery_address, 
-                   o.status, o.order_date, u.username, u.email
-            FROM orders o
-            JOIN users u ON o.user_id = u.user_id
-            WHERE o.order_id = %s
-        """, (order_id,))
+        query, params = order_details_query(order_id, user_id)
+        cursor.execute(query, params)
         order = cursor.fetchone()
         
         if not order:
             return None
             
-        # Get order items
-        cursor.execute("""
-            SELECT oi.product_id, oi.quantity, oi.price,
-                   p.name as product_name, p.description
-            FROM order_items oi
-            JOIN products p ON oi.product_id = p.product_id
-            WHERE oi.order_id = %s
-        """, (order_id,))
-        items = cursor.fetchall()
-        
-        order['items'] = items
-        return order
+        return _attach_items(cursor, [order])[0]
         
     except Exception as e:
         print(f"Error getting order details: {e}")
@@ -96,14 +236,13 @@ def get_order_details(order_id):
     finally:
         cursor.close()
 
+@timed
 def update_order_status(order_id, status):
     """Update the status of an order."""
     db = get_db()
     cursor = db.cursor()
     try:
-        cursor.execute("""
-            UPDATE orders SET status = %s WHERE order_id = %s
-        """, (status, order_id))
+        cursor.execute(UPDATE_ORDER_STATUS, (status, order_id))
         db.commit()
         return cursor.rowcount > 0
         
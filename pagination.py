@@ -0,0 +1,34 @@
+# pagination.py
+# Keyset (seek) pagination helpers shared by the product and order listings.
+import base64
+import json
+
+def encode_cursor(sort, values):
+    """Opaque cursor for the row after which the next page starts."""
+    raw = json.dumps([sort, [str(v) for v in values]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor, sort, size):
+    """Inverse of encode_cursor; raises ValueError for malformed or mismatched cursors."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_sort, values = json.loads(raw)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if cursor_sort != sort or len(values) != size:
+        raise ValueError("Cursor does not match sort order")
+    return values
+
+def keyset_condition(columns, direction, values):
+    """WHERE clause selecting rows strictly after the cursor position.
+
+    (a, b) > (x, y) is spelled out as a > x OR (a = x AND b > y) so MySQL can
+    use the index range on the leading column.
+    """
+    op = '>' if direction == 'ASC' else '<'
+    clauses, params = [], []
+    for i, column in enumerate(columns):
+        equal = [f"{c} = %s" for c in columns[:i]]
+        clauses.append("(" + " AND ".join(equal + [f"{column} {op} %s"]) + ")")
+        params.extend(values[:i + 1])
+    return " OR ".join(clauses), params
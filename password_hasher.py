@@ -0,0 +1,75 @@
+# password_hasher.py
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug import security
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# werkzeug method string; the cost is part of it, e.g. "pbkdf2:sha256:600000"
+# or "scrypt:32768:8:1". The default is werkzeug's own, so hashes stored before
+# this module existed stay current. Changing it rehashes each user on their
+# next login.
+HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+# Hashes waiting or running before new ones are turned away.
+HASH_QUEUE_SIZE = int(os.getenv('PASSWORD_HASH_QUEUE', HASH_WORKERS * 4))
+HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 10))
+
+class HashQueueFull(Exception):
+    """Raised when too many password hashes are already queued."""
+
+class HashTimeout(Exception):
+    """Raised when a password hash does not finish within HASH_TIMEOUT seconds."""
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(HASH_QUEUE_SIZE)
+
+def _get_executor():
+    # Created on first use so every forked web worker gets its own pool.
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+    return _executor
+
+def _run(fn, *args):
+    if not _slots.acquire(blocking=False):
+        raise HashQueueFull("Too many logins in progress, please retry shortly")
+    try:
+        return _get_executor().submit(fn, *args).result(timeout=HASH_TIMEOUT)
+    except FutureTimeout:
+        raise HashTimeout("Password check timed out, please retry shortly") from None
+    finally:
+        _slots.release()
+
+def hash_password(password):
+    """Hash a password with the configured method off the request thread."""
+    return _run(generate_password_hash, password, HASH_METHOD)
+
+def verify_password(password_hash, password):
+    """Check a password against a stored hash off the request thread."""
+    return _run(check_password_hash, password_hash, password)
+
+def _method_params(method):
+    """A werkzeug method string with the defaults it fills in spelled out.
+
+    "scrypt" -> ("scrypt", "32768", "8", "1"); "pbkdf2" -> ("pbkdf2", "sha256", "600000").
+    """
+    name, *params = method.split(':')
+    if name == 'scrypt':
+        defaults = [str(2 ** 15), '8', '1']
+    elif name == 'pbkdf2':
+        defaults = ['sha256', str(getattr(security, 'DEFAULT_PBKDF2_ITERATIONS', 600000))]
+    else:
+        defaults = []
+    return (name, *params, *defaults[len(params):])
+
+def needs_rehash(password_hash):
+    """True if a stored hash was made with a method or cost other than HASH_METHOD.
+
+    Compares the parameters stored in front of the salt; nothing is hashed.
+    """
+    return _method_params(password_hash.split('$', 1)[0]) != _method_params(HASH_METHOD)
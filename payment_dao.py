@@ -1,22 +1,38 @@
 from db import get_db
+from metrics import timed
+from streaming import fetch_chunks
 from datetime import datetime
 
+INSERT_PAYMENT = """
+    INSERT INTO payments (order_id, amount, status, payment_method, payment_date) 
+    VALUES (%s, %s, %s, %s, %s)
+"""
+CONFIRM_ORDER = "UPDATE orders SET status = 'confirmed' WHERE order_id = %s"
+UPDATE_PAYMENT_STATUS = "UPDATE payments SET status = %s WHERE payment_id = %s"
+SELECT_PAYMENT_HISTORY = """
+    SELECT p.payment_id, p.order_id, p.amount, p.status, 
+           p.payment_method, p.payment_date, o.total_amount
+    FROM payments p
+    JOIN orders o ON p.order_id = o.order_id
+    WHERE o.user_id = %s
+    ORDER BY p.payment_date DESC
+"""
+
+def record_payment(cursor, order_id, amount, status, payment_method):
+    """Write a payment row (and confirm the order) on the caller's cursor without committing."""
+    cursor.execute(INSERT_PAYMENT, (order_id, amount, status, payment_method, datetime.now()))
+    
+    # If payment is successful, update order status
+    if status == 'Completed':
+        cursor.execute(CONFIRM_ORDER, (order_id,))
+
+@timed
 def make_payment(order_id, amount, status, payment_method):
     """Record a payment for an order."""
     db = get_db()
     cursor = db.cursor()
     try:
-        cursor.execute("""
-            INSERT INTO payments (order_id, amount, status, payment_method, payment_date) 
-            VALUES (%s, %s, %s, %s, %s)
-        """, (order_id, amount, status, payment_method, datetime.now()))
-        
-        # If payment is successful, update order status
-        if status == 'Completed':
-            cursor.execute("""
-                UPDATE orders SET status = 'confirmed' WHERE order_id = %s
-            """, (order_id,))
-        
+        record_payment(cursor, order_id, amount, status, payment_method)
         db.commit()
         return True
         
@@ -27,19 +43,13 @@ def make_payment(order_id, amount, status, payment_method):
     finally:
         cursor.close()
 
+@timed
 def get_payment_history(user_id):
     """Get payment history for a user."""
     db = get_db()
     cursor = db.cursor(dictionary=True)
     try:
-        cursor.execute("""
-            SELECT p.payment_id, p.order_id, p.amount, p.status, 
-                   p.payment_method, p.payment_date, o.total_amount
-            FROM payments p
-            JOIN orders o ON p.order_id = o.order_id
-            WHERE o.user_id = %s
-            ORDER BY p.payment_date DESC
-        """, (user_id,))
+        cursor.execute(SELECT_PAYMENT_HISTORY, (user_id,))
         return cursor.fetchall()
         
     except Exception as e:
@@ -48,14 +58,38 @@ def get_payment_history(user_id):
     finally:
         cursor.close()
 
+def payment_report_query(user_id=None):
+    """SQL and parameters for every payment (or every payment of user_id), newest first."""
+    query = """
+        SELECT p.payment_id, p.order_id, o.user_id, p.amount, p.status,
+               p.payment_method, p.payment_date, o.total_amount
+        FROM payments p
+        JOIN orders o ON p.order_id = o.order_id
+    """
+    if user_id is None:
+        return query + " ORDER BY p.payment_id DESC", []
+    return query + " WHERE o.user_id = %s ORDER BY p.payment_date DESC", [user_id]
+
+@timed
+def stream_payments(user_id=None):
+    """Payments for the admin report as chunks of rows (see streaming.py)."""
+    query, params = payment_report_query(user_id)
+    db = get_db()
+    cursor = db.cursor(dictionary=True)
+    try:
+        cursor.execute(query, params)
+    except Exception:
+        cursor.close()
+        raise
+    return fetch_chunks(cursor)
+
+@timed
 def update_payment_status(payment_id, status):
     """Update payment status."""
     db = get_db()
     cursor = db.cursor()
     try:
-        cursor.execute("""
-            UPDATE payments SET status = %s WHERE payment_id = %s
-        """, (status, payment_id))
+        cursor.execute(UPDATE_PAYMENT_STATUS, (status, payment_id))
         db.commit()
         return cursor.rowcount > 0
         
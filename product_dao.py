@@ -1,35 +1,337 @@
+import os
+import time
+import re
+from datetime import datetime
 from db import get_db
+from storage import DB_BACKEND
+from metrics import timed
+from cache import TTLCache
+from pagination import encode_cursor, decode_cursor, keyset_condition
+from streaming import fetch_chunks
+from assets import STATIC_DIR, THUMB_WIDTHS, asset_url, thumb_url
+from search_index import MemorySearchBackend, MySQLFulltextBackend
+from related_products import RelatedProductsIndex
 
-def get_all_products():
+# Catalog reads are served from this cache; the write functions below invalidate it.
+catalog_cache = TTLCache(
+    maxsize=int(os.getenv('CATALOG_CACHE_SIZE', 2048)),
+    ttl=int(os.getenv('CATALOG_CACHE_TTL', 300)),
+)
+ALL_PRODUCTS_KEY = 'all_products'
+# The catalog version lives in the catalog_state row, which every worker bumps
+# after a catalog write. Each process re-reads it at most every
+# CATALOG_VERSION_POLL seconds; derived cache keys (pages, media, fragments)
+# and HTTP validators use it, so another worker's writes reach them within that.
+CATALOG_VERSION_POLL = float(os.getenv('CATALOG_VERSION_POLL', 1))
+catalog_version = 0
+catalog_changed_at = 0.0
+_version_checked_at = 0.0  # time.monotonic() of the last read of catalog_state
+
+# Keyset pagination: sort name -> (columns, direction). product_id is always the
+# last column so every key is unique and pages never skip or repeat rows.
+PAGE_SORTS = {
+    'id': (('product_id',), 'ASC'),
+    'name': (('name', 'product_id'), 'ASC'),
+    'price': (('price', 'product_id'), 'ASC'),
+    '-price': (('price', 'product_id'), 'DESC'),
+    'newest': (('product_id',), 'DESC'),
+}
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+def catalog_cache_stats():
+    """Hit/miss/eviction counters for the product catalog cache."""
+    return catalog_cache.stats()
+
+# Statements named here are also checked by explain_check.py.
+SELECT_ALL_PRODUCTS = "SELECT product_id AS id, name, price, description, 'static/images/default.png' as image_url FROM products"
+PRODUCT_COLUMNS = "product_id AS id, name, price, description, stock, 'static/images/default.png' as image_url"
+SELECT_PRODUCT = f"SELECT {PRODUCT_COLUMNS} FROM products WHERE product_id = %s"
+SELECT_PRODUCTS_BY_IDS = f"SELECT {PRODUCT_COLUMNS} FROM products WHERE product_id IN ({{placeholders}})"
+SELECT_MEDIA = "SELECT product_id, image_path, width, height FROM product_media"
+UPDATE_PRODUCT = """
+    UPDATE products 
+    SET name = %s, description = %s, price = %s, stock = %s 
+    WHERE product_id = %s
+"""
+DELETE_PRODUCT = "DELETE FROM products WHERE product_id = %s"
+SELECT_COPURCHASE_COUNTS = """
+    SELECT a.product_id, b.product_id, COUNT(*)
+    FROM order_items a
+    JOIN order_items b ON a.order_id = b.order_id AND a.product_id <> b.product_id
+    GROUP BY a.product_id, b.product_id
+"""
+SELECT_CATALOG_VERSION = "SELECT version, changed_at FROM catalog_state WHERE id = 1"
+BUMP_CATALOG_VERSION = "UPDATE catalog_state SET version = version + 1, changed_at = %s WHERE id = 1"
+
+def _sync_catalog_version():
+    """Pick up the shared catalog version if it is due for a re-read.
+
+    A version this process has not seen means another worker changed the
+    catalog, so everything cached from the old one is dropped.
+    """
+    global catalog_version, catalog_changed_at, _version_checked_at
+    now = time.monotonic()
+    if now - _version_checked_at < CATALOG_VERSION_POLL:
+        return
+    _version_checked_at = now
+    db = get_db()
+    cursor = db.cursor()
+    try:
+        cursor.execute(SELECT_CATALOG_VERSION)
+        rows = cursor.fetchall()
+    except Exception as e:
+        print(f"Error reading catalog version: {e}")
+        return
+    finally:
+        cursor.close()
+    if rows and rows[0][0] != catalog_version:
+        catalog_version, changed_at = rows[0]
+        catalog_changed_at = changed_at.timestamp()
+        catalog_cache.clear()
+
+def catalog_state():
+    """(version tag, last change time) of the catalog, shared by every worker."""
+    _sync_catalog_version()
+    return str(catalog_version), catalog_changed_at
+
+def _bump_catalog_version(db):
+    """Record a catalog change in catalog_state, after the change itself committed."""
+    cursor = db.cursor()
+    try:
+        cursor.execute(BUMP_CATALOG_VERSION, (datetime.now(),))
+        db.commit()
+        return True
+    except Exception as e:
+        db.rollback()
+        print(f"Error bumping catalog version: {e}")
+        return False
+    finally:
+        cursor.close()
+
+def _invalidate_catalog(product_id=None, db=None):
+    global _version_checked_at
+    catalog_cache.pop(ALL_PRODUCTS_KEY)
+    if product_id is not None:
+        catalog_cache.pop(('product', product_id))
+    if not _bump_catalog_version(db or get_db()):
+        catalog_cache.clear()  # versioned keys would otherwise stay current here
+    _version_checked_at = 0.0  # re-read the new version on the next lookup
+
+def stock_changed(product_ids, availability_changed=(), db=None):
+    """Invalidate cached products whose stock moved in a committed transaction.
+
+    Only the products' own entries are dropped. Listings, fragments and ETags
+    are keyed on the catalog version, so the stock counts they carry may lag
+    by up to CATALOG_CACHE_TTL; the version is bumped only when one of
+    availability_changed sold out or came back in stock.
+
+    db is the connection that wrote it; background jobs without an app context pass theirs.
+    """
+    for product_id in product_ids:
+        catalog_cache.pop(('product', product_id))
+    if availability_changed:
+        _invalidate_catalog(db=db)
+
+def _product_row(product_id, name, description, price):
+    """Shape a written product like the rows returned by get_all_products."""
+    return attach_images([{'id': product_id, 'name': name, 'price': price, 'description': description}])[0]
+
+PRODUCT_IMAGE_RE = re.compile(r'^product-(\d+)\.(png|jpe?g|webp)$')
+
+def _resolve_image(path, width=None, height=None):
+    full = asset_url(path)
+    variants = {w: thumb_url(path, w) for w in THUMB_WIDTHS}
+    srcset = [f"{url} {w}w" for w, url in variants.items() if url != full]
+    return {'image_url': full, 'image_width': width, 'image_height': height,
+            'image_srcset': ", ".join(srcset) or None}
+
+@timed
+def media_index(rows):
+    """{product_id: resolved image fields} from SELECT_MEDIA rows; async_api builds its own from these."""
+    return {row['product_id']: _resolve_image(row['image_path'], row['width'], row['height']) for row in rows}
+
+def get_media_index():
+    """{product_id: resolved image fields} for every product, from one query.
+
+    URLs (including fingerprinted and thumbnail variants from the asset build)
+    are resolved once here, so listing pages just copy them onto each row.
+    """
+    _sync_catalog_version()
+    key = ('media', catalog_version)
+    index = catalog_cache.get(key)
+    if index is not None:
+        return index
+    index = {}
     db = get_db()
     cursor = db.cursor(dictionary=True)
-    query = "SELECT product_id AS id, name, price, description, 'static/images/default.png' as image_url FROM products"
-    cursor.execute(query)
-    products = cursor.fetchall()
-    cursor.close()
+    try:
+        cursor.execute(SELECT_MEDIA)
+        index = media_index(cursor.fetchall())
+    except Exception as e:
+        print(f"Error loading product media: {e}")
+    finally:
+        cursor.close()
+    catalog_cache.set(key, index)
+    return index
+
+def attach_images(products, id_key='id', media=None):
+    """Set image fields on product rows in one pass over the cached media index."""
+    if media is None:
+        media = get_media_index()
+    for product in products:
+        found = media.get(product[id_key])
+        if found is None:
+            # Not registered yet: fall back to the static/images/product-<id>.png convention.
+            found = _resolve_image(f"images/product-{product[id_key]}.png")
+        product.update(found)
     return products
 
-def search_products(search_term):
+def set_product_image(product_id, image_path, width=None, height=None):
+    """Record the image (a path under static/) for a product."""
+    return set_product_images([(product_id, image_path, width, height)])
+
+@timed
+def set_product_images(rows):
+    """Upsert (product_id, image_path, width, height) rows in one transaction."""
+    db = get_db()
+    cursor = db.cursor()
+    try:
+        cursor.executemany("""
+            INSERT INTO product_media (product_id, image_path, width, height) VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE image_path = VALUES(image_path), width = VALUES(width), height = VALUES(height)
+        """, rows)
+        db.commit()
+        _invalidate_catalog()
+        catalog_cache.clear()  # cached rows carry the old image fields
+        return True
+    except Exception as e:
+        db.rollback()
+        print(f"Error saving product media: {e}")
+        return False
+    finally:
+        cursor.close()
+
+@timed
+def import_product_images():
+    """Register static/images/product-<id>.<ext> files, with dimensions when Pillow is available."""
+    try:
+        from PIL import Image
+    except ImportError:
+        Image = None
+    rows = []
+    images_dir = os.path.join(STATIC_DIR, 'images')
+    for name in sorted(os.listdir(images_dir)):
+        match = PRODUCT_IMAGE_RE.match(name)
+        if not match:
+            continue
+        width = height = None
+        if Image is not None:
+            with Image.open(os.path.join(images_dir, name)) as image:
+                width, height = image.size
+        rows.append((int(match.group(1)), f"images/{name}", width, height))
+    if not rows:
+        return 0
+    # Only products that exist; the foreign key would reject the rest.
+    existing = {p['id'] for p in get_products_by_ids([row[0] for row in rows])}
+    rows = [row for row in rows if row[0] in existing]
+    return len(rows) if rows and set_product_images(rows) else 0
+
+@timed
+def get_all_products():
+    _sync_catalog_version()
+    products = catalog_cache.get(ALL_PRODUCTS_KEY)
+    if products is not None:
+        return products
     db = get_db()
     cursor = db.cursor(dictionary=True)
-    
-    # Use LIKE to search for the term in both name and description
-    query = """
-        SELECT product_id AS id, name, price, description, 'static/images/default.png' as image_url 
-        FROM products 
-        WHERE name LIKE %s OR description LIKE %s
-    """
-    # The '%' symbols are wildcards for the LIKE query
-    search_pattern = f"%{search_term}%"
-    
-    cursor.execute(query, (search_pattern, search_pattern))
-    products = cursor.fetchall()
+    cursor.execute(SELECT_ALL_PRODUCTS)
+    products = attach_images(cursor.fetchall())
     cursor.close()
-    
+    catalog_cache.set(ALL_PRODUCTS_KEY, products)
     return products
 
+@timed
+def search_products(search_term, limit=20, offset=0):
+    """Ranked product search; returns (products, total_matches)."""
+    products, total = search_backend.search(search_term, limit, offset)
+    # The memory backend returns the rows its index holds; decorate copies, not those.
+    return attach_images([dict(product) for product in products]), total
+
+def page_query(cursor, limit, sort):
+    """SQL and parameters for one keyset page; fetches one row more than limit."""
+    if sort not in PAGE_SORTS:
+        raise ValueError(f"Unknown sort '{sort}'")
+    columns, direction = PAGE_SORTS[sort]
+    query = "SELECT product_id AS id, name, price, description, stock, 'static/images/default.png' as image_url FROM products"
+    params = []
+    if cursor:
+        condition, params = keyset_condition(columns, direction, decode_cursor(cursor, sort, len(columns)))
+        query += f" WHERE {condition}"
+    query += " ORDER BY " + ", ".join(f"{c} {direction}" for c in columns) + " LIMIT %s"
+    params.append(limit + 1)  # one extra row tells us whether another page exists
+    return query, params
+
+def page_result(products, limit, sort):
+    """Trim the extra row fetched by page_query into (products, next_cursor)."""
+    if len(products) <= limit:
+        return products, None
+    products = products[:limit]
+    last = products[-1]
+    columns = PAGE_SORTS[sort][0]
+    return products, encode_cursor(sort, [last['id' if c == 'product_id' else c] for c in columns])
+
+@timed
+def get_products_page(cursor=None, limit=DEFAULT_PAGE_SIZE, sort='id'):
+    """One page of the catalog using keyset pagination.
+
+    Returns (products, next_cursor); next_cursor is None on the last page.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    _sync_catalog_version()
+    key = ('page', catalog_version, sort, cursor, limit)
+    page = catalog_cache.get(key)
+    if page is not None:
+        return page
+
+    query, params = page_query(cursor, limit, sort)
+    db = get_db()
+    db_cursor = db.cursor(dictionary=True)
+    try:
+        db_cursor.execute(query, params)
+        products = attach_images(db_cursor.fetchall())
+    finally:
+        db_cursor.close()
+
+    page = page_result(products, limit, sort)
+    catalog_cache.set(key, page)
+    return page
+
+def catalog_query(sort):
+    """SQL for the whole catalog in a PAGE_SORTS order."""
+    if sort not in PAGE_SORTS:
+        raise ValueError(f"Unknown sort '{sort}'")
+    columns, direction = PAGE_SORTS[sort]
+    return ("SELECT product_id AS id, name, price, description, stock, 'static/images/default.png' as image_url"
+            " FROM products ORDER BY " + ", ".join(f"{c} {direction}" for c in columns))
+
+@timed
+def stream_products(sort='id'):
+    """The whole catalog in sort order as chunks of product rows (see streaming.py)."""
+    query = catalog_query(sort)
+    media = get_media_index()  # loaded first: the connection is busy while the rows stream
+    db = get_db()
+    cursor = db.cursor(dictionary=True)
+    try:
+        cursor.execute(query)
+    except Exception:
+        cursor.close()
+        raise
+    return (attach_images(rows, media=media) for rows in fetch_chunks(cursor))
+
 # In product_dao.py
 
+@timed
 def add_new_product(name, description, price, stock):
     """Inserts a new product into the database."""
     db = get_db()
@@ -38,6 +340,10 @@ def add_new_product(name, description, price, stock):
         query = "INSERT INTO products (name, description, price, stock) VALUES (%s, %s, %s, %s)"
         cursor.execute(query, (name, description, price, stock))
         db.commit()
+        _invalidate_catalog()
+        row = _product_row(cursor.lastrowid, name, description, price)
+        search_backend.product_saved(row)
+        related_index.product_saved(row)
         return cursor.lastrowid # Return the ID of the new product
     except Exception as e:
         db.rollback()
@@ -46,18 +352,19 @@ def add_new_product(name, description, price, stock):
     finally:
         cursor.close()
 
+@timed
 def update_product_details(product_id, name, description, price, stock):
     """Updates an existing product's details in the database."""
     db = get_db()
     cursor = db.cursor()
     try:
-        query = """
-            UPDATE products 
-            SET name = %s, description = %s, price = %s, stock = %s 
-            WHERE product_id = %s
-        """
-        cursor.execute(query, (name, description, price, stock, product_id))
+        cursor.execute(UPDATE_PRODUCT, (name, description, price, stock, product_id))
         db.commit()
+        if cursor.rowcount > 0:
+            _invalidate_catalog(product_id)
+            row = _product_row(product_id, name, description, price)
+            search_backend.product_saved(row)
+            related_index.product_saved(row)
         return cursor.rowcount > 0 # Returns True if a row was updated
     except Exception as e:
         db.rollback()
@@ -66,14 +373,17 @@ def update_product_details(product_id, name, description, price, stock):
     finally:
         cursor.close()
 
+@timed
 def delete_product_by_id(product_id):
     """Deletes a product from the database by its ID."""
     db = get_db()
     cursor = db.cursor()
     try:
-        query = "DELETE FROM products WHERE product_id = %s"
-        cursor.execute(query, (product_id,))
+        cursor.execute(DELETE_PRODUCT, (product_id,))
         db.commit()
+        _invalidate_catalog(product_id)
+        search_backend.product_deleted(product_id)
+        related_index.product_deleted(product_id)
         return cursor.rowcount > 0 # Returns True if a row was deleted
     except Exception as e:
         db.rollback()
@@ -82,17 +392,154 @@ def delete_product_by_id(product_id):
     finally:
         cursor.close()
 
+# Multi-row upsert for bulk feeds; {rows} is one "(%s, %s, %s, %s, %s)" group per row.
+# A row without a description keeps the stored one.
+UPSERT_PRODUCTS = """
+    INSERT INTO products (product_id, name, description, price, stock) VALUES {rows}
+    ON DUPLICATE KEY UPDATE name = VALUES(name), description = COALESCE(VALUES(description), description),
+        price = VALUES(price), stock = VALUES(stock)
+"""
+
+def _upsert_statement(count):
+    return UPSERT_PRODUCTS.format(rows=", ".join(["(%s, %s, %s, %s, %s)"] * count))
+
+@timed
+def upsert_products(rows):
+    """Insert or update (product_id, name, description, price, stock) rows in one transaction.
+
+    A product_id of None inserts a new product. If the batch statement fails,
+    each row is retried on its own so a bad row only fails itself.
+    Returns (rows written, [(index in rows, error message), ...]).
+    """
+    if not rows:
+        return 0, []
+    db = get_db()
+    cursor = db.cursor()
+    errors = []
+    try:
+        try:
+            cursor.execute(_upsert_statement(len(rows)), [value for row in rows for value in row])
+            db.commit()
+            written = len(rows)
+        except Exception:
+            db.rollback()
+            written = 0
+            for i, row in enumerate(rows):
+                try:
+                    cursor.execute(_upsert_statement(1), row)
+                    db.commit()
+                    written += 1
+                except Exception as e:
+                    db.rollback()
+                    errors.append((i, str(e)))
+    finally:
+        cursor.close()
+    if written:
+        _invalidate_catalog()
+        catalog_cache.clear()
+        search_backend.invalidate()
+        related_index.invalidate()
+    return written, errors
+
+def iter_products(batch_size=1000):
+    """Yield every product as a dict in product_id order, reading one keyset batch at a time."""
+    last_id = 0
+    while True:
+        db = get_db()
+        cursor = db.cursor(dictionary=True)
+        try:
+            cursor.execute("""
+                SELECT product_id, name, description, price, stock FROM products
+                WHERE product_id > %s ORDER BY product_id LIMIT %s
+            """, (last_id, batch_size))
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1]['product_id']
+
+@timed
 def get_product_by_id(product_id):
     """Fetches a single product from the database by its ID."""
+    _sync_catalog_version()
+    product = catalog_cache.get(('product', product_id))
+    if product is not None:
+        return product
     db = get_db()
     cursor = db.cursor(dictionary=True)
     try:
-        query = "SELECT product_id AS id, name, price, description, stock, 'static/images/default.png' as image_url FROM products WHERE product_id = %s"
-        cursor.execute(query, (product_id,))
+        cursor.execute(SELECT_PRODUCT, (product_id,))
         product = cursor.fetchone()
+        if product:
+            attach_images([product])
+            catalog_cache.set(('product', product_id), product)
         return product
     except Exception as e:
         print(f"Error fetching product by ID: {e}")
         return None
     finally:
-        cursor.close()
\ No newline at end of file
+        cursor.close()
+
+@timed
+def get_products_by_ids(product_ids):
+    """Fetch several products in one query, preserving the order of product_ids.
+
+    Ids that no longer exist are skipped.
+    """
+    _sync_catalog_version()
+    found = {}
+    missing = []
+    for product_id in product_ids:
+        product = catalog_cache.get(('product', product_id))
+        if product is not None:
+            found[product_id] = product
+        else:
+            missing.append(product_id)
+
+    if missing:
+        db = get_db()
+        cursor = db.cursor(dictionary=True)
+        try:
+            placeholders = ", ".join(["%s"] * len(missing))
+            cursor.execute(SELECT_PRODUCTS_BY_IDS.format(placeholders=placeholders), missing)
+            for product in attach_images(cursor.fetchall()):
+                catalog_cache.set(('product', product['id']), product)
+                found[product['id']] = product
+        except Exception as e:
+            print(f"Error fetching products by ID: {e}")
+        finally:
+            cursor.close()
+    return [found[pid] for pid in product_ids if pid in found]
+
+@timed
+def _load_copurchase_counts():
+    """(product_id, other_id, times) for every pair of products ordered together."""
+    db = get_db()
+    cursor = db.cursor()
+    try:
+        cursor.execute(SELECT_COPURCHASE_COUNTS)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+@timed
+def get_related_products(product_id):
+    """Top related products for a product detail page."""
+    return get_products_by_ids(related_index.related(product_id))
+
+related_index = RelatedProductsIndex(
+    get_all_products, _load_copurchase_counts,
+    k=int(os.getenv('RELATED_PRODUCTS_K', 8)),
+    max_age=int(os.getenv('RELATED_PRODUCTS_MAX_AGE', 3600)),
+)
+
+# SEARCH_BACKEND=mysql uses the FULLTEXT index created by migrations.py;
+# the default in-process index needs no schema support.
+if os.getenv('SEARCH_BACKEND', 'memory') == 'mysql':
+    if DB_BACKEND != 'mysql':
+        raise RuntimeError("SEARCH_BACKEND=mysql needs DB_BACKEND=mysql")
+    search_backend = MySQLFulltextBackend(get_db)
+else:
+    search_backend = MemorySearchBackend(get_all_products, max_age=int(os.getenv('SEARCH_INDEX_MAX_AGE', 300)))
@@ -0,0 +1,175 @@
+# profiling.py
+# Opt-in request profiling. With PROFILE_SAMPLE_RATE > 0 a random fraction of
+# requests is profiled:
+#   - the request's time is split into db (statements run through get_db),
+#     template (Jinja rendering) and app (everything else), reported in a
+#     Server-Timing header and on the 'profile' logger;
+#   - a sampler thread records the request thread's stack every
+#     PROFILE_INTERVAL_MS and appends the samples to PROFILE_DIR/<endpoint>.folded
+#     in collapsed-stack format, ready for flamegraph.pl or speedscope:
+#
+#       flamegraph.pl instance/profiles/product_detail.folded > product_detail.svg
+#
+# With the default rate of 0 no hooks are installed at all.
+import collections
+import contextvars
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+from flask import request, template_rendered, before_render_template
+
+import metrics
+
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', 5))
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'profiles'))
+
+profile_log = logging.getLogger('profile')
+
+class RequestProfile:
+    __slots__ = ('thread_id', 'started', 'db', 'template', 'template_depth', 'template_started', 'stacks')
+
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+        self.started = time.perf_counter()
+        self.db = 0.0
+        self.template = 0.0
+        self.template_depth = 0
+        self.template_started = 0.0
+        self.stacks = None
+
+_current = contextvars.ContextVar('request_profile', default=None)
+
+def fold(frame):
+    """One collapsed-stack line (without the count) for frame, outermost call first."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+class StackSampler:
+    """Samples the stacks of registered threads from one background thread.
+
+    The thread only wakes while at least one sampled request is running.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._targets = {}  # thread id -> Counter of folded stacks
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self, thread_id):
+        with self._lock:
+            self._targets[thread_id] = collections.Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def stop(self, thread_id):
+        """Stop sampling a thread and return its Counter of stacks."""
+        with self._lock:
+            return self._targets.pop(thread_id, collections.Counter())
+
+    def _run(self):
+        while True:
+            with self._lock:
+                idle = not self._targets
+                if not idle:
+                    frames = sys._current_frames()
+                    for thread_id, stacks in self._targets.items():
+                        frame = frames.get(thread_id)
+                        if frame is not None:
+                            stacks[fold(frame)] += 1
+            if idle:
+                self._wake.wait()
+                self._wake.clear()
+            else:
+                time.sleep(self.interval)
+
+_sampler = StackSampler(PROFILE_INTERVAL_MS / 1000)
+_write_lock = threading.Lock()
+
+def _record_query(seconds):
+    profile = _current.get()
+    if profile is not None:
+        profile.db += seconds
+
+def _template_started(sender, template, context, **extra):
+    profile = _current.get()
+    if profile is not None:
+        if profile.template_depth == 0:
+            profile.template_started = time.perf_counter()
+        profile.template_depth += 1
+
+def _template_finished(sender, template, context, **extra):
+    profile = _current.get()
+    if profile is not None and profile.template_depth:
+        profile.template_depth -= 1
+        if profile.template_depth == 0:
+            profile.template += time.perf_counter() - profile.template_started
+
+def _start_profile():
+    if random.random() >= PROFILE_SAMPLE_RATE:
+        return
+    profile = RequestProfile(threading.get_ident())
+    _current.set(profile)
+    _sampler.start(profile.thread_id)
+
+def _write_stacks(endpoint, stacks):
+    if not stacks:
+        return
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, re.sub(r'[^\w.-]', '_', endpoint) + '.folded')
+    # flame-graph tools sum repeated stacks, so each request just appends its own.
+    with _write_lock, open(path, 'a') as f:
+        for stack, count in stacks.items():
+            f.write(f"{stack} {count}\n")
+
+def _finish_profile(response):
+    profile = _current.get()
+    if profile is None:
+        return response
+    _current.set(None)
+    stacks = _sampler.stop(profile.thread_id)
+    total = time.perf_counter() - profile.started
+    app_time = max(total - profile.db - profile.template, 0.0)
+    endpoint = request.endpoint or 'unknown'
+
+    timing = f"db;dur={profile.db * 1000:.1f}, template;dur={profile.template * 1000:.1f}, app;dur={app_time * 1000:.1f}"
+    existing = response.headers.get('Server-Timing')
+    response.headers['Server-Timing'] = f"{existing}, {timing}" if existing else timing
+    profile_log.info("%s %.1fms db=%.1fms template=%.1fms app=%.1fms samples=%d", endpoint, total * 1000,
+                     profile.db * 1000, profile.template * 1000, app_time * 1000, sum(stacks.values()))
+    try:
+        _write_stacks(endpoint, stacks)
+    except OSError as e:
+        print(f"Error writing profile for {endpoint}: {e}")
+    return response
+
+def _discard_profile(error=None):
+    # A request that raised never reached after_request; stop sampling its thread.
+    profile = _current.get()
+    if profile is not None:
+        _current.set(None)
+        _sampler.stop(profile.thread_id)
+
+def init_app(app):
+    """Install the profiling hooks if PROFILE_SAMPLE_RATE is above zero."""
+    if PROFILE_SAMPLE_RATE <= 0:
+        return
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    app.teardown_request(_discard_profile)
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_finished, app)
+    metrics.query_listeners.append(_record_query)
@@ -0,0 +1,119 @@
+# related_products.py
+import heapq
+import threading
+import time
+from array import array
+from collections import Counter, defaultdict
+
+from search_index import tokenize
+
+# Tokens shared by more products than this ("fresh", "organic") say little about
+# similarity and would make candidate generation O(catalog), so they are skipped.
+MAX_TOKEN_FANOUT = 500
+
+class RelatedProductsIndex:
+    """Bounded top-K "related products" list per product.
+
+    Neighbours are ranked by how often they were bought together (from
+    order_items), with name similarity breaking ties and filling lists for
+    products that have no order history yet. Each list is stored as a compact
+    int array, so a lookup is O(K).
+    """
+
+    def __init__(self, product_loader, copurchase_loader, k=8, max_age=3600):
+        self.product_loader = product_loader        # -> iterable of product dicts
+        self.copurchase_loader = copurchase_loader  # -> iterable of (product_id, other_id, times)
+        self.k = k
+        self.max_age = max_age
+        self._copurchase = defaultdict(Counter)     # product_id -> Counter(other_id -> times)
+        self._names = {}                            # product_id -> frozenset of name tokens
+        self._by_token = defaultdict(set)           # name token -> product_ids
+        self._neighbors = {}                        # product_id -> array('i') of top-K ids
+        self._built_at = None
+        self._lock = threading.RLock()
+
+    def related(self, product_id):
+        """Ids of the products related to product_id, best first."""
+        self._ensure_built()
+        return list(self._neighbors.get(product_id, ()))
+
+    def record_order(self, product_ids):
+        """Count a new order's items as bought together and refresh their lists."""
+        if self._built_at is None:
+            return  # the first build will read this order from the database
+        product_ids = set(product_ids)
+        with self._lock:
+            for product_id in product_ids:
+                for other_id in product_ids:
+                    if other_id != product_id:
+                        self._copurchase[product_id][other_id] += 1
+            for product_id in product_ids:
+                self._refresh(product_id)
+
+    def product_saved(self, product):
+        if self._built_at is None:
+            return
+        with self._lock:
+            self._set_name(product['id'], product.get('name'))
+            self._refresh(product['id'])
+
+    def product_deleted(self, product_id):
+        # Other lists may still name this product until the next rebuild;
+        # callers drop ids that no longer resolve to a product.
+        with self._lock:
+            self._set_name(product_id, None)
+            self._copurchase.pop(product_id, None)
+            self._neighbors.pop(product_id, None)
+
+    def invalidate(self):
+        """Rebuild from the loaders on the next lookup, e.g. after a bulk import."""
+        with self._lock:
+            self._built_at = None
+
+    def _ensure_built(self):
+        if self._built_at is not None and time.monotonic() - self._built_at <= self.max_age:
+            return
+        with self._lock:
+            if self._built_at is not None and time.monotonic() - self._built_at <= self.max_age:
+                return
+            self._copurchase.clear()
+            self._names.clear()
+            self._by_token.clear()
+            self._neighbors.clear()
+            for product in self.product_loader():
+                self._set_name(product['id'], product.get('name'))
+            for product_id, other_id, times in self.copurchase_loader():
+                self._copurchase[product_id][other_id] = times
+            for product_id in self._names:
+                self._refresh(product_id)
+            self._built_at = time.monotonic()
+
+    def _set_name(self, product_id, name):
+        for token in self._names.pop(product_id, ()):
+            self._by_token[token].discard(product_id)
+        if name is None:
+            return
+        tokens = frozenset(tokenize(name))
+        self._names[product_id] = tokens
+        for token in tokens:
+            self._by_token[token].add(product_id)
+
+    def _refresh(self, product_id):
+        tokens = self._names.get(product_id, frozenset())
+        bought_with = self._copurchase.get(product_id, {})
+
+        candidates = set(bought_with)
+        for token in tokens:
+            sharing = self._by_token.get(token, ())
+            if len(sharing) <= MAX_TOKEN_FANOUT:
+                candidates.update(sharing)
+        candidates.discard(product_id)
+
+        def score(other_id):
+            other_tokens = self._names.get(other_id, frozenset())
+            union = len(tokens | other_tokens)
+            similarity = len(tokens & other_tokens) / union if union else 0.0
+            return bought_with.get(other_id, 0) + similarity
+
+        top = heapq.nlargest(self.k, candidates, key=lambda other_id: (score(other_id), -other_id))
+        self._neighbors[product_id] = array('i', top)
@@ -0,0 +1,197 @@
+# search_index.py
+import bisect
+import heapq
+import re
+import threading
+import time
+from collections import defaultdict
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Relevance weights: a hit in the product name counts more than one in the description,
+# and an exact token match counts more than a prefix match.
+NAME_WEIGHT = 3.0
+DESCRIPTION_WEIGHT = 1.0
+PREFIX_FACTOR = 0.5
+
+def tokenize(text):
+    """Lowercase the text and split it into alphanumeric tokens."""
+    return TOKEN_RE.findall((text or "").lower())
+
+class InvertedIndex:
+    """In-process inverted index over product name and description."""
+
+    def __init__(self):
+        self._postings = defaultdict(dict)  # token -> {product_id: weight}
+        self._tokens = []                    # sorted vocabulary, used for prefix lookups
+        self._docs = {}                      # product_id -> (product, tokens)
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, product):
+        """Index a product dict with at least 'id', 'name' and 'description' keys."""
+        weights = defaultdict(float)
+        for token in tokenize(product.get('name')):
+            weights[token] += NAME_WEIGHT
+        for token in tokenize(product.get('description')):
+            weights[token] += DESCRIPTION_WEIGHT
+
+        with self._lock:
+            self.remove(product['id'])
+            for token, weight in weights.items():
+                postings = self._postings[token]
+                if not postings:
+                    bisect.insort(self._tokens, token)
+                postings[product['id']] = weight
+            self._docs[product['id']] = (product, tuple(weights))
+
+    def remove(self, product_id):
+        with self._lock:
+            doc = self._docs.pop(product_id, None)
+            if doc is None:
+                return
+            for token in doc[1]:
+                postings = self._postings.get(token)
+                if postings is None:
+                    continue
+                postings.pop(product_id, None)
+                if not postings:
+                    del self._postings[token]
+                    i = bisect.bisect_left(self._tokens, token)
+                    if i < len(self._tokens) and self._tokens[i] == token:
+                        del self._tokens[i]
+
+    def _expand(self, term):
+        """Vocabulary tokens starting with term."""
+        i = bisect.bisect_left(self._tokens, term)
+        while i < len(self._tokens) and self._tokens[i].startswith(term):
+            yield self._tokens[i]
+            i += 1
+
+    def search(self, query, limit=20, offset=0):
+        """Return (products, total) for products matching every query term.
+
+        Each term matches tokens it is a prefix of, so partial input ("onio")
+        already finds "onion" for type-ahead.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return [], 0
+
+        with self._lock:
+            scores = None
+            for term in terms:
+                term_scores = {}
+                for token in self._expand(term):
+                    factor = 1.0 if token == term else PREFIX_FACTOR
+                    for product_id, weight in self._postings[token].items():
+                        score = weight * factor
+                        if score > term_scores.get(product_id, 0.0):
+                            term_scores[product_id] = score
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {pid: s + term_scores[pid] for pid, s in scores.items() if pid in term_scores}
+                if not scores:
+                    return [], 0
+
+            # Only the requested page needs ordering, not every match.
+            top = heapq.nsmallest(offset + limit, scores.items(), key=lambda item: (-item[1], item[0]))
+            return [self._docs[pid][0] for pid, _ in top[offset:]], len(scores)
+
+class MemorySearchBackend:
+    """Search backend holding an InvertedIndex built from a product loader.
+
+    The index is updated incrementally by the product write functions and
+    rebuilt from the loader once it is older than max_age seconds, so workers
+    that did not see a write still converge.
+    """
+
+    def __init__(self, loader, max_age=300):
+        self.loader = loader
+        self.max_age = max_age
+        self._index = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+
+    def _get_index(self):
+        if self._index is None or time.monotonic() - self._built_at > self.max_age:
+            with self._lock:
+                if self._index is None or time.monotonic() - self._built_at > self.max_age:
+                    index = InvertedIndex()
+                    for product in self.loader():
+                        index.add(product)
+                    self._index = index
+                    self._built_at = time.monotonic()
+        return self._index
+
+    def search(self, query, limit=20, offset=0):
+        return self._get_index().search(query, limit, offset)
+
+    def product_saved(self, product):
+        if self._index is not None:
+            self._index.add(product)
+
+    def product_deleted(self, product_id):
+        if self._index is not None:
+            self._index.remove(product_id)
+
+    def invalidate(self):
+        """Rebuild from the loader on the next search, e.g. after a bulk import."""
+        self._index = None
+
+# Boolean-mode FULLTEXT queries over ft_products_name_description; the
+# parameter is the boolean query string built in MySQLFulltextBackend.search.
+FULLTEXT_SEARCH = """
+    SELECT product_id AS id, name, price, description,
+           'static/images/default.png' as image_url,
+           MATCH(name, description) AGAINST (%s IN BOOLEAN MODE) AS score
+    FROM products
+    WHERE MATCH(name, description) AGAINST (%s IN BOOLEAN MODE)
+    ORDER BY score DESC, product_id
+    LIMIT %s OFFSET %s
+"""
+FULLTEXT_COUNT = """
+    SELECT COUNT(*) AS total FROM products
+    WHERE MATCH(name, description) AGAINST (%s IN BOOLEAN MODE)
+"""
+
+class MySQLFulltextBackend:
+    """Search backend using the FULLTEXT index on products(name, description).
+
+    MySQL maintains the index itself, so the write hooks are no-ops.
+    """
+
+    def __init__(self, get_db):
+        self.get_db = get_db
+
+    def search(self, query, limit=20, offset=0):
+        terms = tokenize(query)
+        if not terms:
+            return [], 0
+        # Boolean mode: every term required, each matched as a prefix.
+        boolean_query = " ".join(f"+{term}*" for term in terms)
+
+        db = self.get_db()
+        cursor = db.cursor(dictionary=True)
+        try:
+            cursor.execute(FULLTEXT_SEARCH, (boolean_query, boolean_query, limit, offset))
+            products = cursor.fetchall()
+            cursor.execute(FULLTEXT_COUNT, (boolean_query,))
+            total = cursor.fetchone()['total']
+            for product in products:
+                product.pop('score', None)
+            return products, total
+        finally:
+            cursor.close()
+
+    def product_saved(self, product):
+        pass
+
+    def product_deleted(self, product_id):
+        pass
+
+    def invalidate(self):
+        pass
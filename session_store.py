@@ -0,0 +1,105 @@
+# session_store.py
+import json
+import secrets
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from cache import TTLCache
+
+try:
+    import redis
+except ImportError:  # only needed for SESSION_BACKEND=redis
+    redis = None
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session data kept on the server; the cookie only carries a random id."""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(session):
+            session.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.rotate = False
+
+    def regenerate(self):
+        """Move the data to a fresh id on save, e.g. after login, to prevent session fixation."""
+        self.rotate = True
+        self.modified = True
+
+class MemorySessionStore:
+    """Sessions in a size-bounded LRU; each worker process has its own."""
+
+    def __init__(self, maxsize=50000, ttl=7 * 24 * 3600):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def load(self, sid):
+        return self._cache.get(sid)
+
+    def save(self, sid, data):
+        self._cache.set(sid, dict(data))
+
+    def delete(self, sid):
+        self._cache.pop(sid)
+
+class RedisSessionStore:
+    """Sessions in Redis, shared by all workers and surviving restarts."""
+
+    def __init__(self, url, ttl=7 * 24 * 3600):
+        if redis is None:
+            raise RuntimeError("SESSION_BACKEND=redis requires the redis package")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def load(self, sid):
+        raw = self.client.get(f"session:{sid}")
+        return json.loads(raw) if raw else None
+
+    def save(self, sid, data):
+        self.client.setex(f"session:{sid}", self.ttl, json.dumps(dict(data)))
+
+    def delete(self, sid):
+        self.client.delete(f"session:{sid}")
+
+class ServerSideSessionInterface(SessionInterface):
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            data = self.store.load(sid)
+            if data is not None:
+                return ServerSideSession(data, sid=sid)
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if session.rotate:
+            self.store.delete(session.sid)
+            session.sid = secrets.token_urlsafe(32)
+        if session.modified or session.rotate:
+            self.store.save(session.sid, session)
+        if session.new or session.rotate or self.should_set_cookie(app, session):
+            response.set_cookie(
+                name, session.sid, expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app),
+            )
+
+def create_session_interface(kind, redis_url=None):
+    """Session interface for SESSION_BACKEND; None keeps Flask's signed-cookie sessions."""
+    if kind == 'memory':
+        return ServerSideSessionInterface(MemorySessionStore())
+    if kind == 'redis':
+        return ServerSideSessionInterface(RedisSessionStore(redis_url or 'redis://localhost:6379/0'))
+    return None
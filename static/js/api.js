@@ -70,7 +70,10 @@ class Auth {
 
 // --- Product Functions ---
 class ProductManager {
-    static async getProducts() { return await makeRequest(`${API_BASE_URL}/products`); }
+    static async getProducts(cursor = null) {
+        const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+        return await makeRequest(`${API_BASE_URL}/products${query}`);
+    }
     static async searchProducts(query) { return await makeRequest(`/search?query=${encodeURIComponent(query)}`); }
 
     static renderProducts(products, container) {
@@ -78,7 +81,7 @@ class ProductManager {
         container.innerHTML = products.map(product => `
             <div class="swiper-slide box" data-product-id="${product.id}">
                 <a href="/product/${product.id}" style="text-decoration: none; color: inherit;">
-                    <img src="/static/images/product-${product.id}.png" alt="${product.name}">
+                    <img src="${product.image_url}" alt="${product.name}">
                     <h1>${product.name}</h1>
                 </a>
                 <div class="price">₹${product.price.toFixed(2)}</div>
@@ -468,6 +471,9 @@ class OrderManager {
                 return;
             }
 
+            // Hold the stock while the customer pays
+            await makeRequest(`${API_BASE_URL}/cart/reserve`, { method: 'POST' });
+
             // Show payment modal
             PaymentManager.showPaymentModal(cart.total);
 
@@ -501,6 +507,16 @@ class AdminManager {
             window.location.reload();
         } catch (error) { console.error('Delete product error:', error); }
     }
+    static products = [];
+    static nextCursor = null;
+    static async loadNextPage() {
+        const data = await ProductManager.getProducts(this.nextCursor);
+        this.products = this.products.concat(data.products);
+        this.nextCursor = data.next_cursor;
+        this.populateProductList(this.products);
+        const loadMoreBtn = document.getElementById('load-more-btn');
+        if (loadMoreBtn) loadMoreBtn.style.display = this.nextCursor ? 'inline-block' : 'none';
+    }
     static populateProductList(products) {
         const productList = document.getElementById('product-list');
         if (!productList) return;
@@ -617,9 +633,11 @@ document.addEventListener('DOMContentLoaded', () => {
             cancelBtn.addEventListener('click', (e) => { e.preventDefault(); AdminManager.clearForm(); });
         }
 
-        ProductManager.getProducts().then(data => {
-            AdminManager.populateProductList(data.products);
-        });
+        const loadMoreBtn = document.getElementById('load-more-btn');
+        if (loadMoreBtn) {
+            loadMoreBtn.addEventListener('click', (e) => { e.preventDefault(); AdminManager.loadNextPage(); });
+        }
+        AdminManager.loadNextPage();
     }
 
     // --- Sliders for Homepage ---
@@ -0,0 +1,205 @@
+# storage.py
+# Storage backends behind db.get_db. DB_BACKEND picks one:
+#
+#   mysql   (default) mysql.connector connections to DB_HOST/DB_NAME
+#   sqlite  an embedded database file at SQLITE_PATH, for development and
+#           small branch stores where a MySQL server is pure overhead
+#
+# The DAOs are written in MySQL's dialect. SQLite connections translate each
+# statement once (placeholders, INSERT IGNORE, ON DUPLICATE KEY UPDATE,
+# FOR UPDATE) and let sqlite3's per-connection statement cache reuse the
+# compiled statement on every later call. The database runs in WAL mode, so
+# readers never wait for the single writer.
+#
+# MySQL-only features stay MySQL-only: SEARCH_BACKEND=mysql (FULLTEXT),
+# explain_check.py and the aiomysql-based async_api.
+#
+#   python storage.py import-legacy [instance/grocery_store.db]
+#
+# copies the users, products and orders of the old SQLAlchemy demo database
+# into the SQLite store.
+import functools
+import os
+import re
+import sqlite3
+import sys
+from datetime import datetime
+from decimal import Decimal
+
+try:
+    import mysql.connector
+except ImportError:  # only needed for DB_BACKEND=mysql
+    mysql = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_BACKEND = os.getenv('DB_BACKEND', 'mysql')
+SQLITE_PATH = os.getenv('SQLITE_PATH', os.path.join(BASE_DIR, 'instance', 'store.sqlite3'))
+SQLITE_STATEMENT_CACHE = int(os.getenv('SQLITE_STATEMENT_CACHE', 256))
+SQLITE_BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', 5))  # seconds a writer waits for the lock
+LEGACY_SQLITE_PATH = os.path.join(BASE_DIR, 'instance', 'grocery_store.db')
+
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_adapter(Decimal, float)
+for _type in ('DATETIME', 'TIMESTAMP'):
+    sqlite3.register_converter(_type, lambda raw: datetime.fromisoformat(raw.decode()))
+# DECIMAL columns have REAL affinity in SQLite, so sums of money pick up binary
+# noise (6.6000000000000005). Every DECIMAL column here has two decimal places;
+# reading them back rounded to that gives the Decimal mysql.connector returns.
+CENTS = Decimal('0.01')
+sqlite3.register_converter('DECIMAL', lambda raw: Decimal(raw.decode()).quantize(CENTS))
+
+def dialect(db):
+    """'sqlite' or 'mysql' for a connection handed out by get_db or the pool."""
+    return getattr(db, 'dialect', 'mysql')
+
+_UPSERT_RE = re.compile(r'\bON\s+DUPLICATE\s+KEY\s+UPDATE\b', re.IGNORECASE)
+_VALUES_FN_RE = re.compile(r'\bVALUES\((\w+)\)', re.IGNORECASE)
+_INSERT_IGNORE_RE = re.compile(r'\bINSERT\s+IGNORE\b', re.IGNORECASE)
+_FOR_UPDATE_RE = re.compile(r'\s+FOR\s+UPDATE(\s+SKIP\s+LOCKED)?\b', re.IGNORECASE)
+
+@functools.lru_cache(maxsize=1024)
+def translate(sql):
+    """Rewrite a MySQL-dialect DAO statement for SQLite."""
+    sql = sql.replace('%s', '?')
+    sql = _INSERT_IGNORE_RE.sub('INSERT OR IGNORE', sql)
+    # SQLite has no row locks; SQLiteCursor takes the database write lock instead.
+    sql = _FOR_UPDATE_RE.sub('', sql)
+    match = _UPSERT_RE.search(sql)
+    if match:
+        # SQLite 3.35+ accepts a conflict target-less DO UPDATE on any unique key.
+        update = _VALUES_FN_RE.sub(r'excluded.\1', sql[match.end():])
+        sql = sql[:match.start()] + 'ON CONFLICT DO UPDATE SET' + update
+    return sql
+
+@functools.lru_cache(maxsize=1024)
+def _locks_rows(sql):
+    return _FOR_UPDATE_RE.search(sql) is not None
+
+def _dict_row(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+class SQLiteCursor:
+    """sqlite3 cursor with mysql.connector's calling conventions."""
+
+    def __init__(self, cursor, dictionary=False):
+        self._cursor = cursor
+        if dictionary:
+            cursor.row_factory = _dict_row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, sql, params=None):
+        if _locks_rows(sql) and not self._cursor.connection.in_transaction:
+            # sqlite3 only opens its transaction before an INSERT/UPDATE/DELETE, so a
+            # SELECT ... FOR UPDATE would read outside it and two workers could act on
+            # the same rows. Taking the write lock first makes the read exclusive.
+            self._cursor.execute("BEGIN IMMEDIATE")
+        self._cursor.execute(translate(sql), params or ())
+        return None
+
+    def executemany(self, sql, seq_params):
+        self._cursor.executemany(translate(sql), seq_params)
+        return None
+
+class SQLiteConnection:
+    """An sqlite3 connection that the pool and the DAOs can use like a MySQL one."""
+
+    dialect = 'sqlite'
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(
+            path, timeout=SQLITE_BUSY_TIMEOUT, detect_types=sqlite3.PARSE_DECLTYPES,
+            cached_statements=SQLITE_STATEMENT_CACHE, check_same_thread=False,
+            # Writes take the database lock up front instead of upgrading a read lock,
+            # which could fail with "database is locked" under concurrent checkouts.
+            isolation_level='IMMEDIATE',
+        )
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")  # durable at each WAL checkpoint
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._open = True
+
+    def cursor(self, dictionary=False, **kwargs):
+        return SQLiteCursor(self._conn.cursor(), dictionary)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._open = False
+        self._conn.close()
+
+    def is_connected(self):
+        return self._open
+
+    def ping(self, reconnect=False):
+        self._conn.execute("SELECT 1")
+
+def create_connector(kind, mysql_config=None):
+    """Zero-argument callable that opens a connection for DB_BACKEND kind."""
+    if kind == 'sqlite':
+        os.makedirs(os.path.dirname(SQLITE_PATH) or '.', exist_ok=True)
+        return lambda: SQLiteConnection(SQLITE_PATH)
+    if kind == 'mysql':
+        if mysql is None:
+            raise RuntimeError("DB_BACKEND=mysql requires the mysql-connector-python package")
+        return lambda: mysql.connector.connect(**mysql_config)
+    raise ValueError(f"Unknown DB_BACKEND '{kind}'")
+
+def import_legacy(source=LEGACY_SQLITE_PATH, target=SQLITE_PATH):
+    """Copy users, products (with their images) and orders from the old demo database.
+
+    Rows keep their ids; rows already present in the target are left alone.
+    Returns {table: rows copied}.
+    """
+    from migrations import migrate
+
+    db = SQLiteConnection(target)
+    migrate(db)
+    legacy = sqlite3.connect(source)
+    copied = {}
+    try:
+        cursor = db.cursor()
+        users = legacy.execute("SELECT id, username, email, password_hash, created_at FROM user").fetchall()
+        cursor.executemany("""
+            INSERT IGNORE INTO users (user_id, name, email, password, role, created_at)
+            VALUES (%s, %s, %s, %s, 'customer', %s)
+        """, users)
+        copied['users'] = cursor.rowcount
+
+        products = legacy.execute(
+            "SELECT id, name, description, price, COALESCE(stock_quantity, 0), image_url FROM product").fetchall()
+        cursor.executemany("""
+            INSERT IGNORE INTO products (product_id, name, description, price, stock) VALUES (%s, %s, %s, %s, %s)
+        """, [row[:5] for row in products])
+        copied['products'] = cursor.rowcount
+        # '/static/images/x.jpg' -> 'images/x.jpg', the path form product_media keeps
+        cursor.executemany("INSERT IGNORE INTO product_media (product_id, image_path) VALUES (%s, %s)",
+                           [(row[0], row[5].split('/static/', 1)[-1].lstrip('/')) for row in products if row[5]])
+
+        orders = legacy.execute(
+            'SELECT id, user_id, total_amount, COALESCE(status, \'pending\'), created_at FROM "order" '
+            'WHERE user_id IS NOT NULL').fetchall()
+        cursor.executemany("""
+            INSERT IGNORE INTO orders (order_id, user_id, total_amount, delivery_address, status, order_date)
+            VALUES (%s, %s, %s, '', %s, %s)
+        """, [row[:4] + (row[4] or datetime.now(),) for row in orders])
+        copied['orders'] = cursor.rowcount
+        db.commit()
+    finally:
+        legacy.close()
+        db.close()
+    return copied
+
+if __name__ == '__main__':
+    if sys.argv[1:2] != ['import-legacy']:
+        sys.exit("usage: python storage.py import-legacy [source.db]")
+    counts = import_legacy(*sys.argv[2:3])
+    print(f"Imported into {SQLITE_PATH}: " + ", ".join(f"{n} {table}" for table, n in counts.items()))
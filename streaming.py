@@ -0,0 +1,60 @@
+# streaming.py
+# Streaming responses for list endpoints whose results can be large. A DAO
+# executes its query and hands back fetch_chunks(cursor): rows then arrive
+# STREAM_FETCH_SIZE at a time (mysql.connector's default unbuffered cursor
+# leaves the rest of the result on the socket) and each chunk is encoded and
+# sent before the next is read. Peak memory per response is one chunk, however
+# many rows the query returns.
+#
+# Formats:  json    {"<key>": [row, row, ...]}, the same shape jsonify gives
+#           ndjson  one JSON row per line
+import os
+
+from flask import current_app, stream_with_context
+
+from db import get_db
+from metrics import unwrap
+
+STREAM_FETCH_SIZE = int(os.getenv('STREAM_FETCH_SIZE', 500))
+STREAM_MIMETYPES = {'json': 'application/json', 'ndjson': 'application/x-ndjson'}
+
+def fetch_chunks(cursor, size=STREAM_FETCH_SIZE):
+    """Yield lists of up to size rows from an executed cursor, closing it at the end.
+
+    While the generator is open no other statement can run on the request's
+    connection, so callers load anything else they need before executing.
+    """
+    finished = False
+    try:
+        while True:
+            rows = cursor.fetchmany(size)
+            if not rows:
+                finished = True
+                return
+            yield rows
+    finally:
+        if not finished:
+            # The client went away mid-stream; MySQL will not take the next
+            # statement on this connection until the unread rows are read off.
+            consume = getattr(unwrap(get_db()), 'consume_results', None)
+            if consume is not None:
+                consume()
+        cursor.close()
+
+def _json_body(chunks, key, dumps):
+    yield f'{{"{key}": ['
+    separator = ''
+    for rows in chunks:
+        yield separator + ', '.join(dumps(row) for row in rows)
+        separator = ', '
+    yield ']}\n'
+
+def _ndjson_body(chunks, dumps):
+    for rows in chunks:
+        yield ''.join(dumps(row) + '\n' for row in rows)
+
+def stream_response(chunks, fmt, key):
+    """A streamed response encoding row chunks as fmt ('json' or 'ndjson')."""
+    dumps = current_app.json.dumps  # encodes Decimal and datetime exactly as jsonify does
+    body = _json_body(chunks, key, dumps) if fmt == 'json' else _ndjson_body(chunks, dumps)
+    return current_app.response_class(stream_with_context(body), mimetype=STREAM_MIMETYPES[fmt])
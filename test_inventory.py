@@ -0,0 +1,194 @@
+# test_inventory.py
+# Stock, cart and checkout behaviour against an SQLite database in a temporary
+# file, so no MySQL server is needed:
+#
+#   python -m pytest test_inventory.py      (or: python -m unittest test_inventory)
+import os
+import tempfile
+import unittest
+
+# storage.py and cart_dao.py read these at import time.
+_tmp = tempfile.mkdtemp()
+os.environ['DB_BACKEND'] = 'sqlite'
+os.environ['SQLITE_PATH'] = os.path.join(_tmp, 'store.sqlite3')
+os.environ['CART_BACKEND'] = 'mysql'
+
+from flask import Flask
+
+import cart_dao
+import inventory_dao
+import order_dao
+from cart_store import MemoryCartStore, WriteBehindCart
+from db import get_db, close_db
+from inventory_dao import OutOfStock
+from migrations import migrate
+
+app = Flask(__name__)
+
+def setUpModule():
+    with app.app_context():
+        migrate(get_db())
+        close_db()
+
+class InventoryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        self.db = get_db()
+        cursor = self.db.cursor()
+        cursor.execute("INSERT INTO users (name, email, password) VALUES (%s, %s, 'x')",
+                       ('tester', f"tester-{id(self)}@example.com"))
+        self.user_id = cursor.lastrowid
+        self.db.commit()
+        cursor.close()
+
+    def tearDown(self):
+        close_db()
+        self.ctx.pop()
+
+    def add_product(self, stock, price=10):
+        cursor = self.db.cursor()
+        cursor.execute("INSERT INTO products (name, price, stock) VALUES (%s, %s, %s)", ('item', price, stock))
+        product_id = cursor.lastrowid
+        self.db.commit()
+        cursor.close()
+        return product_id
+
+    def put_in_cart(self, product_id, quantity):
+        # Straight into the table, so invalid quantities can be planted.
+        cursor = self.db.cursor()
+        cursor.execute("INSERT INTO cart (user_id, product_id, quantity) VALUES (%s, %s, %s)",
+                       (self.user_id, product_id, quantity))
+        self.db.commit()
+        cursor.close()
+
+    def scalar(self, query, params=()):
+        cursor = self.db.cursor()
+        cursor.execute(query, params)
+        value = cursor.fetchone()[0]
+        cursor.close()
+        self.db.rollback()
+        return value
+
+    def stock(self, product_id):
+        return self.scalar("SELECT stock FROM products WHERE product_id = %s", (product_id,))
+
+    def holds(self):
+        return self.scalar("SELECT COUNT(*) FROM stock_reservations WHERE user_id = %s", (self.user_id,))
+
+    def orders(self):
+        return self.scalar("SELECT COUNT(*) FROM orders WHERE user_id = %s", (self.user_id,))
+
+    def cart_lines(self):
+        return self.scalar("SELECT COUNT(*) FROM cart WHERE user_id = %s", (self.user_id,))
+
+class MergeItemsTests(unittest.TestCase):
+
+    def test_sums_per_product_in_id_order(self):
+        self.assertEqual(inventory_dao.merge_items([(2, 1), (1, 2), (2, 3)]), [(1, 2), (2, 4)])
+
+    def test_rejects_quantity_below_one(self):
+        for quantity in (0, -1, 1.5, True):
+            with self.assertRaises(ValueError):
+                inventory_dao.merge_items([(1, 1), (2, quantity)])
+
+class HoldStockTests(InventoryTestCase):
+
+    def test_out_of_stock_line_leaves_stock_unchanged(self):
+        plenty, scarce = self.add_product(5), self.add_product(1)
+        with self.assertRaises(OutOfStock) as raised:
+            inventory_dao.hold_stock(self.user_id, [(plenty, 2), (scarce, 3)])
+        self.assertEqual(raised.exception.product_id, scarce)
+        self.assertEqual((self.stock(plenty), self.stock(scarce)), (5, 1))
+        self.assertEqual(self.holds(), 0)
+
+    def test_quantity_below_one_is_rejected_before_stock_moves(self):
+        first, second = self.add_product(10), self.add_product(10)
+        with self.assertRaises(ValueError):
+            inventory_dao.hold_stock(self.user_id, [(first, 3), (second, -49)])
+        self.assertEqual((self.stock(first), self.stock(second)), (10, 10))
+        self.assertEqual(self.holds(), 0)
+
+    def test_new_hold_replaces_the_old_one(self):
+        product_id = self.add_product(10)
+        self.assertTrue(inventory_dao.hold_stock(self.user_id, [(product_id, 4)]))
+        self.assertTrue(inventory_dao.hold_stock(self.user_id, [(product_id, 1)]))
+        self.assertEqual(self.stock(product_id), 9)
+        self.assertEqual(self.holds(), 1)
+
+    def test_expired_hold_returns_its_stock(self):
+        product_id = self.add_product(10)
+        inventory_dao.hold_stock(self.user_id, [(product_id, 4)], ttl=-1)
+        self.assertEqual(self.stock(product_id), 6)
+        self.assertGreaterEqual(inventory_dao.release_expired_reservations(), 1)
+        self.assertEqual(self.stock(product_id), 10)
+        self.assertEqual(self.holds(), 0)
+
+    def test_live_hold_is_not_released(self):
+        product_id = self.add_product(10)
+        inventory_dao.hold_stock(self.user_id, [(product_id, 4)])
+        inventory_dao.release_expired_reservations()
+        self.assertEqual(self.stock(product_id), 6)
+        self.assertEqual(self.holds(), 1)
+
+class CheckoutTests(InventoryTestCase):
+
+    def test_checkout_takes_stock_and_clears_the_cart(self):
+        product_id = self.add_product(10)
+        self.put_in_cart(product_id, 3)
+        order_id, total, _ = order_dao.checkout(self.user_id, 'Main St', 'card')
+        self.assertIsNotNone(order_id)
+        self.assertEqual(total, 30)
+        self.assertEqual(self.stock(product_id), 7)
+        self.assertEqual(self.cart_lines(), 0)
+
+    def test_checkout_uses_the_held_stock(self):
+        product_id = self.add_product(10)
+        inventory_dao.hold_stock(self.user_id, [(product_id, 3)])
+        self.put_in_cart(product_id, 3)
+        order_dao.checkout(self.user_id, 'Main St', 'card')
+        self.assertEqual(self.stock(product_id), 7)
+        self.assertEqual(self.holds(), 0)
+
+    def test_out_of_stock_checkout_rolls_back(self):
+        plenty, scarce = self.add_product(5), self.add_product(1)
+        self.put_in_cart(plenty, 2)
+        self.put_in_cart(scarce, 3)
+        with self.assertRaises(OutOfStock):
+            order_dao.checkout(self.user_id, 'Main St', 'card')
+        self.assertEqual((self.stock(plenty), self.stock(scarce)), (5, 1))
+        self.assertEqual(self.orders(), 0)
+        self.assertEqual(self.cart_lines(), 2)
+
+    def test_negative_cart_line_is_rejected(self):
+        first, second = self.add_product(10), self.add_product(10)
+        self.put_in_cart(first, 3)
+        self.put_in_cart(second, -49)
+        with self.assertRaises(ValueError):
+            order_dao.checkout(self.user_id, 'Main St', 'card')
+        self.assertEqual((self.stock(first), self.stock(second)), (10, 10))
+        self.assertEqual(self.orders(), 0)
+
+class WriteBehindTests(InventoryTestCase):
+
+    def test_flush_writes_dirty_carts(self):
+        first, second = self.add_product(10), self.add_product(10)
+        self.put_in_cart(first, 1)
+        cart = WriteBehindCart(MemoryCartStore(), cart_dao._load_cart, cart_dao._persist_carts, flush_interval=3600)
+        cart.add(self.user_id, [(first, 2), (second, 1)])
+        self.assertEqual(cart.items(self.user_id), {first: 3, second: 1})
+        self.assertEqual(cart.flush(), 1)
+        self.assertEqual(self.scalar("SELECT quantity FROM cart WHERE user_id = %s AND product_id = %s",
+                                     (self.user_id, first)), 3)
+        self.assertEqual(self.cart_lines(), 2)
+
+    def test_rejects_quantity_below_one(self):
+        product_id = self.add_product(10)
+        cart = WriteBehindCart(MemoryCartStore(), cart_dao._load_cart, cart_dao._persist_carts, flush_interval=3600)
+        with self.assertRaises(ValueError):
+            cart.add(self.user_id, [(product_id, 0)])
+        self.assertEqual(cart.flush(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,18 +1,35 @@
+import os
 from db import get_db
-from werkzeug.security import generate_password_hash, check_password_hash
+from metrics import timed
+from cache import TTLCache
+from password_hasher import hash_password, verify_password, needs_rehash, HashQueueFull, HashTimeout
 
+# Users looked up on every authenticated request. Writes below invalidate their
+# entry; other worker processes pick the change up within USER_CACHE_TTL seconds.
+user_cache = TTLCache(
+    maxsize=int(os.getenv('USER_CACHE_SIZE', 10000)),
+    ttl=int(os.getenv('USER_CACHE_TTL', 60)),
+)
+
+# Shared with async_api, which runs the same lookups on aiomysql.
+SELECT_LOGIN_USER = "SELECT user_id, name, password, role, auth_version FROM users WHERE email = %s AND is_active"
+SELECT_USER = "SELECT user_id, name, email, role, is_active, auth_version FROM users WHERE user_id = %s"
+SELECT_USER_ID_BY_EMAIL = "SELECT user_id FROM users WHERE email = %s"
+UPDATE_USER_ROLE = "UPDATE users SET role = %s WHERE user_id = %s"
+
+@timed
 def register_user(username, email, password):
     """Register a new user in the database."""
     db = get_db()
     cursor = db.cursor()
     try:
         # Check if email already exists
-        cursor.execute("SELECT user_id FROM users WHERE email = %s", (email,))
+        cursor.execute(SELECT_USER_ID_BY_EMAIL, (email,))
         if cursor.fetchone():
             return False  # Email already exists
         
         # Hash the password
-        hashed_password = generate_password_hash(password)
+        hashed_password = hash_password(password)
         
         # Corrected SQL query to use 'name' instead of 'username'
         cursor.execute("""
@@ -23,6 +40,9 @@ def register_user(username, email, password):
         db.commit()
         return True
         
+    except (HashQueueFull, HashTimeout):
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         print(f"Error registering user: {e}")
@@ -30,41 +50,88 @@ def register_user(username, email, password):
     finally:
         cursor.close()
 
+@timed
 def login_user(email, password):
     """Authenticate user login."""
     db = get_db()
     cursor = db.cursor()
     try:
-        # Corrected SQL query to select 'name' instead of 'username'
-        cursor.execute("""
-            SELECT user_id, name, password, role 
-            FROM users WHERE email = %s
-        """, (email,))
+        cursor.execute(SELECT_LOGIN_USER, (email,))
         user = cursor.fetchone()
         
-        if user and check_password_hash(user[2], password):
+        if user and verify_password(user[2], password):
+            if needs_rehash(user[2]):
+                # Hash settings changed since this password was stored; upgrade it now
+                # while we have the plain password. A failure here must not fail the login.
+                try:
+                    cursor.execute("UPDATE users SET password = %s WHERE user_id = %s",
+                                   (hash_password(password), user[0]))
+                    db.commit()
+                except Exception as e:
+                    db.rollback()
+                    print(f"Error rehashing password: {e}")
             return (user[0], user[1], user[3])  # user_id, name, role
         return None
         
+    except (HashQueueFull, HashTimeout):
+        raise
     except Exception as e:
         print(f"Error during login: {e}")
         return None
     finally:
         cursor.close()
 
+@timed
 def get_user_by_id(user_id):
     """Get user details by ID."""
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
     db = get_db()
     cursor = db.cursor(dictionary=True)
     try:
-        cursor.execute("""
-            SELECT user_id, name, email, role 
-            FROM users WHERE user_id = %s
-        """, (user_id,))
-        return cursor.fetchone()
+        cursor.execute(SELECT_USER, (user_id,))
+        user = cursor.fetchone()
+        if user:
+            user_cache.set(user_id, user)
+        return user
         
     except Exception as e:
         print(f"Error getting user: {e}")
         return None
     finally:
-        cursor.close()
\ No newline at end of file
+        cursor.close()
+
+def _update_user(user_id, query, params):
+    db = get_db()
+    cursor = db.cursor()
+    try:
+        cursor.execute(query, params)
+        db.commit()
+        user_cache.pop(user_id)
+        return cursor.rowcount > 0
+    except Exception as e:
+        db.rollback()
+        print(f"Error updating user: {e}")
+        return False
+    finally:
+        cursor.close()
+
+@timed
+def update_user_role(user_id, role):
+    """Change a user's role; takes effect on their next request."""
+    return _update_user(user_id, UPDATE_USER_ROLE, (role, user_id))
+
+@timed
+def set_user_active(user_id, is_active):
+    """Enable or disable an account; a disabled user is logged out on their next request."""
+    return _update_user(user_id, "UPDATE users SET is_active = %s WHERE user_id = %s", (is_active, user_id))
+
+@timed
+def change_password(user_id, new_password):
+    """Set a new password, which also ends the user's other sessions.
+
+    Bumping auth_version is what ends them; the rehash in login_user leaves it alone.
+    """
+    return _update_user(user_id, "UPDATE users SET password = %s, auth_version = auth_version + 1 WHERE user_id = %s",
+                        (hash_password(new_password), user_id))